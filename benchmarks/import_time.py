@@ -0,0 +1,86 @@
+"""
+Checks the import time budget of the CLI.
+
+Runs ``python -X importtime -m pit --help`` in a fresh interpreter, sums up
+the cumulative import time of the pit package and fails if it exceeds the
+budget or if any of the heavy dependencies were imported.
+
+Usage:
+    python benchmarks/import_time.py [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+#: Modules that must not be imported to print the help of the CLI.
+HEAVY_MODULES = ('duckdb', 'pandas', 'pyarrow', 'numpy')
+
+#: Matches a line of the ``-X importtime`` output.
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def measure(args: list[str]) -> tuple[float, set[str]]:
+    """
+    Import pit in a fresh interpreter
+    :param args: arguments passed to ``python -m pit``
+    :type args: list[str]
+    :return: cumulative import time of pit in milliseconds and the names of
+             all imported top level modules
+    :rtype: tuple[float, set[str]]
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.join(os.path.dirname(__file__), '..', 'src'), env.get('PYTHONPATH', '')])
+
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'pit', *args],
+        env=env, capture_output=True, text=True)
+
+    cumulative: float = 0.0
+    modules: set[str] = set()
+
+    for line in res.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+
+        name: str = match.group(4)
+        modules.add(name.split('.')[0])
+
+        # Only count the top level import of the package
+        if name == 'pit' or (name.startswith('pit.') and len(match.group(3)) == 1):
+            cumulative += int(match.group(2)) / 1000
+
+    return cumulative, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the import time budget of pit")
+    parser.add_argument('--budget-ms', type=float, default=150.0,
+                        help="maximum cumulative import time of pit in milliseconds")
+    parser.add_argument('--runs', type=int, default=5,
+                        help="number of runs, the fastest one is compared to the budget")
+    options = parser.parse_args()
+
+    # Take the fastest run to reduce the noise of a busy machine
+    results = [measure(['--help']) for _ in range(options.runs)]
+    fastest: float = min(cumulative for cumulative, _ in results)
+    heavy: set[str] = set(HEAVY_MODULES) & set().union(*[modules for _, modules in results])
+
+    print(f"import pit: {fastest:.1f} ms (budget {options.budget_ms:.1f} ms)")
+
+    if heavy:
+        print(f"FAIL: heavy modules imported: {', '.join(sorted(heavy))}")
+        return 1
+    if fastest > options.budget_ms:
+        print("FAIL: import time exceeds the budget")
+        return 1
+
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
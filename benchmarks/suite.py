@@ -0,0 +1,389 @@
+"""
+Benchmarks dump, retrieve and search across data sizes and file layouts.
+
+Generates synthetic datasets with DuckDB, then runs every case in a fresh
+interpreter, so each case reports its cold start, its warm runs and its
+own peak memory. The Python API cases call File and Database directly,
+the CLI cases run ``python -m pit``. The results are written as json and
+can be compared against an earlier run to catch regressions.
+
+Usage:
+    python benchmarks/suite.py --sizes 1000,100000,1000000 --output results.json
+    python benchmarks/suite.py --baseline results.json --threshold 0.2
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+#: Source directory of the package, used instead of an installed version.
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+#: Number of files of the ``many`` layout.
+MANY_FILES = 64
+
+#: Number of extra columns of the ``wide`` schema.
+WIDE_COLUMNS = 48
+
+#: Python API cases, see :func:`run_case`.
+API_CASES = ('dump', 'retrieve', 'retrieve_ndjson', 'search', 'database_materialize', 'database_search')
+
+#: CLI cases, see :func:`cli_command`.
+CLI_CASES = ('cli_help', 'cli_retrieve_ndjson', 'cli_search')
+
+#: Cases that build json documents in memory and are skipped for large sizes.
+JSON_CASES = ('dump', 'retrieve')
+
+
+def select(rows: int, schema: str, start: int = 0) -> str:
+    """
+    Build the query of a synthetic dataset
+    :param rows: number of rows
+    :type rows: int
+    :param schema: ``narrow`` or ``wide``
+    :type schema: str
+    :param start: first id
+    :type start: int
+    :return: query
+    :rtype: str
+    """
+    columns: list[str] = [
+        'range AS id',
+        "'key' || (range % 1000) AS key",
+        'hash(range) % 100000 / 100.0 AS value',
+    ]
+
+    # Mix integers, doubles and strings in the extra columns of wide schemas
+    if schema == 'wide':
+        for i in range(WIDE_COLUMNS):
+            columns.append([
+                f'(range * {i + 7}) % 65536 AS int_{i}',
+                f'hash(range + {i}) % 1000000 / 1000.0 AS double_{i}',
+                f"'text' || ((range + {i}) % 5000) AS text_{i}",
+            ][i % 3])
+
+    return f"SELECT {', '.join(columns)} FROM range({start}, {start + rows})"
+
+
+def generate(workdir: str, rows: int, layout: str, schema: str) -> dict:
+    """
+    Generate a dataset and the newline delimited json its dump reads,
+    unless they already exist
+    :param workdir: directory of the generated data
+    :type workdir: str
+    :param rows: number of rows
+    :type rows: int
+    :param layout: ``single`` file or ``many`` files in a dataset directory
+    :type layout: str
+    :param schema: ``narrow`` or ``wide``
+    :type schema: str
+    :return: paths of the parquet data and the json data
+    :rtype: dict
+    """
+    import duckdb
+
+    name: str = f"{schema}-{rows}"
+    parquet: str = os.path.join(workdir, f"{name}-{layout}" + ('.parquet' if layout == 'single' else ''))
+    ndjson: str = os.path.join(workdir, f"{name}.ndjson")
+
+    with duckdb.connect() as connection:
+        if not os.path.exists(parquet):
+            if layout == 'single':
+                connection.execute(f"COPY ({select(rows, schema)}) TO '{parquet}' (FORMAT PARQUET)")
+            else:
+                # Split the ids into consecutive ranges, one file per range
+                os.makedirs(parquet)
+                files: int = min(MANY_FILES, rows)
+                for i in range(files):
+                    start, end = rows * i // files, rows * (i + 1) // files
+                    connection.execute(
+                        f"COPY ({select(end - start, schema, start)}) "
+                        f"TO '{os.path.join(parquet, f'part-{i:04d}.parquet')}' (FORMAT PARQUET)")
+
+        if not os.path.exists(ndjson):
+            connection.execute(f"COPY ({select(rows, schema)}) TO '{ndjson}' (FORMAT JSON)")
+
+    return {'parquet': parquet, 'ndjson': ndjson}
+
+
+def run_case(case: str, data: dict, rows: int, workdir: str) -> None:
+    """
+    Run a Python API case once
+    :param case: name of the case
+    :type case: str
+    :param data: paths of the parquet data and the json data
+    :type data: dict
+    :param rows: number of rows of the data
+    :type rows: int
+    :param workdir: directory for the outputs of the case
+    :type workdir: str
+    """
+    from pit import output
+    from pit.database import Database
+    from pit.file import File
+
+    column_value_pairs: dict[str, str] = {'id': str(rows // 2)}
+
+    if case == 'dump':
+        File.dump(os.path.join(workdir, 'dump.parquet'), data['ndjson'], json_format='newline_delimited')
+    elif case == 'retrieve':
+        File.retrieve([data['parquet']])
+    elif case == 'retrieve_ndjson':
+        with open(os.devnull, 'w') as devnull:
+            output.write(File.reader([data['parquet']], as_json=True), 'ndjson', devnull)
+    elif case == 'search':
+        File.search([data['parquet']], column_value_pairs)
+    elif case in ('database_materialize', 'database_search'):
+        database = Database(os.path.join(workdir, 'bench.duckdb'))
+        try:
+            if case == 'database_materialize' or not database.exists(database.cursor, 'bench'):
+                database.materialize('bench', [data['parquet']])
+            if case == 'database_search':
+                database.search('bench', column_value_pairs)
+        finally:
+            database.close_connection()
+    else:
+        raise ValueError(f"Invalid case. Case {case} does not exist")
+
+
+def worker(spec: dict) -> None:
+    """
+    Run a Python API case repeatedly in this interpreter and print the
+    timings as json. The first run is the cold one.
+    :param spec: case, data, rows, repeat and workdir
+    :type spec: dict
+    """
+    import resource
+
+    started: float = time.perf_counter()
+    import pit.file  # noqa: F401
+    import pit.database  # noqa: F401
+    imported: float = time.perf_counter() - started
+
+    timings: list[float] = []
+    for _ in range(spec['repeat']):
+        start = time.perf_counter()
+        run_case(spec['case'], spec['data'], spec['rows'], spec['workdir'])
+        timings.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        'import_s': imported,
+        'timings_s': timings,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def spawn(command: list[str], env: dict) -> tuple[float, float, str]:
+    """
+    Run a command and measure it
+    :param command: command to run
+    :type command: list[str]
+    :param env: environment of the command
+    :type env: dict
+    :return: wall time in seconds, peak memory of the process in MiB and
+             its stdout
+    :rtype: tuple[float, float, str]
+    """
+    start: float = time.perf_counter()
+
+    with tempfile.TemporaryFile() as stdout:
+        process = subprocess.Popen(command, env=env, stdout=stdout)
+
+        # Wait for this child only, so its peak memory is not mixed with others
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        wall: float = time.perf_counter() - start
+
+        stdout.seek(0)
+        out: str = stdout.read().decode()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed with exit code {process.returncode}")
+
+    return wall, usage.ru_maxrss / 1024, out
+
+
+def cli_command(case: str, data: dict, rows: int) -> list[str]:
+    """
+    Build the arguments of a CLI case
+    :param case: name of the case
+    :type case: str
+    :param data: paths of the parquet data and the json data
+    :type data: dict
+    :param rows: number of rows of the data
+    :type rows: int
+    :return: arguments of ``python -m pit``
+    :rtype: list[str]
+    """
+    return {
+        'cli_help': ['--help'],
+        'cli_retrieve_ndjson': ['retrieve', data['parquet'], '--format', 'ndjson', '--output', os.devnull],
+        'cli_search': ['search', data['parquet'], '--column_value_pairs', f"id={rows // 2}", '--output', os.devnull],
+    }[case]
+
+
+def benchmark(options: argparse.Namespace) -> list[dict]:
+    """
+    Run all cases on all datasets
+    :param options: command line options
+    :type options: argparse.Namespace
+    :return: results
+    :rtype: list[dict]
+    """
+    env: dict = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([SRC, env.get('PYTHONPATH', '')])
+
+    # Don't let a running server or the caches answer the CLI cases
+    env.pop('PIT_SERVER', None)
+    env['PIT_CACHE_MAX_BYTES'] = '0'
+
+    results: list[dict] = []
+
+    for rows in options.sizes:
+        for schema in options.schemas:
+            for layout in options.layouts:
+                data: dict = generate(options.workdir, rows, layout, schema)
+                params: dict = {'rows': rows, 'schema': schema, 'layout': layout}
+
+                for case in options.cases:
+                    # Building json documents of huge datasets only measures swapping
+                    if case in JSON_CASES and rows > options.json_max_rows:
+                        continue
+
+                    with tempfile.TemporaryDirectory(dir=options.workdir) as workdir:
+                        if case in CLI_CASES:
+                            runs = [spawn([sys.executable, '-m', 'pit', *cli_command(case, data, rows)], env)
+                                    for _ in range(options.repeat)]
+                            result: dict = {
+                                'name': case, **params,
+                                'cold_s': runs[0][0],
+                                'warm_s': min(run[0] for run in runs),
+                                'mean_s': sum(run[0] for run in runs) / len(runs),
+                                'peak_rss_mb': max(run[1] for run in runs),
+                            }
+                        else:
+                            spec: dict = {'case': case, 'data': data, 'rows': rows,
+                                          'repeat': options.repeat, 'workdir': workdir}
+                            wall, peak, out = spawn(
+                                [sys.executable, __file__, '--worker', json.dumps(spec)], env)
+                            report: dict = json.loads(out)
+                            timings: list[float] = report['timings_s']
+                            result = {
+                                'name': f"api_{case}", **params,
+                                'import_s': report['import_s'],
+                                'process_s': wall,
+                                'cold_s': timings[0],
+                                'warm_s': min(timings[1:] or timings),
+                                'mean_s': sum(timings) / len(timings),
+                                'peak_rss_mb': peak,
+                            }
+
+                    results.append(result)
+                    print(f"{result['name']:<28} {rows:>11} {schema:<6} {layout:<6} "
+                          f"cold {result['cold_s']:8.3f}s  warm {result['warm_s']:8.3f}s  "
+                          f"rss {result['peak_rss_mb']:8.1f} MiB", file=sys.stderr)
+
+    return results
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """
+    Find the cases that got slower or use more memory than in a baseline
+    :param results: results of this run
+    :type results: list[dict]
+    :param baseline: results of an earlier run
+    :type baseline: list[dict]
+    :param threshold: tolerated relative increase, e.g. 0.2 for 20%
+    :type threshold: float
+    :return: descriptions of the regressions
+    :rtype: list[str]
+    """
+    def key(result: dict) -> tuple:
+        return result['name'], result['rows'], result['schema'], result['layout']
+
+    previous: dict[tuple, dict] = {key(result): result for result in baseline}
+    regressions: list[str] = []
+
+    for result in results:
+        before: t.Optional[dict] = previous.get(key(result))
+        if before is None:
+            continue
+
+        for metric in ('warm_s', 'peak_rss_mb'):
+            if before[metric] > 0 and result[metric] > before[metric] * (1 + threshold):
+                regressions.append(
+                    f"{' '.join(map(str, key(result)))}: {metric} {before[metric]:.3f} -> {result[metric]:.3f}")
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark dump, retrieve and search")
+    parser.add_argument('--worker', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=[1000, 100000, 1000000],
+                        help="numbers of rows, e.g. 1000,1000000,100000000")
+    parser.add_argument('--layouts', type=lambda value: value.split(','), default=['single', 'many'],
+                        help="single file and/or many files")
+    parser.add_argument('--schemas', type=lambda value: value.split(','), default=['narrow', 'wide'],
+                        help="narrow and/or wide schema")
+    parser.add_argument('--cases', type=lambda value: value.split(','), default=[*API_CASES, *CLI_CASES],
+                        help="cases to run")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, the first one is cold")
+    parser.add_argument('--json-max-rows', type=int, default=1000000,
+                        help="largest size the json building cases run on")
+    parser.add_argument('--workdir', type=str, default=os.path.join(tempfile.gettempdir(), 'pit-benchmarks'),
+                        help="directory of the generated data, reused between runs")
+    parser.add_argument('--output', type=str, help="file to write the json results to")
+    parser.add_argument('--baseline', type=str, help="results of an earlier run to compare to")
+    parser.add_argument('--threshold', type=float, default=0.2, help="tolerated relative regression")
+    options = parser.parse_args()
+
+    if options.worker:
+        worker(json.loads(options.worker))
+        return 0
+
+    os.makedirs(options.workdir, exist_ok=True)
+
+    import duckdb
+
+    results: dict = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'duckdb': duckdb.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'commit': subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                     cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None,
+        },
+        'results': benchmark(options),
+    }
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    # Fail on regressions against the baseline
+    if options.baseline:
+        with open(options.baseline) as file:
+            regressions = compare(results['results'], json.load(file)['results'], options.threshold)
+
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
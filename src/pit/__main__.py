@@ -5,5 +5,10 @@ from .cli import cli
 
 # Ensure that the script is being run directly
 if __name__ == '__main__':
+    app = Pit(__name__)
+
+    # Load the configuration from PIT_ prefixed environment variables
+    app.config.from_prefixed_env()
+
     # Call the main function and pass the commandline arguments
-    Pit(__name__).main(*argv[1:], **vars(cli()))
+    app.main(*argv[1:], **vars(cli()))
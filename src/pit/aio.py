@@ -0,0 +1,314 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import threading
+import typing as t
+import weakref
+
+from .pool import Checkouts, checkouts
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    import pyarrow as pa
+
+    from .app import Pit
+
+
+class AsyncFile:
+    """
+    Runs the file commands of an application on a bounded thread pool, so
+    that an event loop keeps serving other requests while DuckDB scans.
+
+    At most ``max_concurrency`` commands of an event loop run at once, by
+    default as many as the connection pool hands out cursors, so no worker
+    thread waits for a connection. A command that is cancelled or exceeds
+    its timeout has its queries interrupted and its connections handed back
+    to the pool.
+    """
+
+    def __init__(self, app: "Pit", max_concurrency: t.Optional[int] = None, timeout: t.Optional[float] = None, executor: t.Optional[concurrent.futures.Executor] = None):
+        """
+        Initialize the runner
+        :param app: application whose configuration, pool and caches are used
+        :type app: Pit
+        :param max_concurrency: maximum number of commands running at once,
+                                defaults to the pool size
+        :type max_concurrency: int
+        :param timeout: default seconds a command may run, unlimited if empty
+        :type timeout: float
+        :param executor: executor to run the commands on, a thread pool of
+                         max_concurrency threads by default
+        :type executor: concurrent.futures.Executor
+        """
+        self.app = app
+        self.max_concurrency = max_concurrency or app.config["POOL_MAX_SIZE"]
+        self.timeout = timeout
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix='pit')
+
+        # A semaphore binds to the loop that first waits on it, so every
+        # loop that runs commands gets its own
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """
+        Get the semaphore that bounds the commands of the running loop
+        :return: semaphore
+        :rtype: asyncio.Semaphore
+        """
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            semaphore: t.Optional[asyncio.Semaphore] = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+
+        return semaphore
+
+    def _deadline(self, timeout: t.Optional[float]) -> t.Optional[float]:
+        """
+        Get the loop time a command has to finish by
+        :param timeout: seconds the command may run, the default if empty
+        :type timeout: float
+        :return: loop time, None if unlimited
+        :rtype: float
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        return None if timeout is None else asyncio.get_running_loop().time() + timeout
+
+    @staticmethod
+    def _context() -> tuple[contextvars.Context, Checkouts]:
+        """
+        Create the context a command runs in, which tracks its cursors
+        :return: context and the cursors checked out in it
+        :rtype: tuple[contextvars.Context, Checkouts]
+        """
+        tracked = Checkouts()
+        context = contextvars.copy_context()
+        context.run(checkouts.set, tracked)
+
+        return context, tracked
+
+    async def _call(self, context: contextvars.Context, tracked: Checkouts, function: t.Callable[[], t.Any], deadline: t.Optional[float]) -> t.Any:
+        """
+        Call a function on the executor and wait for its result
+        :param context: context of the command
+        :type context: contextvars.Context
+        :param tracked: cursors checked out by the command
+        :type tracked: Checkouts
+        :param function: function to call
+        :type function: Callable[[], Any]
+        :param deadline: loop time the command has to finish by
+        :type deadline: float
+        :return: result of the function
+        :rtype: Any
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, context.run, function)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future), None if deadline is None else max(deadline - loop.time(), 0))
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # Stop the queries and wait until the thread handed its cursors back
+            tracked.interrupt()
+            with contextlib.suppress(Exception):
+                await future
+            raise
+
+    async def run(self, function: t.Callable[..., t.Any], *args: t.Any, timeout: t.Optional[float] = None, **kwargs: t.Any) -> t.Any:
+        """
+        Run a blocking function on the executor
+        :param function: function to run, e.g. ``File.search``
+        :type function: Callable[..., Any]
+        :param args: positional arguments of the function
+        :type args: Any
+        :param timeout: seconds the function may run once started
+        :type timeout: float
+        :param kwargs: keyword arguments of the function
+        :type kwargs: Any
+        :return: result of the function
+        :rtype: Any
+        """
+        async with self._semaphore():
+            context, tracked = self._context()
+
+            return await self._call(
+                context, tracked, functools.partial(function, *args, **kwargs), self._deadline(timeout))
+
+    async def iterate(self, function: t.Callable[..., "pa.RecordBatchReader"], *args: t.Any, timeout: t.Optional[float] = None, **kwargs: t.Any) -> t.AsyncIterator["pa.RecordBatch"]:
+        """
+        Run a function that returns a record batch reader on the executor
+        and read its batches one at a time, so only one batch is held in
+        memory and the loop is free while the next one is scanned. The
+        connection stays checked out until the iteration ends.
+        :param function: function returning a reader, e.g. ``File.reader``
+        :type function: Callable[..., pa.RecordBatchReader]
+        :param args: positional arguments of the function
+        :type args: Any
+        :param timeout: seconds the whole iteration may take once started
+        :type timeout: float
+        :param kwargs: keyword arguments of the function
+        :type kwargs: Any
+        :return: record batches
+        :rtype: AsyncIterator[pa.RecordBatch]
+        """
+        async with self._semaphore():
+            context, tracked = self._context()
+            deadline: t.Optional[float] = self._deadline(timeout)
+
+            reader = await self._call(context, tracked, functools.partial(function, *args, **kwargs), deadline)
+            batches = iter(reader)
+
+            try:
+                while True:
+                    batch = await self._call(context, tracked, functools.partial(next, batches, None), deadline)
+                    if batch is None:
+                        return
+
+                    yield batch
+            finally:
+                # Hand the connection back, also if the consumer stopped early
+                await asyncio.get_running_loop().run_in_executor(self.executor, context.run, reader.close)
+
+    async def dump(self, path: str, data: str, timeout: t.Optional[float] = None, **kwargs: t.Any) -> t.Any:
+        """
+        Dump json data to a parquet file or dataset, see ``File.dump``
+        :param path: path of the parquet file or dataset
+        :type path: str
+        :param data: path of a json file or a json document
+        :type data: str
+        :param timeout: seconds the dump may run
+        :type timeout: float
+        :return: result of the dump
+        :rtype: Any
+        """
+        return await self.run(
+            lambda: self.app.file_class.dump(path, data, config=self.app.config, pool=self.app.pool, **kwargs),
+            timeout=timeout)
+
+    async def retrieve(self, paths: list[str], timeout: t.Optional[float] = None, **kwargs: t.Any) -> list[dict]:
+        """
+        Load the records of parquet files, see ``File.retrieve``
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param timeout: seconds the command may run
+        :type timeout: float
+        :return: records
+        :rtype: list[dict]
+        """
+        return await self.run(
+            lambda: self.app.file_class.retrieve(
+                paths, config=self.app.config, pool=self.app.pool, cache=self.app.cache, metadata=self.app.metadata, **kwargs),
+            timeout=timeout)
+
+    async def search(self, paths: list[str], column_value_pairs: t.Optional[dict[str, str]] = None, timeout: t.Optional[float] = None, **kwargs: t.Any) -> list[dict]:
+        """
+        Search parquet files, see ``File.search``
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param timeout: seconds the command may run
+        :type timeout: float
+        :return: matching records
+        :rtype: list[dict]
+        """
+        return await self.run(
+            lambda: self.app.file_class.search(
+                paths, column_value_pairs, config=self.app.config, pool=self.app.pool, cache=self.app.cache, metadata=self.app.metadata, **kwargs),
+            timeout=timeout)
+
+    async def batch(self, queries: list[dict], timeout: t.Optional[float] = None, **kwargs: t.Any) -> list[dict]:
+        """
+        Run a batch of searches, see ``File.batch``
+        :param queries: searches with ``id``, ``paths`` and ``column_value_pairs``
+        :type queries: list[dict]
+        :param timeout: seconds the command may run
+        :type timeout: float
+        :return: id and matching records of every search
+        :rtype: list[dict]
+        """
+        return await self.run(
+            lambda: self.app.file_class.batch(
+                queries, config=self.app.config, pool=self.app.pool, metadata=self.app.metadata, **kwargs),
+            timeout=timeout)
+
+    async def aggregate(self, paths: list[str], aggregates: list[str], timeout: t.Optional[float] = None, **kwargs: t.Any) -> list[dict]:
+        """
+        Aggregate the records of parquet files, see ``File.aggregate``
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param aggregates: aggregates such as ``count`` or ``sum(amount)``
+        :type aggregates: list[str]
+        :param timeout: seconds the command may run
+        :type timeout: float
+        :return: a row per group
+        :rtype: list[dict]
+        """
+        return await self.run(
+            lambda: self.app.file_class.aggregate(
+                paths, aggregates, config=self.app.config, pool=self.app.pool, cache=self.app.cache, metadata=self.app.metadata, **kwargs),
+            timeout=timeout)
+
+    async def describe(self, paths: list[str], timeout: t.Optional[float] = None) -> dict:
+        """
+        Describe parquet files from their footers, see ``File.describe``
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param timeout: seconds the command may run
+        :type timeout: float
+        :return: schema, number of rows and the summary of every file
+        :rtype: dict
+        """
+        return await self.run(
+            lambda: self.app.file_class.describe(
+                paths, config=self.app.config, pool=self.app.pool, metadata=self.app.metadata),
+            timeout=timeout)
+
+    def reader(self, paths: list[str], column_value_pairs: t.Optional[dict[str, str]] = None, timeout: t.Optional[float] = None, **kwargs: t.Any) -> t.AsyncIterator["pa.RecordBatch"]:
+        """
+        Stream the matching records of parquet files as record batches, see
+        ``File.reader``
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param timeout: seconds the whole iteration may take
+        :type timeout: float
+        :return: record batches
+        :rtype: AsyncIterator[pa.RecordBatch]
+        """
+        kwargs.setdefault('batch_size', self.app.config["BATCH_SIZE"])
+
+        return self.iterate(
+            lambda: self.app.file_class.reader(
+                paths, column_value_pairs, config=self.app.config, pool=self.app.pool, metadata=self.app.metadata, **kwargs),
+            timeout=timeout)
+
+    def batch_reader(self, queries: list[dict], timeout: t.Optional[float] = None, **kwargs: t.Any) -> t.AsyncIterator["pa.RecordBatch"]:
+        """
+        Stream the results of a batch of searches as json lines, see
+        ``File.batch_reader``
+        :param queries: searches with ``id``, ``paths`` and ``column_value_pairs``
+        :type queries: list[dict]
+        :param timeout: seconds the whole iteration may take
+        :type timeout: float
+        :return: record batches with a single ``record`` column
+        :rtype: AsyncIterator[pa.RecordBatch]
+        """
+        kwargs.setdefault('batch_size', self.app.config["BATCH_SIZE"])
+
+        return self.iterate(
+            lambda: self.app.file_class.batch_reader(
+                queries, config=self.app.config, pool=self.app.pool, metadata=self.app.metadata, **kwargs),
+            timeout=timeout)
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads once the running commands finished
+        """
+        self.executor.shutdown(wait=True)
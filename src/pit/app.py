@@ -1,30 +1,80 @@
-import argparse
-import json
+import contextlib
 import os
-import sys
 import typing as t
-from datetime import timedelta
 
-import duckdb
-import pandas as pd
-
-from .config import Config, ConfigAttribute
+from . import output, profile
+from .config import Config
+from .ingest import read_queries
 from .scaffold import Scaffold
 
+if t.TYPE_CHECKING:  # pragma: no cover
+    from .aio import AsyncFile
+    from .cache import ResultCache
+    from .database import Database
+    from .metadata import MetadataCache
+    from .pool import ConnectionPool
+
 # Help messages
+#: Size of the result cache if ``CACHE_MAX_BYTES`` is not set but the cache
+#: can get hits, because it is persisted or the process is long-lived.
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
 # Make sure to update the help messages if you change the commands
 # or the arguments
 DUMP_COMMAND_HELP = "The dump command takes json data and save it to a "\
-                    "parquet file\n" \
-                    "Usage: python script.py dump path/to/file.parquet data.json"
+                    "parquet file. The data can be a json file, newline "\
+                    "delimited json or - for stdin. With --append the data " \
+                    "is added to a dataset as new part files. The parquet " \
+                    "options come from --write-profile or PIT_WRITE_PROFILE. " \
+                    "Date strings stay strings unless --column-types names " \
+                    "their type\n" \
+                    "Usage: python script.py dump path/to/file.parquet --data data.json"
 RETRIEVE_COMMAND_HELP = "The load command loads a parquet file and returns "\
-                        "the data as json object\n" \
+                        "the data as json object. With --limit only a page " \
+                        "is read, the next token of the page continues with " \
+                        "--page-token\n" \
                         "Usage: python script.py load path/to/file.parquet"
 SEARCH_COMMAND_HELP = "The search command search the specific column and " \
                       "value in the parquet file and returns the data as json " \
-                      "object\n "\
+                      "object. --where takes a predicate with =, !=, <, <=, " \
+                      ">, >=, between, in, like, startswith, is null, and, " \
+                      "or, not and parentheses\n "\
                       "Usage: python script.py search path/to/file.parquet "\
                       "column_name1=value1 column_name2=value2"
+MATERIALIZE_COMMAND_HELP = "The materialize command decodes parquet files " \
+                           "once into a table of the database\n" \
+                           "Usage: python script.py materialize path/to/dataset " \
+                           "--table name --mode database"
+SERVE_COMMAND_HELP = "The serve command keeps connections and caches warm " \
+                     "and runs the commands forwarded by clients with the " \
+                     "PIT_SERVER address set\n" \
+                     "Usage: python script.py serve --bind unix:///tmp/pit.sock"
+COMPACT_COMMAND_HELP = "The compact command merges the small parquet files " \
+                       "of a dataset into files of a target size and swaps " \
+                       "them in atomically\n" \
+                       "Usage: python script.py compact path/to/dataset " \
+                       "--target-size 134217728 --sort-by id"
+DESCRIBE_COMMAND_HELP = "The describe command returns the schema, row counts " \
+                        "and column statistics of parquet files from their " \
+                        "footers, or the schema of a table\n" \
+                        "Usage: python script.py describe path/to/dataset"
+BATCH_COMMAND_HELP = "The batch command runs the searches of a json lines " \
+                     "file, answering the searches over the same paths with " \
+                     "a single scan, and tags every record with the id of " \
+                     "its search\n" \
+                     "Usage: python script.py batch path/to/dataset --queries queries.jsonl"
+AGGREGATE_COMMAND_HELP = "The aggregate command groups the matching records " \
+                         "and returns only the aggregated rows. Counts and " \
+                         "the min/max of integer columns over all records are " \
+                         "answered from the parquet footers\n" \
+                         "Usage: python script.py aggregate path/to/dataset " \
+                         "--aggregates count,sum(amount) --group-by tenant"
+INDEX_COMMAND_HELP = "The index command records the min/max values and a " \
+                     "bloom filter of columns of parquet files, so that " \
+                     "search skips files that can't match. With --key it " \
+                     "records the position of every key, so that search " \
+                     "reads only the row group that holds it\n" \
+                     "Usage: python script.py index path/to/dataset --columns id"
 
 
 class Pit(Scaffold):
@@ -34,6 +84,35 @@ class Pit(Scaffold):
         {
             "ENV": None,
             "DEBUG": None,
+            "POOL_MAX_SIZE": 8,
+            "POOL_IDLE_TIMEOUT": 300,
+            "POOL_TIMEOUT": 30,
+            "ASYNC_MAX_CONCURRENCY": None,
+            "ASYNC_TIMEOUT": None,
+            "BATCH_SIZE": 10000,
+            "THREADS": None,
+            "MEMORY_LIMIT": None,
+            "TEMP_DIRECTORY": None,
+            "PRESERVE_ORDER": None,
+            "JSON_FORMAT": "auto",
+            "JSON_SAMPLE_SIZE": None,
+            "DATABASE_PATH": "pit.duckdb",
+            "SERVER": None,
+            "CACHE_MAX_BYTES": None,
+            "CACHE_PATH": None,
+            "METADATA_MAX_ENTRIES": 10000,
+            "METADATA_TTL": 60,
+            "METADATA_PATH": None,
+            "COMPACT_TARGET_SIZE": 128 * 1024 * 1024,
+            "COMPACT_GRACE": 60,
+            "PROFILE": None,
+            "WRITE_PROFILE": None,
+            "WRITE_PROFILES": {
+                "default": {},
+                "fast": {"compression": "snappy"},
+                "analytics": {"compression": "zstd", "compression_level": 3, "row_group_size": 122880},
+                "archive": {"compression": "zstd", "compression_level": 19, "row_group_size": 1048576},
+            },
         }
     )
 
@@ -67,6 +146,142 @@ class Pit(Scaffold):
         #: .. versionadded:: 0.7
         self.extensions: dict = {}
 
+        #: The connection pool used by the commands. It is created on first
+        #: use so that it picks up configuration loaded after construction.
+        self._pool: t.Optional["ConnectionPool"] = None
+
+        #: The database of the database mode. It is opened on first use and
+        #: kept open, so its tables stay resident between commands.
+        self._database: t.Optional["Database"] = None
+
+        #: The cache of the file command results. It is created on first
+        #: use and disabled if ``CACHE_MAX_BYTES`` is 0. If it is not set,
+        #: the cache is only used where it can get hits: when it is
+        #: persisted to ``CACHE_PATH``, under ``serve`` and the async API.
+        self._cache: t.Optional["ResultCache"] = None
+
+        #: Whether the process serves many commands, see :meth:`serve` and :attr:`aio`.
+        self._long_lived: bool = False
+
+        #: The cache of the parquet footers used to plan the file commands.
+        self._metadata: t.Optional["MetadataCache"] = None
+
+        #: The runner of the async API. It is created on first use, inside
+        #: the event loop that awaits the commands.
+        self._aio: t.Optional["AsyncFile"] = None
+
+        #: The functions called with the profile report of every command,
+        #: so that embedders can forward the metrics to their telemetry.
+        #: Commands are profiled while any hook is registered.
+        #: To register a hook, use the :meth:`profile_hook` decorator.
+        self.profile_hooks: list[t.Callable[[dict], None]] = []
+
+    @property
+    def pool(self) -> "ConnectionPool":
+        """The :class:`ConnectionPool` that hands out the connections of
+        the file commands.
+        """
+        if self._pool is None:
+            self._pool = self.pool_class(
+                self.file_class.connection,
+                max_size=self.config["POOL_MAX_SIZE"],
+                idle_timeout=self.config["POOL_IDLE_TIMEOUT"],
+                timeout=self.config["POOL_TIMEOUT"],
+            )
+
+        return self._pool
+
+    @property
+    def cache(self) -> t.Optional["ResultCache"]:
+        """The :class:`ResultCache` that answers repeated file commands,
+        persisted to ``CACHE_PATH`` if it is set. A one-shot command only
+        pays for the keys of an in-memory cache, so it is off by default
+        unless it is persisted or the process is long-lived.
+        """
+        max_bytes: t.Optional[int] = self.config["CACHE_MAX_BYTES"]
+        if max_bytes is None:
+            max_bytes = DEFAULT_CACHE_MAX_BYTES if self.config["CACHE_PATH"] or self._long_lived else 0
+
+        if self._cache is None and max_bytes:
+            self._cache = self.cache_class(
+                max_bytes=max_bytes,
+                path=self.config["CACHE_PATH"],
+            )
+
+        return self._cache
+
+    @property
+    def metadata(self) -> "MetadataCache":
+        """The :class:`MetadataCache` that keeps the schema and row group
+        statistics of the parquet files, persisted to ``METADATA_PATH``
+        if it is set.
+        """
+        if self._metadata is None:
+            self._metadata = self.metadata_class(
+                max_entries=self.config["METADATA_MAX_ENTRIES"],
+                ttl=self.config["METADATA_TTL"],
+                path=self.config["METADATA_PATH"],
+            )
+
+        return self._metadata
+
+    @property
+    def aio(self) -> "AsyncFile":
+        """The :class:`AsyncFile` that runs the file commands for async
+        callers on at most ``ASYNC_MAX_CONCURRENCY`` threads.
+        """
+        if self._aio is None:
+            self._long_lived = True
+            self._aio = self.async_file_class(
+                self,
+                max_concurrency=self.config["ASYNC_MAX_CONCURRENCY"],
+                timeout=self.config["ASYNC_TIMEOUT"],
+            )
+
+        return self._aio
+
+    @property
+    def database(self) -> "Database":
+        """The :class:`Database` stored at ``DATABASE_PATH`` that serves
+        the database commands.
+        """
+        if self._database is None:
+            self._database = self.database_class(
+                self.config["DATABASE_PATH"], self.config)
+
+        return self._database
+
+    def profile_hook(self, f: t.Callable[[dict], None]) -> t.Callable[[dict], None]:
+        """Register a function that is called with the profile report of
+        every command, see :class:`~pit.profile.Profiler` for its fields.
+        """
+        self.profile_hooks.append(f)
+        return f
+
+    @contextlib.contextmanager
+    def profiling(self, cmd: str, target: t.Optional[t.Union[str, bool]] = None) -> t.Iterator[t.Optional["profile.Profiler"]]:
+        """
+        Profiles the commands run in the block, if a target is given or
+        hooks are registered, and hands the report to the hooks
+        : param cmd: name of the command
+        : type cmd: str
+        : param target: file to write the report to, ``-`` for stderr
+        : type target: str | bool
+        : return: profiler, None if profiling is off
+        : rtype: Iterator[Profiler | None]
+        """
+        # Nothing to report to, or an outer block already profiles
+        if not (target or self.profile_hooks) or profile.current() is not None:
+            yield profile.current()
+            return
+
+        hooks: list[t.Callable[[dict], None]] = list(self.profile_hooks)
+        if target:
+            hooks.append(lambda report: profile.write(report, target))
+
+        with profile.activate(profile.Profiler(cmd, hooks)) as profiler:
+            yield profiler
+
     def main(self, *args: str, **kwargs: str) -> None:
         """
         main function is used to load the parquet file and returns it as json object
@@ -75,11 +290,49 @@ class Pit(Scaffold):
         :return: None
         """
 
-        # Call commands method and pass command and file name
-        res: dict = self.commands(*args[1:], cmd=args[0], **kwargs)
+        # Start the server instead of running a command
+        if args[0] == "serve":
+            self.serve(kwargs.get("bind"))
+            return
+
+        target: t.Optional[t.Union[str, bool]] = kwargs.get("profile") or self.config["PROFILE"]
+
+        # Forward the command to a running server, unless the profile of
+        # this process is requested
+        if self.config["SERVER"] and not target:
+            from . import client
+
+            if client.forward(self.config["SERVER"], args[0], kwargs):
+                return
+
+        with self.profiling(args[0], target):
+            # Call commands method and pass command and file name
+            res: dict = self.commands(*args[1:], cmd=args[0], **kwargs)
 
-        # print the json object
-        print(json.dumps(res))
+            # Write the result in the requested output format
+            with profile.phase('output'):
+                output.write(res, kwargs.get("format") or "json", path=kwargs.get("output"))
+
+    def serve(self, address: t.Optional[str] = None) -> None:
+        """
+        Serve the commands over local HTTP or a unix domain socket until
+        interrupted. The connections and caches stay warm between requests
+        and every request runs on its own thread and connection.
+        :param address: ``http://host:port`` or ``unix:///path/to/socket``,
+                        defaults to the ``SERVER`` config
+        :type address: str
+        """
+        from .server import make_server
+
+        self._long_lived = True
+        server = make_server(self, address or self.config["SERVER"])
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
 
     def make_config(self, instance_relative: bool = False) -> Config:
         """Used to create the config attribute by the Flask constructor.
@@ -95,6 +348,90 @@ class Pit(Scaffold):
 
         return self.config_class(defaults)
 
+    def json_options(self, **kwargs) -> dict:
+        """
+        Collects the options of the json reader from the command arguments,
+        falling back to the configuration
+        : param kwargs: command arguments
+        : type kwargs: dict
+        : return: json reader options
+        : rtype: dict
+        """
+        return {
+            'json_format': kwargs.get("json_format") or self.config["JSON_FORMAT"],
+            'sample_size': kwargs.get("sample_size") or self.config["JSON_SAMPLE_SIZE"],
+            'columns': kwargs.get("column_types"),
+        }
+
+    def page_options(self, **kwargs) -> dict:
+        """
+        Collects the paging options from the command arguments
+        : param kwargs: command arguments
+        : type kwargs: dict
+        : return: limit, offset, order by, after and page token
+        : rtype: dict
+        """
+        return {
+            'limit': kwargs.get("limit"),
+            'offset': kwargs.get("offset"),
+            'order_by': kwargs.get("order_by"),
+            'after': kwargs.get("after"),
+            'page_token': kwargs.get("page_token"),
+        }
+
+    def write_options(self, **kwargs) -> dict:
+        """
+        Collects the parquet write options from the ``WRITE_PROFILES`` entry
+        named by the command arguments or the ``WRITE_PROFILE`` config,
+        overridden by the options given to the command
+        : param kwargs: command arguments
+        : type kwargs: dict
+        : return: parquet write options
+        : rtype: dict
+        """
+        name: t.Optional[str] = kwargs.get("write_profile") or self.config["WRITE_PROFILE"]
+        profiles: dict = self.config["WRITE_PROFILES"] or {}
+
+        # Throw an error if the profile is not configured
+        if name is not None and name not in profiles:
+            raise ValueError(
+                f"Invalid write profile. Profile must be one of {', '.join(profiles)}")
+
+        options: dict = dict(profiles.get(name) or {})
+
+        # A codec of the command replaces the level of the profile's codec
+        if kwargs.get("compression") is not None:
+            options.pop("compression_level", None)
+
+        # Options of the command take precedence over the profile
+        options.update({
+            key: kwargs[key]
+            for key in ("compression", "compression_level", "row_group_size", "sort_by", "dictionary")
+            if kwargs.get(key) is not None
+        })
+
+        return options
+
+    async def acommands(self, *args, cmd: str = "help", timeout: t.Optional[float] = None, **kwargs) -> t.Any:
+        """
+        Executes the specified command without blocking the event loop.
+        Commands with a streaming format return an async iterator of record
+        batches instead, see :meth:`AsyncFile.iterate`.
+        : param cmd: command to be executed
+        : type cmd: str
+        : param timeout: seconds the command may run, ``ASYNC_TIMEOUT`` if empty
+        : type timeout: float
+        : param args: arguments needed by the command
+        : type args: tuple
+        : return: result of the command
+        : rtype: Any
+        """
+        # Stream the batches instead of waiting for the whole result
+        if (kwargs.get("format") or "json") != "json" and cmd in ("retrieve", "search", "batch"):
+            return self.aio.iterate(self.commands, *args, cmd=cmd, timeout=timeout, **kwargs)
+
+        return await self.aio.run(self.commands, *args, cmd=cmd, timeout=timeout, **kwargs)
+
     @staticmethod
     def help_function(cmd: str) -> None:
         """
@@ -106,6 +443,13 @@ class Pit(Scaffold):
             'dump': lambda: print(DUMP_COMMAND_HELP),
             'retrieve': lambda: print(RETRIEVE_COMMAND_HELP),
             'search': lambda: print(SEARCH_COMMAND_HELP),
+            'batch': lambda: print(BATCH_COMMAND_HELP),
+            'aggregate': lambda: print(AGGREGATE_COMMAND_HELP),
+            'index': lambda: print(INDEX_COMMAND_HELP),
+            'describe': lambda: print(DESCRIBE_COMMAND_HELP),
+            'compact': lambda: print(COMPACT_COMMAND_HELP),
+            'materialize': lambda: print(MATERIALIZE_COMMAND_HELP),
+            'serve': lambda: print(SERVE_COMMAND_HELP),
         }.get(cmd, lambda: print(f"{cmd} command not found"))()
 
     def commands(self, *args, obj: object = None, cmd: str = "help", **kwargs) -> any:  # None | dict
@@ -128,20 +472,49 @@ class Pit(Scaffold):
         # else:
         #     raise TypeError("Object must be a Database object or None")
 
-        database = self.database_class()
+        # Profile the command if requested and not done by the caller already
+        if profile.current() is None and (kwargs.get("profile") or self.config["PROFILE"] or self.profile_hooks):
+            with self.profiling(cmd, kwargs.get("profile") or self.config["PROFILE"]):
+                return self.commands(*args, obj=obj, cmd=cmd, **kwargs)
+
+        # Stream the records instead of collecting them for non-json formats
+        format: str = kwargs.get("format") or "json"
+        streaming: bool = format != "json"
 
-        if kwargs["mode"] == "file":
+        if kwargs["mode"] == "file" and streaming:
+            return {
+                'batch': lambda: self.file_class.batch_reader(queries=read_queries(kwargs["queries"], kwargs["paths"]), config=self.config, pool=self.pool, index=kwargs.get("index"), metadata=self.metadata, batch_size=self.config["BATCH_SIZE"]),
+                'retrieve': lambda: self.file_class.reader(paths=kwargs["paths"], config=self.config, pool=self.pool, columns=kwargs.get("columns"), metadata=self.metadata, batch_size=self.config["BATCH_SIZE"], as_json=format == "ndjson", filename=bool(kwargs.get("filename")), **self.page_options(**kwargs)),
+                'search': lambda: self.file_class.reader(paths=kwargs["paths"], column_value_pairs=kwargs.get("column_value_pairs"), predicate=kwargs.get("where"), config=self.config, pool=self.pool, columns=kwargs.get("columns"), index=kwargs.get("index"), metadata=self.metadata, batch_size=self.config["BATCH_SIZE"], as_json=format == "ndjson", filename=bool(kwargs.get("filename")), **self.page_options(**kwargs)),
+                'help': lambda: self.help_function(cmd),
+            }.get(cmd, lambda: "Invalid Command")()
+        elif kwargs["mode"] == "file":
+            return {
+                'dump': lambda: self.file_class.dump(path=kwargs["paths"][0], data=kwargs["data"], config=self.config, pool=self.pool, partition_by=kwargs.get("partition_by"), index_columns=kwargs.get("index_columns"), append=bool(kwargs.get("append")), write_options=self.write_options(**kwargs), **self.json_options(**kwargs)),
+                'retrieve': lambda: self.file_class.retrieve(paths=kwargs["paths"], config=self.config, pool=self.pool, columns=kwargs.get("columns"), cache=self.cache, metadata=self.metadata, filename=bool(kwargs.get("filename")), **self.page_options(**kwargs)),
+                'batch': lambda: self.file_class.batch(queries=read_queries(kwargs["queries"], kwargs["paths"]), config=self.config, pool=self.pool, index=kwargs.get("index"), metadata=self.metadata),
+                'search': lambda: self.file_class.search(paths=kwargs["paths"], column_value_pairs=kwargs.get("column_value_pairs"), predicate=kwargs.get("where"), config=self.config, pool=self.pool, columns=kwargs.get("columns"), index=kwargs.get("index"), cache=self.cache, metadata=self.metadata, filename=bool(kwargs.get("filename")), **self.page_options(**kwargs)),
+                'aggregate': lambda: self.file_class.aggregate(paths=kwargs["paths"], aggregates=kwargs["aggregates"], group_by=kwargs.get("group_by"), column_value_pairs=kwargs.get("column_value_pairs"), predicate=kwargs.get("where"), config=self.config, pool=self.pool, index=kwargs.get("index"), cache=self.cache, metadata=self.metadata),
+                'compact': lambda: [self.file_class.compact(path=path, config=self.config, pool=self.pool, target_size=kwargs.get("target_size") or self.config["COMPACT_TARGET_SIZE"], write_options=self.write_options(**kwargs), grace=self.config["COMPACT_GRACE"] if kwargs.get("grace") is None else kwargs["grace"]) for path in kwargs["paths"]],
+                'describe': lambda: self.file_class.describe(paths=kwargs["paths"], config=self.config, pool=self.pool, metadata=self.metadata),
+                'index': lambda: self.file_class.index(paths=kwargs["paths"], columns=kwargs.get("columns"), config=self.config, pool=self.pool, output=kwargs.get("index"), key=kwargs.get("key")),
+                'help': lambda: self.help_function(cmd),
+            }.get(cmd, lambda: "Invalid Command")()
+        elif kwargs["mode"] == "database" and streaming:
             return {
-                'dump': lambda: self.file_class.dump(path=kwargs["paths"][0], data=kwargs["data"], config=self.config),
-                'retrieve': lambda: self.file_class.retrieve(paths=kwargs["paths"], config=self.config),
-                'search': lambda: self.file_class.search(paths=kwargs["paths"], column_value_pairs=kwargs["column_value_pairs"], config=self.config),
+                'retrieve': lambda: self.database.reader(table=kwargs["paths"][0], columns=kwargs.get("columns"), batch_size=self.config["BATCH_SIZE"], as_json=format == "ndjson", **self.page_options(**kwargs)),
+                'search': lambda: self.database.reader(table=kwargs["paths"][0], column_value_pairs=kwargs.get("column_value_pairs"), predicate=kwargs.get("where"), columns=kwargs.get("columns"), batch_size=self.config["BATCH_SIZE"], as_json=format == "ndjson", **self.page_options(**kwargs)),
                 'help': lambda: self.help_function(cmd),
             }.get(cmd, lambda: "Invalid Command")()
         elif kwargs["mode"] == "database":
             return {
-                'dump': lambda: database.dump(kwargs["data"]),
-                'retrieve': lambda: database.retrieve(args[0]),
-                'search': lambda: database.search(args[0], *args[1:]),
+                'dump': lambda: self.database.dump(path=(kwargs["paths"][1:] or [None])[0], table=kwargs["paths"][0], data=kwargs["data"], append=bool(kwargs.get("append")), write_options=self.write_options(**kwargs), **self.json_options(**kwargs)),
+                'materialize': lambda: self.database.materialize(table=kwargs["table"], paths=kwargs["paths"]),
+                'describe': lambda: self.database.describe(table=kwargs["paths"][0]),
+                'index': lambda: self.database.index(table=kwargs["paths"][0], columns=kwargs.get("columns"), key=kwargs.get("key")),
+                'aggregate': lambda: self.database.aggregate(table=kwargs["paths"][0], aggregates=kwargs["aggregates"], group_by=kwargs.get("group_by"), column_value_pairs=kwargs.get("column_value_pairs"), predicate=kwargs.get("where")),
+                'retrieve': lambda: self.database.retrieve(table=kwargs["paths"][0], columns=kwargs.get("columns"), **self.page_options(**kwargs)),
+                'search': lambda: self.database.search(table=kwargs["paths"][0], column_value_pairs=kwargs.get("column_value_pairs"), predicate=kwargs.get("where"), columns=kwargs.get("columns"), **self.page_options(**kwargs)),
                 'help': lambda: self.help_function(cmd),
             }.get(cmd, lambda: "Invalid Command")()
         else:
@@ -0,0 +1,189 @@
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import typing as t
+
+
+class ResultCache:
+    """
+    A thread-safe cache of command results with least recently used
+    eviction, bounded by the size of the serialized results.
+
+    Results are stored as json, so every hit hands out a fresh copy. If a
+    directory is given, the results are also persisted there and survive
+    the process, so repeated CLI invocations share the cache. The keys
+    include the identity of the files a result was read from, so changed
+    files are never answered from the cache.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: t.Optional[str] = None):
+        """
+        Initialize an empty cache
+        :param max_bytes: maximum size of the cached results in memory and
+                          on disk
+        :type max_bytes: int
+        :param path: directory to persist the results in, memory only if empty
+        :type path: str
+        """
+        self.max_bytes = max_bytes
+        self.path = path
+
+        # Serialized results by key, the least recently used first
+        self._entries: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self._size: int = 0
+        self._lock = threading.Lock()
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(*parts: t.Any) -> str:
+        """
+        Build the key of a result from everything it depends on
+        :param parts: json serializable parts, e.g. command, paths, file
+                      identities and column value pairs
+        :type parts: Any
+        :return: key
+        :rtype: str
+        """
+        normalized: str = json.dumps(parts, sort_keys=True, default=str)
+
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def get(self, key: str) -> t.Optional[t.Any]:
+        """
+        Get a cached result
+        :param key: key of the result
+        :type key: str
+        :return: result, None if it is not cached
+        :rtype: Any
+        """
+        with self._lock:
+            data: t.Optional[bytes] = self._entries.get(key)
+
+            # Mark the result as recently used
+            if data is not None:
+                self._entries.move_to_end(key)
+
+        # Fall back to the results persisted by earlier processes
+        if data is None and self.path is not None:
+            data = self._read(key)
+            if data is not None:
+                self._insert(key, data)
+
+        if data is None:
+            return None
+
+        return json.loads(data)
+
+    def put(self, key: str, value: t.Any) -> None:
+        """
+        Cache a result
+        :param key: key of the result
+        :type key: str
+        :param value: json serializable result
+        :type value: Any
+        """
+        data: bytes = json.dumps(value).encode()
+
+        # Don't let a single result flush the whole cache
+        if len(data) > self.max_bytes:
+            return
+
+        self._insert(key, data)
+
+        if self.path is not None:
+            self._write(key, data)
+
+    def clear(self) -> None:
+        """
+        Removes all cached results from memory and disk
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+            if self.path is not None:
+                for name in os.listdir(self.path):
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(self.path, name))
+
+    def _insert(self, key: str, data: bytes) -> None:
+        """
+        Add a serialized result to memory and evict the least recently used
+        results that exceed the size limit
+        :param key: key of the result
+        :type key: str
+        :param data: serialized result
+        :type data: bytes
+        """
+        with self._lock:
+            previous: t.Optional[bytes] = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+
+            self._entries[key] = data
+            self._size += len(data)
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + '.json')
+
+    def _read(self, key: str) -> t.Optional[bytes]:
+        """
+        Read a persisted result and mark it as recently used
+        :param key: key of the result
+        :type key: str
+        :return: serialized result, None if it is not persisted
+        :rtype: bytes
+        """
+        try:
+            with open(self._file(key), 'rb') as file:
+                data: bytes = file.read()
+
+            os.utime(self._file(key))
+        except FileNotFoundError:
+            return None
+
+        return data
+
+    def _write(self, key: str, data: bytes) -> None:
+        """
+        Persist a result and evict the least recently used persisted
+        results that exceed the size limit
+        :param key: key of the result
+        :type key: str
+        :param data: serialized result
+        :type data: bytes
+        """
+        # Write to a temporary file first, so readers never see half a result
+        fd, temporary = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, self._file(key))
+
+        # Collect the persisted results, the least recently used first
+        entries: list[tuple[float, int, str]] = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        size: int = sum(entry[1] for entry in entries)
+
+        for _, entry_size, entry_path in entries:
+            if size <= self.max_bytes:
+                break
+
+            # Another process may have evicted the result already
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry_path)
+            size -= entry_size
@@ -1,18 +1,39 @@
 import argparse
+import shlex
 
 
 class SplitArgs(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
-        # Transform values from "key1=value1,key2=value2" to array of dictionaries
-        # [{'key1', 'value1'}, {'key2', 'value2'}]
-        # res = [dict([value.split('=')]) for value in values.split(',')]
+        # Transform values from "key1=value1 key2='value 2'" to a dictionary
+        # {'key1': 'value1', 'key2': 'value 2'}, quoted values may hold spaces
+        # and values may hold '='
+        pairs = shlex.split(values)
+        if any('=' not in pair for pair in pairs):
+            parser.error(f"argument {option_string}: expected key=value pairs")
 
-        res = dict([value.split('=') for value in values.split(' ')])
+        res = dict(pair.split('=', 1) for pair in pairs)
 
         # Set the values to the namespace
         setattr(namespace, self.dest, res)
 
 
+def add_write_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the arguments of the parquet write options to a parser
+    :param parser: parser of a command that writes parquet files
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--write-profile', type=str)
+    parser.add_argument(
+        '--compression', type=str, choices=['uncompressed', 'snappy', 'gzip', 'zstd', 'lz4', 'lz4_raw', 'brotli'])
+    parser.add_argument('--compression-level', type=int)
+    parser.add_argument('--row-group-size', type=int)
+    parser.add_argument(
+        '--sort-by', type=lambda value: value.split(','))
+    parser.add_argument(
+        '--dictionary', action=argparse.BooleanOptionalAction, default=None)
+
+
 def cli():
     """
     cli function is used to parse the command line arguments
@@ -29,10 +50,26 @@ def cli():
     dump_parser.add_argument('--data', type=str, required=True)
     dump_parser.add_argument(
         '--mode', type=str, choices=['file', 'database'], default='file')
+    dump_parser.add_argument(
+        '--json-format', type=str, choices=['auto', 'array', 'newline_delimited'])
+    dump_parser.add_argument('--sample-size', type=int)
+    dump_parser.add_argument('--column-types', action=SplitArgs)
+    dump_parser.add_argument(
+        '--partition-by', type=lambda value: value.split(','))
+    dump_parser.add_argument(
+        '--index-columns', type=lambda value: value.split(','))
+    dump_parser.add_argument('--append', action='store_true')
+    add_write_arguments(dump_parser)
     retrieve_parser = commands_group.add_parser('retrieve')
     retrieve_parser.add_argument('paths', nargs='+', type=str)
     retrieve_parser.add_argument(
         '--mode', type=str, choices=['file', 'database'], default='file')
+    retrieve_parser.add_argument(
+        '--format', type=str, choices=['json', 'ndjson', 'arrow', 'parquet'], default='json')
+    retrieve_parser.add_argument('--output', type=str)
+    retrieve_parser.add_argument(
+        '--columns', type=lambda value: value.split(','))
+    retrieve_parser.add_argument('--filename', action='store_true')
     # retrieve_exclusive_group = retrieve_parser.add_mutually_exclusive_group(
     #     required=True)
     # retrieve_exclusive_group.add_argument('--file', type=str)
@@ -46,8 +83,80 @@ def cli():
     # search_exclusive_group.add_argument('--file', type=str)
     # search_exclusive_group.add_argument(
     #     '--directory', type=str, action='append')
+    search_parser.add_argument('--column_value_pairs', action=SplitArgs)
+    search_parser.add_argument('--where', type=str)
+    search_parser.add_argument(
+        '--format', type=str, choices=['json', 'ndjson', 'arrow', 'parquet'], default='json')
+    search_parser.add_argument('--output', type=str)
     search_parser.add_argument(
-        '--column_value_pairs', action=SplitArgs, required=True)
+        '--columns', type=lambda value: value.split(','))
+    search_parser.add_argument('--index', type=str)
+    search_parser.add_argument('--filename', action='store_true')
+    batch_parser = commands_group.add_parser('batch')
+    batch_parser.add_argument('paths', nargs='*', type=str)
+    batch_parser.add_argument('--queries', type=str, required=True)
+    batch_parser.add_argument(
+        '--mode', type=str, choices=['file'], default='file')
+    # The records of different searches don't share a schema, so they are
+    # only written as json
+    batch_parser.add_argument(
+        '--format', type=str, choices=['json', 'ndjson'], default='json')
+    batch_parser.add_argument('--output', type=str)
+    batch_parser.add_argument('--index', type=str)
+    aggregate_parser = commands_group.add_parser('aggregate')
+    aggregate_parser.add_argument('paths', nargs='+', type=str)
+    aggregate_parser.add_argument(
+        '--mode', type=str, choices=['file', 'database'], default='file')
+    aggregate_parser.add_argument(
+        '--aggregates', type=lambda value: value.split(','), required=True)
+    aggregate_parser.add_argument(
+        '--group-by', type=lambda value: value.split(','))
+    aggregate_parser.add_argument('--column_value_pairs', action=SplitArgs)
+    aggregate_parser.add_argument('--where', type=str)
+    aggregate_parser.add_argument('--index', type=str)
+    index_parser = commands_group.add_parser('index')
+    index_parser.add_argument('paths', nargs='+', type=str)
+    index_parser.add_argument(
+        '--mode', type=str, choices=['file', 'database'], default='file')
+    index_parser.add_argument(
+        '--columns', type=lambda value: value.split(','))
+    index_parser.add_argument('--key', type=str)
+    index_parser.add_argument('--index', type=str)
+    compact_parser = commands_group.add_parser('compact')
+    compact_parser.add_argument('paths', nargs='+', type=str)
+    compact_parser.add_argument(
+        '--mode', type=str, choices=['file'], default='file')
+    compact_parser.add_argument('--target-size', type=int)
+    compact_parser.add_argument('--grace', type=float)
+    add_write_arguments(compact_parser)
+    describe_parser = commands_group.add_parser('describe')
+    describe_parser.add_argument('paths', nargs='+', type=str)
+    describe_parser.add_argument(
+        '--mode', type=str, choices=['file', 'database'], default='file')
+    materialize_parser = commands_group.add_parser('materialize')
+    materialize_parser.add_argument('paths', nargs='+', type=str)
+    materialize_parser.add_argument('--table', type=str, required=True)
+    materialize_parser.add_argument(
+        '--mode', type=str, choices=['database'], default='database')
+
+    # Return a page of the records, continued with the token of the previous page
+    for command_parser in (retrieve_parser, search_parser):
+        command_parser.add_argument('--limit', type=int)
+        command_parser.add_argument('--offset', type=int)
+        command_parser.add_argument(
+            '--order-by', type=lambda value: value.split(','))
+        # One argument per order by column, so values may hold commas
+        command_parser.add_argument('--after', nargs='+')
+        command_parser.add_argument('--page-token', type=str)
+
+    serve_parser = commands_group.add_parser('serve')
+    serve_parser.add_argument('--bind', type=str)
+
+    # Print the timing, memory and query profile of a command to stderr or
+    # write it to a file as json
+    for command_parser in commands_group.choices.values():
+        if command_parser is not serve_parser:
+            command_parser.add_argument('--profile', type=str, nargs='?', const='-')
 
     # Parse the arguments
     return parser.parse_args()
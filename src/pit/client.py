@@ -0,0 +1,166 @@
+import http.client
+import json
+import os
+import shutil
+import socket
+import sys
+import typing as t
+from urllib.parse import urlsplit
+
+from .ingest import REMOTE_PREFIXES
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a unix domain socket.
+    """
+
+    def __init__(self, path: str, timeout: t.Optional[float] = None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def connect(address: str, timeout: t.Optional[float] = None) -> http.client.HTTPConnection:
+    """
+    Create a connection to a pit server
+    :param address: ``http://host:port`` or ``unix:///path/to/socket``
+    :type address: str
+    :param timeout: socket timeout in seconds
+    :type timeout: float
+    :return: connection
+    :rtype: http.client.HTTPConnection
+    """
+    url = urlsplit(address)
+
+    if url.scheme == 'unix':
+        return UnixHTTPConnection(url.path, timeout)
+    if url.scheme == 'http':
+        return http.client.HTTPConnection(url.hostname, url.port or 8700, timeout=timeout)
+
+    raise ValueError(
+        "Invalid server address. Address must start with http:// or unix://")
+
+
+def _absolute(path: str) -> str:
+    """
+    Make a local path absolute, remote paths are left as they are
+    :param path: path of a file, dataset or glob pattern
+    :type path: str
+    :return: absolute path
+    :rtype: str
+    """
+    return path if path.startswith(REMOTE_PREFIXES) else os.path.abspath(path)
+
+
+def localize(cmd: str, kwargs: dict) -> dict:
+    """
+    Resolve the arguments of a command against the client, so the server
+    runs it like the client would. Relative paths are made absolute, json
+    data and queries read from stdin are sent inline, and so are the
+    queries of a batch, whose own paths are made absolute too.
+    :param cmd: command to be executed
+    :type cmd: str
+    :param kwargs: arguments of the command
+    :type kwargs: dict
+    :return: arguments to send to the server
+    :rtype: dict
+    """
+    kwargs = dict(kwargs)
+
+    # Database commands take a table name first, dump and materialize take files after it
+    if kwargs.get('paths'):
+        tables: int = len(kwargs['paths'])
+        if kwargs.get('mode') != 'database' or cmd == 'materialize':
+            tables = 0
+        elif cmd == 'dump':
+            tables = 1
+
+        kwargs['paths'] = kwargs['paths'][:tables] + [_absolute(path) for path in kwargs['paths'][tables:]]
+
+    if kwargs.get('index'):
+        kwargs['index'] = _absolute(kwargs['index'])
+
+    # Send stdin along, the server would read its own
+    if kwargs.get('data') == '-':
+        kwargs['data'] = sys.stdin.read()
+    elif kwargs.get('data') and os.path.exists(kwargs['data']):
+        kwargs['data'] = _absolute(kwargs['data'])
+
+    # Send the queries inline with their paths resolved
+    if kwargs.get('queries'):
+        if kwargs['queries'] == '-':
+            lines: list[str] = sys.stdin.read().splitlines()
+        else:
+            with open(kwargs['queries']) as file:
+                lines = file.read().splitlines()
+
+        queries: list[dict] = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+
+            # Number the searches by the lines they came from, as read_queries does
+            query: dict = json.loads(line)
+            query.setdefault('id', number)
+            queries.append(query)
+
+            if query.get('paths'):
+                query['paths'] = [_absolute(path) for path in query['paths']]
+
+        kwargs['queries'] = '\n'.join(json.dumps(query) for query in queries)
+
+    return kwargs
+
+
+def forward(address: str, cmd: str, kwargs: dict, stream: t.Optional[t.BinaryIO] = None) -> bool:
+    """
+    Forward a command to a running pit server and copy its output
+    :param address: address of the server
+    :type address: str
+    :param cmd: command to be executed
+    :type cmd: str
+    :param kwargs: arguments of the command, see :func:`localize`
+    :type kwargs: dict
+    :param stream: binary stream to write to, defaults to stdout or the
+                   output file of the command
+    :type stream: BinaryIO
+    :return: False if no server is running
+    :rtype: bool
+    """
+    connection = connect(address)
+
+    try:
+        connection.connect()
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Fall back to running the command locally, stdin is still unread
+        connection.close()
+        return False
+
+    try:
+        connection.request(
+            'POST', '/commands', body=json.dumps({'cmd': cmd, 'kwargs': localize(cmd, kwargs)}),
+            headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+
+        # Raise the error of the command
+        if response.status != 200:
+            raise RuntimeError(json.loads(response.read()).get('error'))
+
+        # Copy the output to the output file of the command or stdout
+        if stream is None and kwargs.get('output'):
+            with open(kwargs['output'], 'wb') as file:
+                shutil.copyfileobj(response, file)
+        else:
+            stream = stream or sys.stdout.buffer
+            shutil.copyfileobj(response, stream)
+            stream.flush()
+    finally:
+        connection.close()
+
+    return True
@@ -1,26 +1,37 @@
-import argparse
+import contextlib
 import json
-import os
-import sys
 import typing as t
-from datetime import timedelta
 
 import duckdb
-import pandas as pd
+import pyarrow as pa
 
-from .config import Config, ConfigAttribute
+from . import profile
+from .dataset import is_glob, resolve
+from .file import File
+from .helpers import quote_identifier, quote_literal
+from .ingest import json_source
+from .pool import track
+from .predicate import condition as predicate_condition, parse as parse_predicate
+from .query import aggregates as parse_aggregates, aggregation, copy_options, json_records, keyset, limit_offset, order_by, ordering, paging, parquet_source, projection, stream, tiebreak, visible, where
 
 
 class Database:
     """
-    A class that interacts with a database stored in memory using DuckDB.
+    A class that interacts with a persistent database stored in a DuckDB
+    file. Tables stay resident between commands, so their data is decoded
+    once instead of on every request.
     """
 
-    def __init__(self):
+    def __init__(self, path: str = ':memory:', config: dict = dict()):
         """
-        Initialize a connection to the database stored in memory.
+        Initialize a connection to the database.
+        :param path: path of the .duckdb file, in memory by default
+        :type path: str
+        :param config: configuration
+        :type config: dict
         """
-        self.connection = duckdb.connect(':memory:')
+        self.path = path
+        self.connection = File.connection(config, path)
         self.cursor = self.connection.cursor()
 
     def execute(self, query: str):
@@ -39,84 +50,380 @@ class Database:
         """
         return self.connection.execute(query)
 
-    def create_table(self, table: str, data: dict):
+    @contextlib.contextmanager
+    def session(self) -> t.Iterator[duckdb.DuckDBPyConnection]:
+        """
+        Provide a cursor of the database, so that concurrent callers don't
+        share a connection
+        :return: DuckDB cursor
+        :rtype: Iterator[duckdb.DuckDBPyConnection]
         """
-        Create a table in the database.
+        with self.connection.cursor() as cursor, track(cursor):
+            yield cursor
+
+    def create_table(self, table: str, data: str, json_format: str = 'auto', sample_size: t.Optional[int] = None, columns: t.Optional[dict[str, str]] = None, append: bool = False):
+        """
+        Create or replace a table in the database, or insert into it if
+        append is set and the table exists.
         :param table: name of the table
         :type table: str
-        :param data: json object to be dumped
-        :type data: dict
+        :param data: path of a json file, ``-`` for stdin or a json document
+        :type data: str
+        :param json_format: json layout, one of ``auto``, ``array`` or
+                            ``newline_delimited``
+        :type json_format: str
+        :param sample_size: number of records used to infer the schema
+        :type sample_size: int
+        :param columns: explicit column types, replaces schema inference
+        :type columns: dict[str, str]
+        :param append: insert the records into the existing table
+        :type append: bool
         """
-        # Convert JSON object to pandas dataframe
-        df: pd.DataFrame = pd.read_json(data, orient='records', dtype=False)
+        # Let DuckDB read the json data directly
+        with self.session() as cursor, \
+                json_source(data, json_format, sample_size, columns) as source:
 
-        # Export the table as a Parquet file
-        self.connection.execute(
-            f"CREATE TABLE {table} AS SELECT * FROM df")
+            # Match the columns by name, so the json keys may come in any order
+            if append and self.exists(cursor, table):
+                cursor.execute(
+                    f"INSERT INTO {quote_identifier(table)} BY NAME SELECT * FROM {source}")
+                return
+
+            cursor.execute(
+                f"CREATE OR REPLACE TABLE {quote_identifier(table)} AS SELECT * FROM {source}")
+
+    @staticmethod
+    def exists(cursor: duckdb.DuckDBPyConnection, table: str) -> bool:
+        """
+        Check whether a table exists
+        :param cursor: cursor of the database
+        :type cursor: duckdb.DuckDBPyConnection
+        :param table: name of the table
+        :type table: str
+        :return: True if the table exists
+        :rtype: bool
+        """
+        return cursor.execute(
+            f"SELECT count(*) FROM information_schema.tables WHERE table_name = {quote_literal(table)}").fetchone()[0] > 0
+
+    def materialize(self, table: str, paths: list[str]) -> dict:
+        """
+        Create or replace a table from one or more parquet files or datasets
+        :param table: name of the table
+        :type table: str
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :return: name and number of rows of the table
+        :rtype: dict
+        """
+        # Resolve datasets to their files
+        files, partitioned = resolve(paths)
+
+        # Merge the schemas of several files by column name
+        source: str = parquet_source(files, partitioned, len(files) > 1 or any(is_glob(file) for file in files))
+
+        with self.session() as cursor:
+            # Decode the parquet files once into the database
+            cursor.execute(
+                f"CREATE OR REPLACE TABLE {quote_identifier(table)} AS SELECT * FROM {source}")
 
-    def dump(self, path: str, table: str, data: dict):
+            # Count the rows of the table
+            rows: int = cursor.execute(
+                f"SELECT count(*) FROM {quote_identifier(table)}").fetchone()[0]
+
+        return {'table': table, 'rows': rows}
+
+    def index(self, table: str, columns: t.Optional[list[str]] = None, key: t.Optional[str] = None) -> dict:
+        """
+        Create ART indexes on columns of a table, so searching a value of
+        them looks up its rows instead of scanning the table. Indexes are
+        dropped when the table is materialized again.
+        :param table: name of the table
+        :type table: str
+        :param columns: columns to index
+        :type columns: list[str]
+        :param key: key column to index
+        :type key: str
+        :return: name of the table and the indexed columns
+        :rtype: dict
         """
-        Dumps a json object to a parquet file
-        :param path: path of the parquet file
+        columns = [*([key] if key else []), *[column for column in columns or [] if column != key]]
+
+        # Throw an error if there is nothing to index
+        if not columns:
+            raise ValueError("Invalid columns. Index needs columns or a key column")
+
+        with self.session() as cursor:
+            for column in columns:
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {quote_identifier(f'{table}_{column}_idx')} "
+                    f"ON {quote_identifier(table)} ({quote_identifier(column)})")
+
+        return {'table': table, 'columns': columns}
+
+    def dump(self, path: t.Optional[str], table: str, data: t.Optional[str] = None, json_format: str = 'auto', sample_size: t.Optional[int] = None, columns: t.Optional[dict[str, str]] = None, append: bool = False, write_options: t.Optional[dict] = None):
+        """
+        Dumps json data into a table and exports the table to a parquet file
+        :param path: path of the parquet file, the table is not exported if empty
         :type path: str
         :param table: name of the table
         :type table: str
-        :param data: json object to be dumped
-        :type data: dict
+        :param data: path of a json file, ``-`` for stdin or a json document,
+                     the table is not changed if empty
+        :type data: str
+        :param json_format: json layout, one of ``auto``, ``array`` or
+                            ``newline_delimited``
+        :type json_format: str
+        :param sample_size: number of records used to infer the schema
+        :type sample_size: int
+        :param columns: explicit column types, replaces schema inference
+        :type columns: dict[str, str]
+        :param append: insert the records into the existing table
+        :type append: bool
+        :param write_options: parquet write options, see :func:`query.copy_options`,
+                              and ``sort_by``, the columns to sort the records by
+        :type write_options: dict
         """
-        # Convert JSON object to pandas dataframe
-        df: pd.DataFrame = pd.read_json(data, orient='records', dtype=False)
+        # Load the json data into the table
+        if data is not None:
+            self.create_table(table, data, json_format, sample_size, columns, append)
 
         # Export the table as a Parquet file
-        self.connection.execute(
-            f"COPY '{table}' TO '{path}' (FORMAT PARQUET)")
+        if path is not None:
+            with self.session() as cursor:
+                cursor.execute(
+                    f"COPY (SELECT * FROM {quote_identifier(table)}{order_by((write_options or {}).get('sort_by'))}) "
+                    f"TO {quote_literal(path)} ({copy_options(write_options)})")
 
-    def retrieve(self, table: str) -> dict:
+    def relation(self, cursor: duckdb.DuckDBPyConnection, table: str, column_value_pairs: t.Optional[dict[str, str]] = None, columns: t.Optional[list[str]] = None, page: t.Optional[dict] = None, predicate: t.Optional[t.Union[str, list]] = None) -> duckdb.DuckDBPyRelation:
         """
-        Loads a parquet file and returns it as json object
-        :param path: path of the parquet file
-        :type path: str
-        :return: json object
-        :rtype: dict
+        Build the relation over a table, optionally filtered by column value
+        pairs and a predicate, projected to some columns and limited to a page
+        :param cursor: cursor of the database
+        :type cursor: duckdb.DuckDBPyConnection
+        :param table: name of the table
+        :type table: str
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param page: page of the records to return, see :func:`pit.query.paging`
+        :type page: dict
+        :param predicate: predicate the rows match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: relation of the matching records
+        :rtype: duckdb.DuckDBPyRelation
+        """
+        rel = cursor.table(table)
+        tree: t.Optional[list] = parse_predicate(predicate)
+
+        # Return all records if there is nothing to search for
+        if not column_value_pairs and tree is None and not columns and page is None:
+            return rel
+
+        # Get the column types of the table
+        types: dict[str, str] = {
+            column: str(type) for column, type in zip(rel.columns, rel.types)}
+
+        # Compare typed values, so the filters can use zonemaps and indexes
+        condition = where(column_value_pairs or {}, types)
+        if tree is not None:
+            condition = f"{condition} AND {predicate_condition(tree, types)}"
+        select: str = projection(columns)
+        clauses: str = ''
+
+        if page is not None:
+            # Reject columns that don't exist instead of ordering by nothing
+            for column in page['order_by'] or []:
+                if column not in types:
+                    raise ValueError(f"Invalid column. Column {column} does not exist")
+
+            # Return the order by columns, the next page starts after their values
+            if columns and page['order_by']:
+                columns = [*columns, *[column for column in page['order_by'] if column not in columns]]
+
+            # Order the rows with equal values by their row id
+            tiebreaker: list[str] = ['rowid'] if page['order_by'] else []
+
+            # Start after the values and the row the previous page ended with
+            if page['after'] is not None:
+                keys: list[str] = [*page['order_by'], *(tiebreaker if page['tie'] is not None else [])]
+                condition = f"{condition} AND {keyset(keys, [*page['after'], *(page['tie'] or [])], {**types, 'rowid': 'BIGINT'})}"
+
+            # Return the row id under a hidden name
+            if tiebreaker:
+                select = f"{projection(columns)}, {tiebreak(tiebreaker)}"
+                clauses = ordering(page['order_by'], tiebreaker)
+
+            clauses += limit_offset(page['limit'], page['offset'])
+
+        return cursor.sql(
+            f"SELECT {select} FROM {quote_identifier(table)} WHERE {condition}{clauses}")
+
+    def retrieve(self, table: str, columns: t.Optional[list[str]] = None, limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None) -> t.Union[list[dict], dict]:
         """
-        # Loading parquet file into duckdb
-        df: pd.DataFrame = self.connection.execute(
-            f"SELECT * FROM '{table}'"
-        ).to_df()
+        Loads a table and returns it as json object
+        :param table: name of the table
+        :type table: str
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param limit: maximum number of records, all if empty
+        :type limit: int
+        :param offset: number of records to skip
+        :type offset: int
+        :param order_by: columns to order the records by
+        :type order_by: list[str]
+        :param after: values of the order by columns the records start after
+        :type after: list[Any]
+        :param page_token: continuation token of the previous page
+        :type page_token: str
+        :return: json object, or ``records`` and the ``next`` token of a page
+        :rtype: list[dict] | dict
+        """
+        page: t.Optional[dict] = paging(limit, offset, order_by, after, page_token)
+
+        with self.session() as cursor, profile.phase('scan'), profile.explain(cursor):
+            # Loading the table
+            table = json_records(self.relation(cursor, table, columns=columns, page=File.probe(page)))
 
-        # Convert the dataframe to dictionary
-        res = json.loads(df.to_json(orient='records'))
+        # Parse the serialized rows
+        with profile.phase('to_json'):
+            res = File.records(table, page)
 
         # Return the result
         return res
 
-    def search(self, table: str, column_value_pairs: dict[str, str]) -> dict:
+    def search(self, table: str, column_value_pairs: t.Optional[dict[str, str]] = None, columns: t.Optional[list[str]] = None, limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None, predicate: t.Optional[t.Union[str, list]] = None) -> t.Union[list[dict], dict]:
         """
-        Search specific values in specific columns of the parquet file
-        :param path: path of the parquet file
+        Search specific values in specific columns of a table,
+        or the rows that match a predicate
+        :param table: name of the table
         :type table: str
-        :param column_value_pairs: list of tuple where each tuple contains the
-                                   the column name and the value to search
-        :type column_value_pairs: list of tuple
-        :return: the rows that match the search criteria
-        :rtype: dict
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param limit: maximum number of records, all if empty
+        :type limit: int
+        :param offset: number of records to skip
+        :type offset: int
+        :param order_by: columns to order the records by
+        :type order_by: list[str]
+        :param after: values of the order by columns the records start after
+        :type after: list[Any]
+        :param page_token: continuation token of the previous page
+        :type page_token: str
+        :param predicate: predicate the rows match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: the rows that match the search criteria, or ``records`` and
+                 the ``next`` token of a page
+        :rtype: list[dict] | dict
+        """
+        page: t.Optional[dict] = paging(limit, offset, order_by, after, page_token)
+
+        with self.session() as cursor, profile.phase('scan'), profile.explain(cursor):
+            # Execute the query
+            records = json_records(self.relation(
+                cursor, table, column_value_pairs, columns, File.probe(page), predicate))
+
+        # Parse the serialized rows
+        with profile.phase('to_json'):
+            res = File.records(records, page)
+
+        # Return the result
+        return res
+
+    def reader(self, table: str, column_value_pairs: t.Optional[dict[str, str]] = None, columns: t.Optional[list[str]] = None, batch_size: int = 10000, as_json: bool = False, limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None, predicate: t.Optional[t.Union[str, list]] = None) -> pa.RecordBatchReader:
+        """
+        Stream the records of a table as Arrow record batches
+        :param table: name of the table
+        :type table: str
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param batch_size: maximum number of rows per batch
+        :type batch_size: int
+        :param as_json: serialize the records to json
+        :type as_json: bool
+        :param limit: maximum number of records, all if empty
+        :type limit: int
+        :param offset: number of records to skip
+        :type offset: int
+        :param order_by: columns to order the records by
+        :type order_by: list[str]
+        :param after: values of the order by columns the records start after
+        :type after: list[Any]
+        :param page_token: continuation token of the previous page
+        :type page_token: str
+        :param predicate: predicate the rows match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: reader of the matching records
+        :rtype: pa.RecordBatchReader
         """
+        page: t.Optional[dict] = paging(limit, offset, order_by, after, page_token)
 
-        # Create the query
-        query: str = f"SELECT * FROM '{table}' WHERE "
-        # Converte column_value_pairs "<column>=<value>" to join them with AND
-        query += " AND ".join(
-            [f"{key}='{column_value_pairs[key]}'" for key in column_value_pairs.keys()])
+        return stream(
+            self.session(),
+            lambda cursor: visible(self.relation(cursor, table, column_value_pairs, columns, page, predicate)),
+            batch_size, as_json)
+
+    def aggregate(self, table: str, aggregates: list[str], group_by: t.Optional[list[str]] = None, column_value_pairs: t.Optional[dict[str, str]] = None, predicate: t.Optional[t.Union[str, list]] = None) -> list[dict]:
+        """
+        Aggregate the matching rows of a table and return only the
+        aggregated rows
+        :param table: name of the table
+        :type table: str
+        :param aggregates: aggregates such as ``count``, ``sum(amount)`` or
+                           ``approx_count_distinct(user)``
+        :type aggregates: list[str]
+        :param group_by: columns to group by, one row if empty
+        :type group_by: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param predicate: predicate the rows match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: a row per group with the group by columns and the aggregates
+        :rtype: list[dict]
+        """
+        parsed: list[tuple[str, t.Optional[str]]] = parse_aggregates(aggregates)
 
-        # Execute the query
-        df: pd.DataFrame = duckdb.query(query).to_df()
+        with self.session() as cursor, profile.phase('scan'), profile.explain(cursor):
+            rel = self.relation(cursor, table, column_value_pairs, predicate=predicate)
+            types: dict[str, str] = {column: str(type) for column, type in zip(rel.columns, rel.types)}
 
-        # Convert the dataframe to dictionary
-        res = json.loads(df.to_json(orient='records'))
+            # Group and aggregate the filtered rows, ordered by the groups
+            rel = rel.aggregate(aggregation(parsed, group_by, types), projection(group_by) if group_by else '')
+            table = json_records(rel.order(projection(group_by)) if group_by else rel)
+
+        # Parse the rows serialized by DuckDB
+        with profile.phase('to_json'):
+            res = [json.loads(record) for record in table.column('record').to_pylist()]
 
         # Return the result
         return res
 
+    def describe(self, table: str) -> dict:
+        """
+        Describe a table of the database
+        :param table: name of the table
+        :type table: str
+        :return: schema and number of rows of the table
+        :rtype: dict
+        """
+        with self.session() as cursor:
+            rel = cursor.table(table)
+
+            # Count the rows of the table
+            rows: int = cursor.execute(
+                f"SELECT count(*) FROM {quote_identifier(table)}").fetchone()[0]
+
+            return {
+                'table': table,
+                'schema': {column: str(type) for column, type in zip(rel.columns, rel.types)},
+                'num_rows': rows,
+            }
+
     def close_connection(self):
         """
         Closes the connection to DuckDB
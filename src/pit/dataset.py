@@ -0,0 +1,191 @@
+import glob
+import os
+import typing as t
+from urllib.parse import unquote
+
+from .ingest import REMOTE_PREFIXES
+from .manifest import load as load_manifest
+
+#: Directory name DuckDB uses for NULL partition values.
+HIVE_DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def is_dataset(path: str) -> bool:
+    """
+    Check whether a path points to a dataset directory instead of a file.
+    Remote datasets are marked with a trailing slash.
+    :param path: path of a parquet file or dataset
+    :type path: str
+    :return: True if the path is a dataset directory
+    :rtype: bool
+    """
+    if path.startswith(REMOTE_PREFIXES):
+        return path.endswith('/')
+
+    return os.path.isdir(path)
+
+
+def is_glob(path: str) -> bool:
+    """
+    Check whether a path is a glob pattern instead of a single file
+    :param path: path of a parquet file, dataset or glob pattern
+    :type path: str
+    :return: True if the path contains wildcards
+    :rtype: bool
+    """
+    return glob.has_magic(path)
+
+
+def resolve(paths: list[str], column_value_pairs: t.Optional[dict[str, str]] = None) -> tuple[list[str], bool]:
+    """
+    Resolve files, glob patterns and dataset directories to the parquet
+    files to read. Local globs are expanded, so every file can be pruned
+    and cached on its own. Local datasets with a manifest are read as
+    listed in the manifest, files that aren't listed yet are ignored. Hive
+    partitions of local datasets that can't match the column value pairs
+    are pruned before any file is opened. Remote globs and datasets are
+    expanded and pruned by DuckDB.
+    :param paths: paths of parquet files or datasets
+    :type paths: list[str]
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :return: paths to read and whether they are hive partitioned
+    :rtype: tuple[list[str], bool]
+    """
+    files: list[str] = []
+    matches: list[str]
+    partitioned: bool = False
+
+    for path in paths:
+        # Expand local globs
+        if is_glob(path) and not path.startswith(REMOTE_PREFIXES):
+            matches = sorted(file for file in glob.glob(path, recursive=True) if os.path.isfile(file))
+
+            # Throw an error if the pattern matches nothing
+            if not matches:
+                raise ValueError(f"Invalid path. No files match {path}")
+
+            files.extend(matches)
+            continue
+
+        # Keep plain files and remote globs as they are
+        if not is_dataset(path):
+            files.append(path)
+            continue
+
+        partitioned = True
+
+        # Let DuckDB expand and prune remote datasets
+        if path.startswith(REMOTE_PREFIXES):
+            files.append(path + '**/*.parquet')
+            continue
+
+        # Collect the parquet files of the partitions that can match
+        manifest: t.Optional[dict] = load_manifest(path)
+        if manifest is not None:
+            matches = [
+                os.path.join(path, file) for file in manifest['files']
+                if _partitions_match(file, column_value_pairs or {})]
+        else:
+            matches = sorted(_walk(path, column_value_pairs or {}))
+
+        # Keep one file of a fully pruned dataset so the schema is known,
+        # the filters then reject all of its rows
+        if not matches:
+            matches = [os.path.join(path, file) for file in manifest['files'][:1]] if manifest is not None \
+                else [file for file in [next(_walk(path, {}), None)] if file]
+
+        files.extend(matches)
+
+    return files, partitioned
+
+
+def _walk(directory: str, column_value_pairs: dict[str, str]) -> t.Iterator[str]:
+    """
+    Yield the parquet files below a directory, skipping the hive partition
+    directories whose value can't match the column value pairs
+    :param directory: directory to walk
+    :type directory: str
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :return: paths of parquet files
+    :rtype: Iterator[str]
+    """
+    for entry in os.scandir(directory):
+        # Skip hidden and metadata files
+        if entry.name.startswith(('.', '_')):
+            continue
+
+        if entry.is_file() and entry.name.endswith('.parquet'):
+            yield entry.path
+
+        elif entry.is_dir():
+            # Prune partitions by their key=value directory name
+            key, separator, value = entry.name.partition('=')
+            if separator and key in column_value_pairs \
+                    and not _matches(unquote(value), str(column_value_pairs[key])):
+                continue
+
+            yield from _walk(entry.path, column_value_pairs)
+
+
+def list_files(directory: str, ignore_manifest: bool = False) -> list[str]:
+    """
+    List the parquet files of a local dataset directory, as listed in its
+    manifest if it has one
+    :param directory: path of the dataset directory
+    :type directory: str
+    :param ignore_manifest: list all files below the directory instead
+    :type ignore_manifest: bool
+    :return: paths of the files relative to the directory
+    :rtype: list[str]
+    """
+    manifest: t.Optional[dict] = None if ignore_manifest else load_manifest(directory)
+    if manifest is not None:
+        return list(manifest['files'])
+
+    return sorted(os.path.relpath(file, directory) for file in _walk(directory, {}))
+
+
+def _partitions_match(path: str, column_value_pairs: dict[str, str]) -> bool:
+    """
+    Check whether the hive partition directories of a relative path can
+    match the column value pairs
+    :param path: path of a file relative to its dataset
+    :type path: str
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :return: False if a partition can't match
+    :rtype: bool
+    """
+    for directory in path.split('/')[:-1]:
+        key, separator, value = directory.partition('=')
+        if separator and key in column_value_pairs \
+                and not _matches(unquote(value), str(column_value_pairs[key])):
+            return False
+
+    return True
+
+
+def _matches(partition: str, value: str) -> bool:
+    """
+    Check whether a partition value can be equal to a searched value
+    :param partition: decoded value of the partition directory
+    :type partition: str
+    :param value: searched value
+    :type value: str
+    :return: False if the partition can't hold the value
+    :rtype: bool
+    """
+    if partition == value:
+        return True
+
+    # NULL partitions never match an equality filter
+    if partition == HIVE_DEFAULT_PARTITION:
+        return False
+
+    # Compare numbers by value so that 1 matches 01 or 1.0
+    try:
+        return float(partition) == float(value)
+    except ValueError:
+        return False
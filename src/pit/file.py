@@ -1,39 +1,59 @@
-import argparse
+import contextlib
 import json
+import glob
+import itertools
 import os
-import sys
 import typing as t
-from datetime import timedelta
+import uuid
 
 import duckdb
-import pandas as pd
-
-from .config import Config, ConfigAttribute
+import pyarrow as pa
 
+from . import profile
+from .cache import ResultCache
+from .dataset import is_dataset, is_glob, list_files, resolve
+from .helpers import arrow_table, quote_literal
+from .index import build as build_index, default_path as default_index, load as load_index, merge as merge_index, prune, save as save_index
+from .ingest import REMOTE_PREFIXES, json_source
+from .keys import build as build_keys, default_path as default_keys, lookup as lookup_keys
+from .manifest import expire, update as update_manifest
+from .metadata import MetadataCache, aggregate as footer_aggregate, summarize
+from .pool import ConnectionPool, track
+from .predicate import condition as predicate_condition, equalities, parse as parse_predicate
+from .query import aggregates as parse_aggregates, aggregation, copy_options, json_records, keyset, limit_offset, next_token, order_by, ordering, paging, parquet_files, parquet_source, projection, stream, tagged, tiebreak, visible, where, TIEBREAKER
+from .resources import settings
 
 class File:
     """
-    A class for loading and dumping data in JSON and Parquet formats using DuckDB and pandas.
+    A class for loading and dumping data in JSON and Parquet formats using DuckDB and Arrow.
     """
 
     @staticmethod
-    def connection(config: dict = dict()) -> duckdb.DuckDBPyConnection:
+    def connection(config: dict = dict(), database: str = ':memory:') -> duckdb.DuckDBPyConnection:
         """
-        Connect to S3 if credentials are provided
+        Connect to S3 if credentials are provided. The threads, memory
+        limit, spill directory and insertion order come from the config,
+        see :func:`pit.resources.settings`.
+        :param config: configuration
+        :type config: dict
+        :param database: path of the database, in memory by default
+        :type database: str
         :return: DuckDBPyConnection
         :rtype: duckdb.DuckDBPyConnection
         """
         # Create a connection to the database
-        connection = duckdb.connect(':memory:')
+        with profile.phase('connect'):
+            connection = duckdb.connect(database, config=settings(config))
 
         # Connect to S3 if credentials are provided
         if config.get('AWS_ACCESS_KEY_ID'):
-            # Install httpfs extension
-            if config.get('IS_OFFLINE'):
-                connection.execute("INSTALL httpfs;")
+            with profile.phase('httpfs'):
+                # Install httpfs extension
+                if config.get('IS_OFFLINE'):
+                    connection.execute("INSTALL httpfs;")
 
-            # Load httpfs extension
-            connection.execute("LOAD httpfs;")
+                # Load httpfs extension
+                connection.execute("LOAD httpfs;")
 
             # Connect to S3
             connection.execute(f"SET s3_region='{config.get('AWS_REGION')}';")
@@ -42,7 +62,7 @@ class File:
             connection.execute(
                 f"SET s3_secret_access_key='{config.get('AWS_SECRET_ACCESS_KEY')}';")
 
-            if config.get('s3_session_token'):
+            if config.get('AWS_SESSION_TOKEN'):
                 connection.execute(
                     f"SET s3_session_token='{config.get('AWS_SESSION_TOKEN')}';")
 
@@ -50,109 +70,1050 @@ class File:
         return connection
 
     @staticmethod
-    def dump(path: str, data: str, config: dict = dict()):
+    @contextlib.contextmanager
+    def cursor(config: dict = dict(), pool: t.Optional[ConnectionPool] = None) -> t.Iterator[duckdb.DuckDBPyConnection]:
+        """
+        Provide a ready-to-use connection, checked out from the pool if one
+        is given or freshly created otherwise
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :return: DuckDBPyConnection
+        :rtype: Iterator[duckdb.DuckDBPyConnection]
+        """
+        # Create a short-lived connection if no pool is used
+        if pool is None:
+            with File.connection(config) as connection, track(connection):
+                yield connection
+            return
+
+        # Check out a pooled cursor
+        with contextlib.ExitStack() as stack:
+            with profile.phase('checkout'):
+                connection = stack.enter_context(pool.cursor(config))
+            yield connection
+
+    @staticmethod
+    def identity(paths: list[str], config: dict = dict(), pool: t.Optional[ConnectionPool] = None) -> list[list]:
+        """
+        Get the identity of the files behind one or more parquet files or
+        datasets: the size and modification time of every file. Local files
+        are checked with a stat, remote files with a metadata request.
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :return: path, size and modification time of every file
+        :rtype: list[list]
+        """
+        files, _ = resolve(paths)
+
+        # Stat the local files, relative paths may be used from other directories
+        local: list[str] = [file for file in files if not file.startswith(REMOTE_PREFIXES)]
+        res: list[list] = [
+            [os.path.abspath(file), stat.st_size, stat.st_mtime_ns]
+            for file, stat in zip(local, map(os.stat, local))]
+
+        remote: list[str] = [file for file in files if file.startswith(REMOTE_PREFIXES)]
+        if remote:
+            with File.cursor(config, pool) as connection:
+                # Only the metadata is fetched as long as the content isn't selected
+                res += [list(row) for row in connection.execute(
+                    f"SELECT filename, size, epoch_ms(last_modified) "
+                    f"FROM read_blob([{', '.join([quote_literal(file) for file in remote])}]) "
+                    f"ORDER BY filename").fetchall()]
+
+        return res
+
+    @staticmethod
+    def dump(path: str, data: str, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, json_format: str = 'auto', sample_size: t.Optional[int] = None, columns: t.Optional[dict[str, str]] = None, partition_by: t.Optional[list[str]] = None, index_columns: t.Optional[list[str]] = None, append: bool = False, write_options: t.Optional[dict] = None):
+        """
+        Dumps json data to a parquet file. DuckDB reads the json directly and
+        streams it into the parquet file. With partition_by, a hive
+        partitioned dataset directory is written instead. Dumping to an
+        existing dataset directory replaces its files through its manifest.
+        With append, the
+        data is added to a dataset directory, see :meth:`File.append`.
+        :param path: path of the parquet file or dataset directory
+        :type path: str
+        :param data: path of a json file, ``-`` for stdin or a json document
+        :type data: str
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param json_format: json layout, one of ``auto``, ``array`` or
+                            ``newline_delimited``
+        :type json_format: str
+        :param sample_size: number of records used to infer the schema
+        :type sample_size: int
+        :param columns: explicit column types, replaces schema inference
+        :type columns: dict[str, str]
+        :param partition_by: columns to partition the dataset by
+        :type partition_by: list[str]
+        :param index_columns: columns to index after dumping
+        :type index_columns: list[str]
+        :param append: add the data to the dataset instead of overwriting it
+        :type append: bool
+        :param write_options: parquet write options, see :func:`query.copy_options`,
+                              and ``sort_by``, the columns to sort the records by
+        :type write_options: dict
+        """
+        if append:
+            return File.append(path, data, config, pool, json_format, sample_size, columns, partition_by, index_columns, write_options)
+
+        options: str = copy_options(write_options)
+        order: str = order_by((write_options or {}).get('sort_by'))
+
+        # Name the parts of this dump uniquely, so they can be told apart
+        # from the files of an existing dataset they replace
+        part: str = f"part-{uuid.uuid4().hex}"
+        replace: bool = not path.startswith(REMOTE_PREFIXES) and is_dataset(path)
+        previous: list[str] = list_files(path) if replace else []
+        target: str = os.path.join(path, part + '.parquet') if replace else path
+
+        # Write one directory per partition value
+        if partition_by:
+            target = path
+            options += f", PARTITION_BY ({projection(partition_by)}), " \
+                       f"OVERWRITE_OR_IGNORE true, FILENAME_PATTERN {quote_literal(part + '-{i}')}"
+
+        # Create a connection to storage
+        with File.cursor(config, pool) as connection, \
+                json_source(data, json_format, sample_size, columns) as source:
+
+            # Export the json data as a Parquet file
+            connection.execute(
+                f"COPY (SELECT * FROM {source}{order}) TO {quote_literal(target)} ({options})")
+
+        # Replace the files of the dataset with the parts of this dump. The
+        # replaced files stay on disk for running readers until they expire.
+        if replace:
+            written: list[str] = sorted(
+                os.path.relpath(file, path)
+                for file in glob.glob(os.path.join(glob.escape(path), '**', part + '*.parquet'), recursive=True))
+            update_manifest(path, add=written, remove=previous, files=lambda: previous)
+            expire(path)
+
+        # Index the written files
+        if index_columns:
+            File.index([path], index_columns, config, pool)
+
+    @staticmethod
+    def append(path: str, data: str, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, json_format: str = 'auto', sample_size: t.Optional[int] = None, columns: t.Optional[dict[str, str]] = None, partition_by: t.Optional[list[str]] = None, index_columns: t.Optional[list[str]] = None, write_options: t.Optional[dict] = None) -> dict:
         """
-        Dumps a json object to a parquet file
-        :param path: path of the parquet file
+        Appends json data to a dataset directory as new part files, without
+        reading or rewriting the existing files. The parts are published
+        atomically through the manifest of the dataset, so readers see all
+        or none of them. Remote datasets have no manifest, every part is
+        published by its upload.
+        :param path: path of the dataset directory
         :type path: str
-        :param data: json object to be dumped
-        :type data: dict
+        :param data: path of a json file, ``-`` for stdin or a json document
+        :type data: str
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param json_format: json layout, one of ``auto``, ``array`` or
+                            ``newline_delimited``
+        :type json_format: str
+        :param sample_size: number of records used to infer the schema
+        :type sample_size: int
+        :param columns: explicit column types, replaces schema inference
+        :type columns: dict[str, str]
+        :param partition_by: columns to partition the dataset by
+        :type partition_by: list[str]
+        :param index_columns: columns to index in the new parts
+        :type index_columns: list[str]
+        :param write_options: parquet write options, see :func:`query.copy_options`,
+                              and ``sort_by``, the columns to sort the records by
+        :type write_options: dict
+        :return: path of the dataset, the new parts and the number of rows
+        :rtype: dict
         """
+        remote: bool = path.startswith(REMOTE_PREFIXES)
+
+        # Parts can only be added to a directory
+        if not remote and os.path.exists(path) and not is_dataset(path):
+            raise ValueError(
+                "Invalid path. Data can only be appended to a dataset directory")
+
+        # Name the parts of this batch uniquely, so concurrent writers never collide
+        directory: str = path.rstrip('/') + '/' if remote else path
+        part: str = f"part-{uuid.uuid4().hex}"
+        if not remote:
+            os.makedirs(directory, exist_ok=True)
+
+        options: str = copy_options(write_options)
+        order: str = order_by((write_options or {}).get('sort_by'))
+
+        if partition_by:
+            target: str = directory
+            options += f", PARTITION_BY ({projection(partition_by)}), " \
+                       f"OVERWRITE_OR_IGNORE true, FILENAME_PATTERN {quote_literal(part + '-{i}')}"
+        else:
+            target = os.path.join(directory, part + '.parquet') if not remote else directory + part + '.parquet'
 
         # Create a connection to storage
-        with File.connection(config) as connection:
+        with File.cursor(config, pool) as connection, \
+                json_source(data, json_format, sample_size, columns) as source:
+
+            # Write the json data as new parts next to the existing files
+            rows: int = connection.execute(
+                f"COPY (SELECT * FROM {source}{order}) TO {quote_literal(target)} ({options})").fetchone()[0]
+
+            if remote:
+                return {'path': path, 'files': [target] if not partition_by else [], 'rows': rows}
+
+            # Find the parts of this batch
+            parts: list[str] = sorted(
+                os.path.relpath(file, directory)
+                for file in glob.glob(os.path.join(glob.escape(directory), '**', part + '*.parquet'), recursive=True))
+
+            # Publish the parts atomically
+            update_manifest(directory, add=parts, files=lambda: list_files(directory))
 
-            # Convert JSON object to pandas dataframe
-            df: pd.DataFrame = pd.read_json(
-                data, orient='records', dtype=False)
+            # Index the new parts only and merge them into the index of the dataset
+            if index_columns:
+                index_path: str = default_index(directory)
+                save_index(merge_index(load_index(index_path), build_index(
+                    connection, [os.path.join(directory, file) for file in parts], index_columns, index_path)), index_path)
 
-            # Export the table as a Parquet file
-            connection.query(
-                f"COPY df TO '{path}' (FORMAT PARQUET)")
+        return {'path': path, 'files': parts, 'rows': rows}
 
     @staticmethod
-    def retrieve(paths: list[str], config: dict = dict()) -> list[dict]:
+    def index(paths: list[str], columns: t.Optional[list[str]] = None, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, output: t.Optional[str] = None, key: t.Optional[str] = None) -> dict:
         """
-        Loads one or more parquet files and returns it as json object
-        :param paths: paths of parquet files
+        Index the min/max values and a bloom filter of some columns of one
+        or more parquet files, so that search can skip files that can't
+        match before opening them. With a key column, the position of every
+        key is indexed instead, so that searching a key reads only the row
+        group that holds it
+        :param paths: paths of parquet files or datasets
         :type paths: list[str]
+        :param columns: columns to index
+        :type columns: list[str]
         :param config: configuration
         :type config: dict
-        :return: merged records
-        :rtype: list[dict]
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param output: path of the index, defaults to next to a single path
+        :type output: str
+        :param key: key column to index the positions of
+        :type key: str
+        :return: path of the index and number of indexed files
+        :rtype: dict
         """
 
-        # Default result is empty list
-        res: list[dict] = []
+        # Throw an error if there is nothing to index
+        if not columns and not key:
+            raise ValueError("Invalid columns. Index needs columns or a key column")
+
+        # Store the index of a single path next to it
+        if output is None:
+            if len(paths) != 1:
+                raise ValueError(
+                    "Invalid output. An index of several paths needs an output path")
+
+            output = default_keys(paths[0]) if key else default_index(paths[0])
+
+        # Resolve datasets to their files
+        files, _ = resolve(paths)
+
+        # Create a connection to storage
+        with File.cursor(config, pool) as connection:
+
+            # Build and store the key index
+            if key:
+                return {'path': output, 'files': len(files), **build_keys(connection, files, key, output)}
+
+            # Build and store the index
+            save_index(build_index(connection, files, columns, output), output)
+
+        # Return a summary
+        return {'path': output, 'files': len(files)}
+
+    @staticmethod
+    def compact(path: str, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, target_size: int = 128 * 1024 * 1024, write_options: t.Optional[dict] = None, grace: float = 60.0) -> dict:
+        """
+        Merge the small files of a dataset into files of about the target
+        size, partition by partition. The new files are swapped in through
+        the manifest, so readers see either the old or the new files. The
+        replaced files are deleted by a later compaction once the grace
+        period passed. A single parquet file is rewritten and replaced.
+        :param path: path of the parquet file or dataset directory
+        :type path: str
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param target_size: size of the merged files in bytes, files of at
+                            least this size are left as they are
+        :type target_size: int
+        :param write_options: parquet write options, see :func:`query.copy_options`,
+                              and ``sort_by``, the columns to sort the records
+                              by, which rewrites all files
+        :type write_options: dict
+        :param grace: seconds replaced files are kept for running readers
+        :type grace: float
+        :return: number of files and bytes before and after the compaction
+        :rtype: dict
+        """
+        if path.startswith(REMOTE_PREFIXES):
+            raise ValueError(
+                "Invalid path. Only local files and datasets can be compacted")
+
+        sort_by: t.Optional[list[str]] = (write_options or {}).get('sort_by')
+        options: str = copy_options(write_options)
+        order: str = order_by(sort_by)
+
+        # Rewrite a single file next to it and replace it
+        if not is_dataset(path):
+            before: int = os.path.getsize(path)
+            temporary: str = os.path.join(os.path.dirname(path), f"_compact-{uuid.uuid4().hex}.parquet")
+
+            with File.cursor(config, pool) as connection:
+                connection.execute(
+                    f"COPY (SELECT * FROM {parquet_files([path])}{order}) TO {quote_literal(temporary)} ({options})")
+            os.replace(temporary, path)
+
+            return {
+                'path': path,
+                'before': {'files': 1, 'bytes': before},
+                'after': {'files': 1, 'bytes': os.path.getsize(path)},
+            }
+
+        # Delete the files replaced by earlier compactions
+        expire(path, grace)
+
+        files: list[str] = list_files(path)
+        sizes: dict[str, int] = {file: os.path.getsize(os.path.join(path, file)) for file in files}
+
+        # Group the files to merge by their partition directory
+        groups: dict[str, list[str]] = {}
+        for file in files:
+            if sizes[file] < target_size or sort_by:
+                groups.setdefault(os.path.dirname(file), []).append(file)
+
+        written: list[str] = []
+        replaced: list[str] = []
+
+        # Create a connection to storage
+        with File.cursor(config, pool) as connection:
+            for directory, group in sorted(groups.items()):
+                # A single file is only rewritten to sort it
+                if len(group) < 2 and not sort_by:
+                    continue
+
+                # Split the merged records into files of the target size, the
+                # partition columns stay in the directory names
+                part: str = f"compact-{uuid.uuid4().hex}"
+                connection.execute(
+                    f"COPY (SELECT * FROM {parquet_files([os.path.join(path, file) for file in group])}{order}) "
+                    f"TO {quote_literal(os.path.join(path, directory))} ({options}, FILE_SIZE_BYTES {int(target_size)}, "
+                    f"FILENAME_PATTERN {quote_literal(part + '-{i}')}, OVERWRITE_OR_IGNORE true)")
+
+                written += sorted(
+                    os.path.relpath(file, path)
+                    for file in glob.glob(os.path.join(glob.escape(os.path.join(path, directory)), part + '-*.parquet')))
+                replaced += group
+
+            # Swap the merged files in atomically
+            current: list[str] = update_manifest(path, add=written, remove=replaced, files=lambda: list_files(path))
+
+            # Index the merged files like the files they replace
+            index_path: str = default_index(path)
+            index: t.Optional[dict] = load_index(index_path)
+            if index is not None and written:
+                index = merge_index(index, build_index(
+                    connection, [os.path.join(path, file) for file in written], list(index['columns']), index_path))
+                save_index({**index, 'files': {
+                    file: entry for file, entry in index['files'].items() if file not in replaced}}, index_path)
+
+        # Delete the replaced files right away if there is no grace period
+        expire(path, grace)
+
+        return {
+            'path': path,
+            'before': {'files': len(files), 'bytes': sum(sizes.values())},
+            'after': {'files': len(current), 'bytes': sum(os.path.getsize(os.path.join(path, file)) for file in current)},
+        }
+
+    @staticmethod
+    def relation(connection: duckdb.DuckDBPyConnection, paths: list[str], column_value_pairs: t.Optional[dict[str, str]] = None, columns: t.Optional[list[str]] = None, index: t.Optional[str] = None, metadata: t.Optional[MetadataCache] = None, filename: bool = False, page: t.Optional[dict] = None, predicate: t.Optional[t.Union[str, list]] = None) -> duckdb.DuckDBPyRelation:
+        """
+        Build the relation over one or more parquet files, optionally
+        filtered by column value pairs and a predicate and projected to
+        some columns. The predicate is compiled to typed comparisons, so
+        ranges, IN lists and prefixes skip row groups like equalities do.
+        A page is pushed into the query, so DuckDB stops scanning once it
+        has the records of the page. Pages ordered by some columns start
+        after the values the previous page ended with, which skips the row
+        groups before instead of reading and dropping an offset.
+        Several files are merged by column name, so files whose schema
+        drifted are read together and missing columns are NULL.
+        Files that can't match according to their index are not read.
+        If a key index covers a searched column, only the row groups that
+        hold the key are read.
+        With a metadata cache, the schema and the row group statistics are
+        taken from the cached footers and files that can't match are not
+        read either.
+        :param connection: connection to storage
+        :type connection: duckdb.DuckDBPyConnection
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param filename: add a ``filename`` column with the file of every record
+        :type filename: bool
+        :param page: page of the records to return, see :func:`pit.query.paging`
+        :type page: dict
+        :param predicate: predicate the records match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: relation of the matching records
+        :rtype: duckdb.DuckDBPyRelation
+        """
+        tree: t.Optional[list] = parse_predicate(predicate)
+
+        # Equalities every match fulfills rule out files like column value pairs
+        searched: dict[str, str] = {**equalities(tree), **(column_value_pairs or {})}
+
+        # Resolve datasets to the files of the partitions that can match
+        files, partitioned = resolve(paths, searched)
+        profile.count('files_resolved', len(files))
+
+        # Drop the files that can't match according to their index
+        files = prune(files, searched, [index] if index else [default_index(path) for path in paths])
+        profile.count('files_after_index', len(files))
+
+        # Drop the files whose row group statistics rule out a match
+        if metadata is not None:
+            files = metadata.prune(connection, files, searched)
+            profile.count('files_after_statistics', len(files))
+
+        # Order the records with equal values by their position in the files,
+        # the columns are hidden unless the file names are requested
+        tiebreaker: list[str] = ['filename', 'file_row_number'] if page is not None and page['order_by'] else []
+        hidden: list[str] = [column for column in tiebreaker if column != 'filename' or not filename]
+
+        # Read only the row groups that hold the key if it is indexed
+        source: t.Optional[str] = None
+        if not filename and not tiebreaker:
+            with profile.phase('keys'):
+                source = lookup_keys(files, searched, [default_keys(path) for path in paths])
+            profile.count('key_lookup', source is not None)
+
+        # Read the parquet files as a single relation
+        if source is None:
+            source = parquet_source(
+                files, partitioned, len(files) > 1 or any(is_glob(file) for file in files), filename or bool(tiebreaker), bool(tiebreaker))
+
+        # Return all records if there is nothing to search for
+        if not column_value_pairs and tree is None and not columns and page is None:
+            return connection.sql(f"SELECT * FROM {source}")
+
+        # Get the column types from the cached footers or the parquet schema
+        if metadata is not None:
+            types: dict[str, str] = metadata.types(connection, files, partitioned)
+            if filename or tiebreaker:
+                types = {**types, 'filename': 'VARCHAR'}
+            if tiebreaker:
+                types = {**types, 'file_row_number': 'BIGINT'}
+        else:
+            rel = connection.sql(f"SELECT * FROM {source}")
+            types = {column: str(type) for column, type in zip(rel.columns, rel.types)}
+
+        # Compare typed values, so the filters are pushed into the scan
+        condition = where(column_value_pairs or {}, types)
+        if tree is not None:
+            condition = f"{condition} AND {predicate_condition(tree, types)}"
+        select: str = projection(columns)
+        clauses: str = ''
+
+        if page is not None:
+            # Reject columns that don't exist instead of ordering by nothing
+            for column in page['order_by'] or []:
+                if column not in types or column in hidden:
+                    raise ValueError(f"Invalid column. Column {column} does not exist")
+
+            # Return the order by columns, the next page starts after their values
+            if columns and page['order_by']:
+                columns = [*columns, *[column for column in page['order_by'] if column not in columns]]
+
+            # Start after the values and the record the previous page ended with
+            if page['after'] is not None:
+                keys: list[str] = [*page['order_by'], *(tiebreaker if page['tie'] is not None else [])]
+                condition = f"{condition} AND {keyset(keys, [*page['after'], *(page['tie'] or [])], types)}"
+
+            # Return the tiebreaker under hidden names instead of its columns
+            if tiebreaker:
+                select = projection(columns) if columns else f"* EXCLUDE ({projection(hidden)})"
+                select = f"{select}, {tiebreak(tiebreaker)}"
+                clauses = ordering(page['order_by'], tiebreaker)
+            else:
+                clauses = order_by(page['order_by'])
+
+            clauses += limit_offset(page['limit'], page['offset'])
+
+        # Read only the requested columns of the matching row groups
+        return connection.sql(
+            f"SELECT {select} FROM {source} WHERE {condition}{clauses}")
+
+    @staticmethod
+    def probe(page: t.Optional[dict]) -> t.Optional[dict]:
+        """
+        Get the page with one more record, which tells if there is a next page
+        :param page: page of the records to return
+        :type page: dict
+        :return: page to query
+        :rtype: dict
+        """
+        if page is None or page['limit'] is None:
+            return page
+
+        return {**page, 'limit': page['limit'] + 1}
+
+    @staticmethod
+    def records(table: pa.Table, page: t.Optional[dict] = None) -> t.Union[list[dict], dict]:
+        """
+        Parse the records serialized to json by :func:`json_records`
+        :param table: table of the serialized records, with one more record
+                      than the limit of the page if there is a next page
+        :type table: pa.Table
+        :param page: page of the records
+        :type page: dict
+        :return: records, or ``records`` and the ``next`` token of a page
+        :rtype: list[dict] | dict
+        """
+        # Parse all records at once as a single json array
+        records: list[dict] = json.loads('[' + ','.join(table.column('record').to_pylist()) + ']')
+        if page is None:
+            return records
+
+        # Take the hidden tiebreaker of an ordered page off the records
+        ties: list[list] = [
+            [record.pop(column) for column in [column for column in record if column.startswith(TIEBREAKER)]]
+            for record in records]
 
-        # Convert paths to a string
-        path_str: str = ', '.join(
-            ['\'' + path + '\'' for path in paths])
+        # Drop the record that only tells if there is a next page
+        more: bool = page['limit'] is not None and len(records) > page['limit']
+        records = records[:page['limit']]
+
+        return {
+            'records': records,
+            'next': next_token(page, records[-1] if more else None, len(records), ties[len(records) - 1] if more and ties[0] else None),
+        }
+
+    @staticmethod
+    def retrieve(paths: list[str], config: dict = dict(), pool: t.Optional[ConnectionPool] = None, columns: t.Optional[list[str]] = None, cache: t.Optional[ResultCache] = None, metadata: t.Optional[MetadataCache] = None, filename: bool = False, limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None) -> t.Union[list[dict], dict]:
+        """
+        Loads one or more parquet files and returns it as json object.
+        If a page is requested, the records come with the continuation
+        token of the next page.
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param cache: cache of the results
+        :type cache: ResultCache
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param filename: add a ``filename`` column with the file of every record
+        :type filename: bool
+        :param limit: maximum number of records, all if empty
+        :type limit: int
+        :param offset: number of records to skip
+        :type offset: int
+        :param order_by: columns to order the records by
+        :type order_by: list[str]
+        :param after: values of the order by columns the records start after
+        :type after: list[Any]
+        :param page_token: continuation token of the previous page
+        :type page_token: str
+        :return: merged records, or ``records`` and the ``next`` token of a page
+        :rtype: list[dict] | dict
+        """
+
+        # Collect the page of records to return
+        page: t.Optional[dict] = paging(limit, offset, order_by, after, page_token)
+
+        # Return the cached result as long as the files didn't change
+        if cache is not None:
+            with profile.phase('cache'):
+                key: str = cache.key(
+                    'retrieve', File.identity(paths, config, pool), columns, filename, page)
+                cached: t.Optional[t.Union[list[dict], dict]] = cache.get(key)
+            profile.count('cache_hit', cached is not None)
+            if cached is not None:
+                return cached
+
+        # Default result is empty list
+        res: t.Union[list[dict], dict] = []
 
         # Create a connection to storage
-        with File.connection(config) as connection:
+        with File.cursor(config, pool) as connection:
 
             # Loading parquet files into duckdb
-            rel = connection.from_query(f"SELECT * FROM {path_str}")
+            with profile.phase('plan'):
+                rel = File.relation(connection, paths, columns=columns, metadata=metadata, filename=filename, page=File.probe(page))
 
-            # Will be available in the next release of DuckDB
-            # rel = connection.from_parquet(paths)
+            # Run the query, DuckDB serializes the rows
+            with profile.phase('scan'), profile.explain(connection):
+                table = json_records(rel)
 
-            # Convert rel to dataframe
-            df: pd.DataFrame = rel.to_df()
+        # Parse the serialized rows
+        with profile.phase('to_json'):
+            res = File.records(table, page)
 
-            # Convert rel to list of dictionary
-            res = json.loads(rel.to_df().to_json(orient='records'))
+        if cache is not None:
+            cache.put(key, res)
 
         # Return the result
         return res
 
     @staticmethod
-    def search(paths: list[str], column_value_pairs: dict[str, str], config: dict = dict()) -> list[dict]:
+    def search(paths: list[str], column_value_pairs: t.Optional[dict[str, str]] = None, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, columns: t.Optional[list[str]] = None, index: t.Optional[str] = None, cache: t.Optional[ResultCache] = None, metadata: t.Optional[MetadataCache] = None, filename: bool = False, limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None, predicate: t.Optional[t.Union[str, list]] = None) -> t.Union[list[dict], dict]:
         """
-        Search specific values in specific columns of one or more parquet files
-        :param paths: paths of parquet files
+        Search specific values in specific columns of one or more parquet files,
+        or the records that match a predicate such as ``age >= 18 and city in
+        ('Graz', 'Wien')``. If a page is requested, the records come with the continuation
+        token of the next page.
+        :param paths: paths of parquet files or datasets
         :type paths: list[str]
         :param column_value_pairs: column value pairs to search for
         :type column_value_pairs: dict[str, str]
         :param config: configuration
         :type config: dict
-        :return: merged records that match the search criteria
-        :rtype: list[dict]
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param cache: cache of the results
+        :type cache: ResultCache
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param filename: add a ``filename`` column with the file of every record
+        :type filename: bool
+        :param limit: maximum number of records, all if empty
+        :type limit: int
+        :param offset: number of records to skip
+        :type offset: int
+        :param order_by: columns to order the records by
+        :type order_by: list[str]
+        :param after: values of the order by columns the records start after
+        :type after: list[Any]
+        :param page_token: continuation token of the previous page
+        :type page_token: str
+        :param predicate: predicate the records match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: merged records that match the search criteria, or ``records``
+                 and the ``next`` token of a page
+        :rtype: list[dict] | dict
         """
 
+        # Collect the page of records to return
+        page: t.Optional[dict] = paging(limit, offset, order_by, after, page_token)
+        tree: t.Optional[list] = parse_predicate(predicate)
+
+        # Return the cached result as long as the files didn't change
+        if cache is not None:
+            with profile.phase('cache'):
+                key: str = cache.key(
+                    'search', File.identity(paths, config, pool), column_value_pairs, columns, filename, page, tree)
+                cached: t.Optional[t.Union[list[dict], dict]] = cache.get(key)
+            profile.count('cache_hit', cached is not None)
+            if cached is not None:
+                return cached
+
         # Default result is empty list
-        res: list[dict] = []
+        res: t.Union[list[dict], dict] = []
+
+        # Create a connection to storage
+        with File.cursor(config, pool) as connection:
+
+            # Loading and filtering parquet files in duckdb
+            with profile.phase('plan'):
+                rel = File.relation(connection, paths, column_value_pairs, columns, index, metadata, filename, File.probe(page), tree)
 
-        # Convert paths to a string
-        path_str: str = ', '.join(
-            ['\'' + path + '\'' for path in paths])
+            # Run the query, DuckDB serializes the rows
+            with profile.phase('scan'), profile.explain(connection):
+                table = json_records(rel)
+
+        # Parse the serialized rows
+        with profile.phase('to_json'):
+            res = File.records(table, page)
+
+        if cache is not None:
+            cache.put(key, res)
+
+        # Return the result
+        return res
+
+    @staticmethod
+    def table(paths: list[str], column_value_pairs: t.Optional[dict[str, str]] = None, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, columns: t.Optional[list[str]] = None, index: t.Optional[str] = None, metadata: t.Optional[MetadataCache] = None, filename: bool = False, limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None, predicate: t.Optional[t.Union[str, list]] = None) -> pa.Table:
+        """
+        Loads the records of one or more parquet files as Arrow table,
+        without any pandas or json conversion
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param filename: add a ``filename`` column with the file of every record
+        :type filename: bool
+        :param limit: maximum number of records, all if empty
+        :type limit: int
+        :param offset: number of records to skip
+        :type offset: int
+        :param order_by: columns to order the records by
+        :type order_by: list[str]
+        :param after: values of the order by columns the records start after
+        :type after: list[Any]
+        :param page_token: continuation token of the previous page
+        :type page_token: str
+        :param predicate: predicate the records match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: table of the matching records
+        :rtype: pa.Table
+        """
 
         # Create a connection to storage
-        with File.connection(config) as connection:
+        with File.cursor(config, pool) as connection:
 
-            # Loading parquet files into duckdb
-            rel = connection.from_query(f"SELECT * FROM {path_str}")
+            with profile.phase('plan'):
+                rel = File.relation(
+                    connection, paths, column_value_pairs, columns, index, metadata, filename,
+                    paging(limit, offset, order_by, after, page_token), predicate)
 
-            # Will be available in the next release of DuckDB
-            # rel = connection.from_parquet(paths)
+            # Fetch the relation as Arrow table
+            with profile.phase('scan'), profile.explain(connection):
+                return arrow_table(visible(rel))
 
-            # Get unique columns with types of rel object
-            rel_collums: dict[str, str] = dict(
-                set(zip(rel.columns, rel.types)))
+    @staticmethod
+    def reader(paths: list[str], column_value_pairs: t.Optional[dict[str, str]] = None, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, columns: t.Optional[list[str]] = None, index: t.Optional[str] = None, metadata: t.Optional[MetadataCache] = None, batch_size: int = 10000, as_json: bool = False, filename: bool = False, limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None, predicate: t.Optional[t.Union[str, list]] = None) -> pa.RecordBatchReader:
+        """
+        Stream the records of one or more parquet files as Arrow record
+        batches. Only one batch is held in memory at a time. The connection
+        stays checked out until the reader is exhausted or closed.
+        If as_json is set, every batch holds a single ``record`` column with
+        the records serialized to json by DuckDB.
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param batch_size: maximum number of rows per batch
+        :type batch_size: int
+        :param as_json: serialize the records to json
+        :type as_json: bool
+        :param filename: add a ``filename`` column with the file of every record
+        :type filename: bool
+        :param limit: maximum number of records, all if empty
+        :type limit: int
+        :param offset: number of records to skip
+        :type offset: int
+        :param order_by: columns to order the records by
+        :type order_by: list[str]
+        :param after: values of the order by columns the records start after
+        :type after: list[Any]
+        :param page_token: continuation token of the previous page
+        :type page_token: str
+        :param predicate: predicate the records match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: reader of the matching records
+        :rtype: pa.RecordBatchReader
+        """
 
-            # Create query to get only unique columns from rel object
-            query: str = f'SELECT {",".join(rel_collums.keys())} FROM rel_view'
+        # Collect the page of records to return
+        page: t.Optional[dict] = paging(limit, offset, order_by, after, page_token)
 
-            # Get rel object with only unique columns
-            rel = rel.query('rel_view', query)
+        # Stream the relation while the connection stays checked out
+        return stream(
+            File.cursor(config, pool),
+            lambda connection: visible(File.relation(connection, paths, column_value_pairs, columns, index, metadata, filename, page, predicate)),
+            batch_size, as_json)
 
-            # Filter rel for each column value pair
-            rel = rel.filter(' AND '.join(
-                [f"{key}='{column_value_pairs[key]}'" for key in column_value_pairs.keys()]))
+    @staticmethod
+    def batch_relation(connection: duckdb.DuckDBPyConnection, paths: list[str], queries: list[tuple[t.Any, dict[str, str]]], columns: t.Optional[list[str]] = None, index: t.Optional[str] = None, metadata: t.Optional[MetadataCache] = None, filename: bool = False) -> duckdb.DuckDBPyRelation:
+        """
+        Build the relation that answers several searches over the same
+        parquet files with a single scan. Only the files that can match any
+        of the searches are read.
+        :param connection: connection to storage
+        :type connection: duckdb.DuckDBPyConnection
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param queries: ids and column value pairs of the searches
+        :type queries: list[tuple[Any, dict[str, str]]]
+        :param columns: columns to return, all columns if empty
+        :type columns: list[str]
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param filename: add a ``filename`` column with the file of every record
+        :type filename: bool
+        :return: relation of the ``id`` of the search and the matching ``record``
+        :rtype: duckdb.DuckDBPyRelation
+        """
+        index_paths: list[str] = [index] if index else [default_index(path) for path in paths]
 
-            # Convert rel to list of dictionary
-            res = json.loads(rel.to_df().to_json(orient='records'))
+        # Collect the files that can match any of the searches
+        files: dict[str, None] = {}
+        partitioned: bool = False
+        for _, column_value_pairs in queries:
+            matches, partitioned = resolve(paths, column_value_pairs)
+            matches = prune(matches, column_value_pairs, index_paths)
+            if metadata is not None:
+                matches = metadata.prune(connection, matches, column_value_pairs)
+            files.update(dict.fromkeys(matches))
+
+        # Read the parquet files as a single relation
+        source: str = parquet_source(
+            list(files), partitioned, len(files) > 1 or any(is_glob(file) for file in files), filename)
+
+        # Get the column types from the cached footers or the parquet schema
+        if metadata is not None:
+            types: dict[str, str] = metadata.types(connection, list(files), partitioned)
+            if filename:
+                types = {**types, 'filename': 'VARCHAR'}
+        else:
+            rel = connection.sql(f"SELECT * FROM {source}")
+            types = {column: str(type) for column, type in zip(rel.columns, rel.types)}
+
+        return connection.sql(tagged(source, queries, types, columns))
+
+    @staticmethod
+    def batch_reader(queries: list[dict], config: dict = dict(), pool: t.Optional[ConnectionPool] = None, index: t.Optional[str] = None, metadata: t.Optional[MetadataCache] = None, batch_size: int = 10000) -> pa.RecordBatchReader:
+        """
+        Stream the results of a batch of searches as json. Searches over
+        the same paths are answered by a single scan, every line holds the
+        ``id`` of a search and a ``record`` it matched.
+        :param queries: searches with ``id``, ``paths``, ``column_value_pairs``
+                        and optionally ``columns`` and ``filename``
+        :type queries: list[dict]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param batch_size: maximum number of rows per batch
+        :type batch_size: int
+        :return: reader of the json lines in a single ``record`` column
+        :rtype: pa.RecordBatchReader
+        """
+        # Group the searches that read the same files in the same shape
+        groups: dict[tuple, list[tuple[t.Any, dict[str, str]]]] = {}
+        for query in queries:
+            key = (tuple(query['paths']), tuple(query.get('columns') or ()), bool(query.get('filename')))
+            groups.setdefault(key, []).append((query['id'], query['column_value_pairs']))
+        profile.count('scans', len(groups))
+
+        # Scan the groups one after another, each on its own connection
+        def scan() -> t.Iterator[pa.RecordBatchReader]:
+            for (paths, columns, filename), group in groups.items():
+                yield stream(
+                    File.cursor(config, pool),
+                    lambda connection: File.batch_relation(
+                        connection, list(paths), group, list(columns), index, metadata, filename),
+                    batch_size, as_json=True)
+
+        # Take the schema from the first group, the others share it
+        readers: t.Iterator[pa.RecordBatchReader] = scan()
+        first: pa.RecordBatchReader = next(readers)
+
+        return pa.RecordBatchReader.from_batches(
+            first.schema, itertools.chain.from_iterable(itertools.chain([first], readers)))
+
+    @staticmethod
+    def batch(queries: list[dict], config: dict = dict(), pool: t.Optional[ConnectionPool] = None, index: t.Optional[str] = None, metadata: t.Optional[MetadataCache] = None) -> list[dict]:
+        """
+        Run a batch of searches, see :meth:`batch_reader`
+        :param queries: searches with ``id``, ``paths``, ``column_value_pairs``
+                        and optionally ``columns`` and ``filename``
+        :type queries: list[dict]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :return: id and matching records of every search, in the order of the searches
+        :rtype: list[dict]
+        """
+        # Every search gets an entry, even without matches
+        results: dict[str, dict] = {
+            json.dumps(query['id']): {'id': query['id'], 'results': []} for query in queries}
+
+        for batch in File.batch_reader(queries, config, pool, index, metadata):
+            for line in batch.column(0).to_pylist():
+                res: dict = json.loads(line)
+                results[json.dumps(res['id'])]['results'].append(res['record'])
+
+        return list(results.values())
+
+    @staticmethod
+    def aggregate(paths: list[str], aggregates: list[str], group_by: t.Optional[list[str]] = None, column_value_pairs: t.Optional[dict[str, str]] = None, config: dict = dict(), pool: t.Optional[ConnectionPool] = None, index: t.Optional[str] = None, cache: t.Optional[ResultCache] = None, metadata: t.Optional[MetadataCache] = None, predicate: t.Optional[t.Union[str, list]] = None) -> list[dict]:
+        """
+        Aggregate the matching records of one or more parquet files inside
+        DuckDB and return only the aggregated rows. Counts and the min/max
+        of integer columns over all records are answered from the cached
+        footers without reading any data page.
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param aggregates: aggregates such as ``count``, ``sum(amount)`` or
+                           ``approx_count_distinct(user)``
+        :type aggregates: list[str]
+        :param group_by: columns to group by, one row if empty
+        :type group_by: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param index: path of an index, defaults to the indexes next to the paths
+        :type index: str
+        :param cache: cache of the results
+        :type cache: ResultCache
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :param predicate: predicate the records match, see :class:`pit.predicate.Parser`
+        :type predicate: str | list
+        :return: a row per group with the group by columns and the aggregates
+        :rtype: list[dict]
+        """
+        parsed: list[tuple[str, t.Optional[str]]] = parse_aggregates(aggregates)
+        tree: t.Optional[list] = parse_predicate(predicate)
+
+        # Return the cached result as long as the files didn't change
+        if cache is not None:
+            with profile.phase('cache'):
+                key: str = cache.key(
+                    'aggregate', File.identity(paths, config, pool), parsed, group_by, column_value_pairs, tree)
+                cached: t.Optional[list[dict]] = cache.get(key)
+            profile.count('cache_hit', cached is not None)
+            if cached is not None:
+                return cached
+
+        # Create a connection to storage
+        with File.cursor(config, pool) as connection:
+
+            # Answer a single row over all records from the footers
+            res: t.Optional[list[dict]] = None
+            if metadata is not None and not group_by and not column_value_pairs and tree is None:
+                with profile.phase('footers'):
+                    files, _ = resolve(paths)
+                    if not any(is_glob(file) for file in files):
+                        row = footer_aggregate([metadata.file(connection, file) for file in files], parsed)
+                        res = None if row is None else [row]
+                profile.count('answered_from_footers', res is not None)
+
+            if res is None:
+                with profile.phase('plan'):
+                    rel = File.relation(connection, paths, column_value_pairs, index=index, metadata=metadata, predicate=tree)
+                    types: dict[str, str] = {column: str(type) for column, type in zip(rel.columns, rel.types)}
+
+                    # Group and aggregate the filtered relation, ordered by the groups
+                    rel = rel.aggregate(aggregation(parsed, group_by, types), projection(group_by) if group_by else '')
+                    if group_by:
+                        rel = rel.order(projection(group_by))
+
+                # Run the query, DuckDB serializes the rows
+                with profile.phase('scan'), profile.explain(connection):
+                    table = json_records(rel)
+
+                # Parse the serialized rows
+                with profile.phase('to_json'):
+                    res = [json.loads(record) for record in table.column('record').to_pylist()]
+
+        if cache is not None:
+            cache.put(key, res)
 
         # Return the result
         return res
+
+    @staticmethod
+    def describe(paths: list[str], config: dict = dict(), pool: t.Optional[ConnectionPool] = None, metadata: t.Optional[MetadataCache] = None) -> dict:
+        """
+        Describe one or more parquet files from their footers: the schema,
+        the row counts and the bounds and null counts of every column per
+        file. Cached footers are answered without reading the files.
+        :param paths: paths of parquet files or datasets
+        :type paths: list[str]
+        :param config: configuration
+        :type config: dict
+        :param pool: connection pool
+        :type pool: ConnectionPool
+        :param metadata: cache of the parquet footers
+        :type metadata: MetadataCache
+        :return: schema, number of rows and the summary of every file
+        :rtype: dict
+        """
+        # Read the footers once if there is no cache to keep them in
+        metadata = metadata or MetadataCache()
+
+        # Resolve datasets to their files
+        files, partitioned = resolve(paths)
+
+        # Create a connection to storage
+        with File.cursor(config, pool) as connection:
+
+            # Expand the globs of remote datasets to their files
+            expanded: list[str] = []
+            for file in files:
+                if '*' in file:
+                    expanded += [row[0] for row in connection.execute(
+                        f"SELECT file FROM glob({quote_literal(file)}) ORDER BY file").fetchall()]
+                else:
+                    expanded.append(file)
+
+            summaries: list[dict] = [
+                summarize(file, metadata.file(connection, file)) for file in expanded]
+            schema: dict[str, str] = metadata.types(connection, files, partitioned)
+
+        # Return the summary
+        return {
+            'schema': schema,
+            'num_rows': sum([summary['num_rows'] for summary in summaries]),
+            'files': summaries,
+        }
@@ -1,6 +1,36 @@
+import importlib
 import os
 import pkgutil
 import sys
+import typing as t
+
+
+def import_string(import_name: str) -> t.Any:
+    """Import an object based on a string in the ``module:object`` form.
+
+    :meta private:
+    """
+    module_name, _, obj_name = import_name.partition(":")
+    module = importlib.import_module(module_name)
+
+    return getattr(module, obj_name) if obj_name else module
+
+
+class ImportAttribute:
+    """Class attribute that imports its object on first access, so that
+    heavy dependencies are only loaded when they are actually used.
+
+    :meta private:
+    """
+
+    def __init__(self, import_name: str) -> None:
+        self.import_name = import_name
+        self.value: t.Any = None
+
+    def __get__(self, obj: t.Any, owner: t.Any = None) -> t.Any:
+        if self.value is None:
+            self.value = import_string(self.import_name)
+        return self.value
 
 
 def get_root_path(import_name: str) -> str:
@@ -50,3 +80,43 @@ def get_root_path(import_name: str) -> str:
 
     # filepath is import_name.py for a module, or __init__.py for a package.
     return os.path.dirname(os.path.abspath(filepath))
+
+
+def record_batch_reader(rel: t.Any, batch_size: int) -> t.Any:
+    """Stream a DuckDB relation as a :class:`pyarrow.RecordBatchReader`.
+    DuckDB 1.5 renamed ``fetch_record_batch`` to ``to_arrow_reader``.
+
+    :meta private:
+    """
+    if hasattr(rel, "to_arrow_reader"):
+        return rel.to_arrow_reader(batch_size)
+
+    return rel.fetch_record_batch(batch_size)
+
+
+def arrow_table(rel: t.Any) -> t.Any:
+    """Materialize a DuckDB relation as a :class:`pyarrow.Table`.
+    DuckDB 1.5 renamed ``arrow`` to ``to_arrow_table``.
+
+    :meta private:
+    """
+    if hasattr(rel, "to_arrow_table"):
+        return rel.to_arrow_table()
+
+    return rel.arrow()
+
+
+def quote_literal(value: str) -> str:
+    """Quote a value as SQL string literal.
+
+    :meta private:
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a column or table name as SQL identifier.
+
+    :meta private:
+    """
+    return '"' + str(name).replace('"', '""') + '"'
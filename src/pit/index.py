@@ -0,0 +1,390 @@
+import base64
+import hashlib
+import json
+import math
+import os
+import typing as t
+
+import duckdb
+
+from .dataset import is_dataset
+from .helpers import quote_identifier, quote_literal
+from .ingest import REMOTE_PREFIXES
+
+#: Version of the index layout.
+INDEX_VERSION = 1
+
+#: Name of the index file inside a dataset directory.
+DATASET_INDEX = '_pit_index.json'
+
+#: Suffix of the index file next to a parquet file.
+FILE_INDEX_SUFFIX = '.pitindex.json'
+
+#: Column types that can be indexed, by the python type they compare as.
+INTEGER_TYPES = {'TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT',
+                 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT', 'UHUGEINT'}
+FLOAT_TYPES = {'FLOAT', 'DOUBLE'}
+STRING_TYPES = {'VARCHAR'}
+
+
+class Bloom:
+    """
+    A bloom filter over the string form of column values.
+    """
+
+    def __init__(self, size: int, hashes: int, bits: t.Optional[bytearray] = None):
+        """
+        Initialize an empty bloom filter
+        :param size: number of bits
+        :type size: int
+        :param hashes: number of hash functions
+        :type hashes: int
+        :param bits: bits of an existing filter
+        :type bits: bytearray
+        """
+        self.size = size
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float = 0.01) -> 'Bloom':
+        """
+        Create a bloom filter sized for a number of distinct values
+        :param capacity: expected number of distinct values
+        :type capacity: int
+        :param false_positive_rate: accepted rate of false positives
+        :type false_positive_rate: float
+        :return: empty bloom filter
+        :rtype: Bloom
+        """
+        capacity = max(capacity, 1)
+        size = max(int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2), 8)
+        hashes = max(int(round(size / capacity * math.log(2))), 1)
+
+        return cls(size, hashes)
+
+    def _positions(self, value: str) -> t.Iterator[int]:
+        """
+        Yield the bit positions of a value using double hashing
+        :param value: string form of the value
+        :type value: str
+        :return: bit positions
+        :rtype: Iterator[int]
+        """
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, value: str) -> None:
+        """
+        Add a value to the filter
+        :param value: string form of the value
+        :type value: str
+        """
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+    def to_dict(self) -> dict:
+        return {
+            'size': self.size,
+            'hashes': self.hashes,
+            'bits': base64.b64encode(bytes(self.bits)).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Bloom':
+        return cls(data['size'], data['hashes'], bytearray(base64.b64decode(data['bits'])))
+
+
+def default_path(path: str) -> str:
+    """
+    Get the default location of the index of a parquet file or dataset
+    :param path: path of a parquet file or dataset
+    :type path: str
+    :return: path of the index
+    :rtype: str
+    """
+    if is_dataset(path):
+        return os.path.join(path, DATASET_INDEX)
+
+    return path + FILE_INDEX_SUFFIX
+
+
+def convert(value: t.Any, type: str) -> t.Any:
+    """
+    Convert a value to the python type its column compares as
+    :param value: value or its string form
+    :type value: Any
+    :param type: DuckDB type of the column
+    :type type: str
+    :return: comparable value, None if the value can't be converted
+    :rtype: Any
+    """
+    if value is None:
+        return None
+
+    try:
+        if type in INTEGER_TYPES:
+            return int(value)
+        if type in FLOAT_TYPES or type.startswith('DECIMAL'):
+            return float(value)
+        if type in STRING_TYPES:
+            return str(value)
+    except (TypeError, ValueError):
+        pass
+
+    return None
+
+
+def _identity(path: str) -> t.Optional[dict]:
+    """
+    Get the size and modification time of a local file
+    :param path: path of the file
+    :type path: str
+    :return: identity of the file, None for remote files
+    :rtype: dict
+    """
+    if path.startswith(REMOTE_PREFIXES):
+        return None
+
+    stat = os.stat(path)
+
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def _key(path: str, index_path: str) -> str:
+    """
+    Get the key of a file in an index, relative to the index for local files
+    :param path: path of the file
+    :type path: str
+    :param index_path: path of the index
+    :type index_path: str
+    :return: key of the file
+    :rtype: str
+    """
+    if path.startswith(REMOTE_PREFIXES):
+        return path
+
+    return os.path.relpath(path, os.path.dirname(os.path.abspath(index_path)))
+
+
+def build(connection: duckdb.DuckDBPyConnection, files: list[str], columns: list[str], index_path: str, false_positive_rate: float = 0.01) -> dict:
+    """
+    Build an index that records the per-file and per-row-group min/max values
+    and a per-file bloom filter of the given columns
+    :param connection: connection to storage
+    :type connection: duckdb.DuckDBPyConnection
+    :param files: paths of parquet files
+    :type files: list[str]
+    :param columns: columns to index
+    :type columns: list[str]
+    :param index_path: path the index is saved to
+    :type index_path: str
+    :param false_positive_rate: accepted false positive rate of the bloom filters
+    :type false_positive_rate: float
+    :return: index
+    :rtype: dict
+    """
+    index: dict = {'version': INDEX_VERSION, 'columns': {}, 'files': {}}
+
+    for file in files:
+        source: str = f"read_parquet([{quote_literal(file)}])"
+
+        # Get the column types from the parquet schema
+        rel = connection.sql(f"SELECT * FROM {source}")
+        types: dict[str, str] = {
+            column: str(type) for column, type in zip(rel.columns, rel.types)}
+
+        for column in columns:
+            if convert('0', types.get(column, '')) is None:
+                raise ValueError(
+                    f"Invalid column. Column {column} of {file} can't be indexed")
+
+            index['columns'][column] = types[column]
+
+        # Read the row group statistics from the parquet footer
+        statistics = connection.execute(
+            "SELECT row_group_id, row_group_num_rows, path_in_schema, stats_min_value, stats_max_value "
+            f"FROM parquet_metadata({quote_literal(file)}) ORDER BY row_group_id").fetchall()
+
+        row_groups: dict[int, dict] = {}
+        for row_group, num_rows, column, minimum, maximum in statistics:
+            row_groups.setdefault(row_group, {'num_rows': num_rows, 'columns': {}})
+
+            if column in columns:
+                row_groups[row_group]['columns'][column] = {
+                    'min': convert(minimum, types[column]),
+                    'max': convert(maximum, types[column]),
+                }
+
+        entry: dict = {
+            'identity': _identity(file),
+            'num_rows': sum([row_group['num_rows'] for row_group in row_groups.values()]),
+            'columns': {},
+            'row_groups': [row_groups[row_group] for row_group in sorted(row_groups)],
+        }
+
+        for column in columns:
+            ranges = [row_group['columns'].get(column, {}) for row_group in entry['row_groups']]
+            minimums = [bound.get('min') for bound in ranges]
+            maximums = [bound.get('max') for bound in ranges]
+
+            # Fill the bloom filter with the distinct values of the file
+            values = connection.sql(
+                f"SELECT DISTINCT {quote_identifier(column)} FROM {source} "
+                f"WHERE {quote_identifier(column)} IS NOT NULL").fetchall()
+            bloom = Bloom.for_capacity(len(values), false_positive_rate)
+            for (value,) in values:
+                bloom.add(str(convert(value, types[column])))
+
+            entry['columns'][column] = {
+                # Unknown if any row group lacks statistics
+                'min': min(minimums) if minimums and None not in minimums else None,
+                'max': max(maximums) if maximums and None not in maximums else None,
+                'bloom': bloom.to_dict(),
+            }
+
+        index['files'][_key(file, index_path)] = entry
+
+    return index
+
+
+def merge(index: t.Optional[dict], other: dict) -> dict:
+    """
+    Merge the entries of a new index into an existing one, e.g. after new
+    files were appended to a dataset. The existing index is replaced if it
+    indexes other columns.
+    :param index: existing index or None
+    :type index: dict
+    :param other: index of the new files
+    :type other: dict
+    :return: merged index
+    :rtype: dict
+    """
+    if index is None or index['columns'] != other['columns']:
+        return other
+
+    return {**index, 'files': {**index['files'], **other['files']}}
+
+
+def save(index: dict, index_path: str) -> None:
+    """
+    Save an index atomically, so readers never see a partial index
+    :param index: index
+    :type index: dict
+    :param index_path: path of the index
+    :type index_path: str
+    """
+    temporary: str = f"{index_path}.{os.getpid()}.tmp"
+
+    with open(temporary, 'w') as file:
+        json.dump(index, file)
+
+    os.replace(temporary, index_path)
+
+
+def load(index_path: str) -> t.Optional[dict]:
+    """
+    Load an index if it exists
+    :param index_path: path of the index
+    :type index_path: str
+    :return: index or None
+    :rtype: dict
+    """
+    if index_path.startswith(REMOTE_PREFIXES) or not os.path.isfile(index_path):
+        return None
+
+    with open(index_path) as file:
+        index: dict = json.load(file)
+
+    # Ignore indexes of an unknown layout
+    if index.get('version') != INDEX_VERSION:
+        return None
+
+    return index
+
+
+def may_match(entry: dict, column_value_pairs: dict[str, str], types: dict[str, str]) -> bool:
+    """
+    Check whether an indexed file can hold records matching all column
+    value pairs
+    :param entry: index entry of the file
+    :type entry: dict
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :param types: types of the indexed columns
+    :type types: dict[str, str]
+    :return: False if the file can't hold a match
+    :rtype: bool
+    """
+    for column, value in column_value_pairs.items():
+        if column not in entry['columns']:
+            continue
+
+        # Keep the file if the value can't be compared
+        value = convert(value, types[column])
+        if value is None:
+            continue
+
+        statistics: dict = entry['columns'][column]
+
+        # Outside of the range of the file
+        if statistics['min'] is not None and value < statistics['min']:
+            return False
+        if statistics['max'] is not None and value > statistics['max']:
+            return False
+
+        # Not in the set of values of the file
+        if str(value) not in Bloom.from_dict(statistics['bloom']):
+            return False
+
+    return True
+
+
+def prune(files: list[str], column_value_pairs: t.Optional[dict[str, str]], index_paths: list[str]) -> list[str]:
+    """
+    Drop the files whose index entry proves that they can't hold records
+    matching the column value pairs. Files without an entry or that changed
+    since they were indexed are kept.
+    :param files: paths of parquet files
+    :type files: list[str]
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :param index_paths: paths of the indexes to consult
+    :type index_paths: list[str]
+    :return: paths of the files that may match
+    :rtype: list[str]
+    """
+    if not column_value_pairs or not files:
+        return files
+
+    # Collect the entries of all indexes by file
+    entries: dict[str, tuple[dict, dict]] = {}
+    for index_path in index_paths:
+        index = load(index_path)
+        if index is None:
+            continue
+
+        for file in files:
+            entry = index['files'].get(_key(file, index_path))
+            if entry is not None:
+                entries[file] = (entry, index['columns'])
+
+    matches: list[str] = []
+    for file in files:
+        entry, types = entries.get(file, (None, None))
+
+        # Keep files that are not indexed or changed since
+        if entry is None or entry['identity'] != _identity(file) \
+                or may_match(entry, column_value_pairs, types):
+            matches.append(file)
+
+    # Keep one file so the schema is known, the filters then reject its rows
+    return matches or files[:1]
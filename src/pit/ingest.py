@@ -0,0 +1,164 @@
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import typing as t
+
+from .helpers import quote_literal
+
+#: Json layouts DuckDB can read.
+JSON_FORMATS = ('auto', 'array', 'newline_delimited')
+
+#: A date and timestamp format no json string matches. Schema detection
+#: would otherwise turn ISO date strings into dates, which the json output
+#: writes as epoch milliseconds. Dates are stored with explicit column types.
+NO_TEMPORAL_FORMAT = '\x01%d'
+
+#: Prefixes of paths DuckDB reads remotely.
+REMOTE_PREFIXES = ('s3://', 's3a://', 'gcs://', 'gs://', 'http://', 'https://')
+
+
+def is_inline(data: str) -> bool:
+    """
+    Check whether data holds json documents instead of naming a file
+    :param data: path of a json file or json documents
+    :type data: str
+    :return: True if the data starts like a json object or array
+    :rtype: bool
+    """
+    return data.lstrip().startswith(('[', '{'))
+
+
+@contextlib.contextmanager
+def json_source(
+    data: str,
+    format: str = 'auto',
+    sample_size: t.Optional[int] = None,
+    columns: t.Optional[dict[str, str]] = None,
+) -> t.Iterator[str]:
+    """
+    Provide a DuckDB table expression that reads json data directly, so
+    the records are streamed into the statement that consumes them instead
+    of being loaded into memory first. The expression is only valid within
+    the block and must be consumed by a single statement.
+    :param data: path of a json file, ``-`` for stdin or a json document
+    :type data: str
+    :param format: json layout, one of ``auto``, ``array`` or
+                   ``newline_delimited``
+    :type format: str
+    :param sample_size: number of records used to infer the schema,
+                        ``-1`` to use all records
+    :type sample_size: int
+    :param columns: explicit column types, replaces schema inference, which
+                    keeps date and timestamp strings as strings
+    :type columns: dict[str, str]
+    :return: table expression
+    :rtype: Iterator[str]
+    """
+    if format not in JSON_FORMATS:
+        raise ValueError(
+            f"Invalid json format. Format can be one of {', '.join(JSON_FORMATS)}")
+
+    with contextlib.ExitStack() as stack:
+        # Read stdin as a file
+        if data == '-':
+            path = '/dev/stdin'
+
+            # Spool stdin to a file where it can't be read directly
+            if not os.path.exists(path):
+                path = stack.enter_context(_spool(sys.stdin.read()))
+
+        # Write json documents to a file so DuckDB can read them in parallel
+        elif is_inline(data) and not os.path.exists(data):
+            path = stack.enter_context(_spool(data))
+
+        # Read files directly
+        elif data.startswith(REMOTE_PREFIXES) or os.path.exists(data):
+            path = data
+
+        else:
+            raise FileNotFoundError(f"File {data} does not exist")
+
+        # Build the options of the json reader
+        options: list[str] = [f"format={quote_literal(format)}"]
+
+        if columns:
+            options.append("columns={" + ", ".join(
+                [f"{quote_literal(name)}: {quote_literal(type)}" for name, type in columns.items()]) + "}")
+        else:
+            options.append("auto_detect=true")
+            options.append(f"dateformat={quote_literal(NO_TEMPORAL_FORMAT)}")
+            options.append(f"timestampformat={quote_literal(NO_TEMPORAL_FORMAT)}")
+
+        if sample_size is not None:
+            options.append(f"sample_size={int(sample_size)}")
+
+        yield f"read_json({quote_literal(path)}, {', '.join(options)})"
+
+
+@contextlib.contextmanager
+def _spool(data: str) -> t.Iterator[str]:
+    """
+    Write json data to a temporary file that is removed after the block
+    :param data: json data
+    :type data: str
+    :return: path of the temporary file
+    :rtype: Iterator[str]
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as file:
+        file.write(data)
+
+    try:
+        yield file.name
+    finally:
+        os.remove(file.name)
+
+
+def read_queries(data: str, paths: t.Optional[list[str]] = None) -> list[dict]:
+    """
+    Read the searches of a batch from json lines. Every line holds an
+    ``id``, the ``column_value_pairs`` to search for and optionally its own
+    ``paths``, ``columns`` and ``filename`` flag.
+    :param data: path of a json lines file, ``-`` for stdin or the json
+                 lines themselves
+    :type data: str
+    :param paths: paths of the searches that don't name their own
+    :type paths: list[str]
+    :return: searches with their paths
+    :rtype: list[dict]
+    """
+    queries: list[dict] = []
+
+    with contextlib.ExitStack() as stack:
+        if data == '-':
+            lines: t.Iterable[str] = sys.stdin
+        elif is_inline(data) and not os.path.exists(data):
+            lines = data.splitlines()
+        else:
+            lines = stack.enter_context(open(data))
+
+        for number, line in enumerate(lines, 1):
+            # Skip empty lines
+            if not line.strip():
+                continue
+
+            query: dict = json.loads(line)
+
+            # Number the searches without an id by their line
+            query.setdefault('id', number)
+            query.setdefault('paths', paths)
+            query.setdefault('column_value_pairs', {})
+
+            # Throw an error if there is nothing to search in
+            if not query['paths']:
+                raise ValueError(
+                    f"Invalid query. Query {query['id']} has no paths")
+
+            queries.append(query)
+
+    # Throw an error if there is nothing to search for
+    if not queries:
+        raise ValueError("Invalid queries. The batch holds no queries")
+
+    return queries
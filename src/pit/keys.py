@@ -0,0 +1,281 @@
+import bisect
+import json
+import os
+import threading
+import typing as t
+
+import duckdb
+
+from .dataset import is_dataset
+from .helpers import quote_identifier, quote_literal
+from .index import FLOAT_TYPES, INTEGER_TYPES, STRING_TYPES, _identity, _key, convert
+from .ingest import REMOTE_PREFIXES
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    import pyarrow.parquet as pq
+
+#: Version of the key index layout.
+KEYS_VERSION = 1
+
+#: Name of the key index file inside a dataset directory. Like the suffix
+#: below it doesn't end in .parquet, so globs over the data files don't
+#: match it.
+DATASET_KEYS = '_pit_keys.pitkeys'
+
+#: Suffix of the key index file next to a parquet file.
+FILE_KEYS_SUFFIX = '.pitkeys'
+
+#: Rows per row group of a key index. A lookup reads a single row group, so
+#: small row groups keep it fast while the footer stays small.
+KEYS_ROW_GROUP_SIZE = 4096
+
+
+def default_path(path: str) -> str:
+    """
+    Get the default location of the key index of a parquet file or dataset
+    :param path: path of a parquet file or dataset
+    :type path: str
+    :return: path of the key index
+    :rtype: str
+    """
+    if is_dataset(path):
+        return os.path.join(path, DATASET_KEYS)
+
+    return path + FILE_KEYS_SUFFIX
+
+
+def partitioned(files: list[str]) -> bool:
+    """
+    Check whether files lie in hive partition directories, whose columns
+    are not stored in the files and can't be read by row group
+    :param files: paths of parquet files
+    :type files: list[str]
+    :return: True if any directory of a file is a partition
+    :rtype: bool
+    """
+    return any('=' in directory for file in files for directory in os.path.dirname(file).split(os.sep))
+
+
+def build(connection: duckdb.DuckDBPyConnection, files: list[str], column: str, index_path: str) -> dict:
+    """
+    Build a key index that maps every value of a key column to the file,
+    row group and row number in the file that hold it. The index is a
+    parquet file sorted by key, so a lookup bisects the row group bounds
+    of the index and then the row group that can hold the key.
+    :param connection: connection to storage
+    :type connection: duckdb.DuckDBPyConnection
+    :param files: paths of local parquet files
+    :type files: list[str]
+    :param column: key column
+    :type column: str
+    :param index_path: path the key index is saved to
+    :type index_path: str
+    :return: key column, its type and the number of indexed keys
+    :rtype: dict
+    """
+    # Row groups are read with pyarrow, which only reads local files here
+    if index_path.startswith(REMOTE_PREFIXES) or any(file.startswith(REMOTE_PREFIXES) for file in files):
+        raise ValueError("Invalid path. Key indexes are only supported for local files")
+    if partitioned(files):
+        raise ValueError("Invalid path. Key indexes are not supported for partitioned datasets")
+
+    files_list: str = f"[{', '.join(quote_literal(file) for file in files)}]"
+
+    # Get the type of the key from the parquet schema
+    types: dict[str, str] = {
+        name: type for name, type, *_ in connection.execute(
+            f"DESCRIBE SELECT * FROM read_parquet({files_list}, union_by_name=true)").fetchall()}
+    if types.get(column) not in INTEGER_TYPES | FLOAT_TYPES | STRING_TYPES:
+        raise ValueError(f"Invalid column. Column {column} can't be used as key")
+
+    # Remember the files with their identity, so changed files are detected
+    layout: dict = {
+        'version': KEYS_VERSION,
+        'column': column,
+        'type': types[column],
+        'files': [{'key': _key(file, index_path), 'identity': _identity(file)} for file in files],
+    }
+
+    temporary: str = f"{index_path}.{os.getpid()}.tmp"
+    connection.execute(
+        # First row of every row group of every file
+        "COPY (WITH row_groups AS ("
+        "SELECT file_name AS file, row_group_id AS row_group, row_group_num_rows AS num_rows, "
+        "sum(row_group_num_rows) OVER (PARTITION BY file_name ORDER BY row_group_id) - row_group_num_rows AS start "
+        f"FROM (SELECT DISTINCT file_name, row_group_id, row_group_num_rows FROM parquet_metadata({files_list}))), "
+        # Position of every key in its file
+        f"keys AS (SELECT {quote_identifier(column)} AS key, filename AS file, file_row_number AS row "
+        f"FROM read_parquet({files_list}, filename=true, file_row_number=true, union_by_name=true) "
+        f"WHERE {quote_identifier(column)} IS NOT NULL) "
+        f"SELECT keys.key, CAST(list_position({files_list}, keys.file) - 1 AS INTEGER) AS file, "
+        "CAST(row_groups.row_group AS INTEGER) AS row_group, keys.row "
+        "FROM keys JOIN row_groups ON keys.file = row_groups.file "
+        "AND keys.row >= row_groups.start AND keys.row < row_groups.start + row_groups.num_rows "
+        "ORDER BY keys.key, file, row_group, row) "
+        f"TO {quote_literal(temporary)} (FORMAT parquet, ROW_GROUP_SIZE {KEYS_ROW_GROUP_SIZE}, "
+        f"KV_METADATA {{pit: {quote_literal(json.dumps(layout))}}})")
+
+    # Replace the index atomically, so readers never see a partial index
+    os.replace(temporary, index_path)
+
+    keys: int = connection.execute(
+        f"SELECT count(*) FROM read_parquet({quote_literal(index_path)})").fetchone()[0]
+
+    return {'column': column, 'type': types[column], 'keys': keys}
+
+
+class KeyIndex:
+    """
+    A loaded key index. The bounds of its row groups come from the footer,
+    so a lookup bisects them and reads one or two row groups of the index.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a key index
+        :param path: path of the key index
+        :type path: str
+        """
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.file: "pq.ParquetFile" = pq.ParquetFile(path)
+
+        layout: dict = json.loads(self.file.metadata.metadata[b'pit'])
+        self.version: int = layout['version']
+        self.column: str = layout['column']
+        self.type: str = layout['type']
+
+        # Resolve the files relative to the index
+        directory: str = os.path.dirname(os.path.abspath(path))
+        self.files: list[str] = [os.path.normpath(os.path.join(directory, entry['key'])) for entry in layout['files']]
+        self.identities: list[t.Optional[dict]] = [entry['identity'] for entry in layout['files']]
+
+        # Lower bounds of the keys of every row group. The upper bounds of
+        # long strings are truncated, so only the lower bounds are bisected.
+        statistics = [self.file.metadata.row_group(i).column(0).statistics for i in range(self.file.num_row_groups)]
+        self.usable: bool = all(statistic is not None and statistic.has_min_max for statistic in statistics)
+        self.minimums: list[t.Any] = [statistic.min for statistic in statistics] if self.usable else []
+
+    def covers(self, files: list[str]) -> bool:
+        """
+        Check whether the index holds all keys of some files
+        :param files: paths of parquet files
+        :type files: list[str]
+        :return: False if a file isn't indexed or changed since
+        :rtype: bool
+        """
+        identities: dict[str, t.Optional[dict]] = dict(zip(self.files, self.identities))
+
+        for file in files:
+            path: str = os.path.normpath(os.path.abspath(file))
+            if path not in identities or identities[path] != _identity(file):
+                return False
+
+        return True
+
+    def find(self, value: t.Any) -> list[tuple[int, int, int]]:
+        """
+        Find the positions of a key
+        :param value: key, of the python type its column compares as
+        :type value: Any
+        :return: file, row group and row number of every record with the key
+        :rtype: list[tuple[int, int, int]]
+        """
+        positions: list[tuple[int, int, int]] = []
+
+        # The key starts in the row group before the first one starting at or
+        # after it, and may continue in the following ones
+        row_group: int = max(bisect.bisect_left(self.minimums, value) - 1, 0)
+        while row_group < len(self.minimums) and self.minimums[row_group] <= value:
+            table = self.file.read_row_group(row_group)
+            keys: list = table.column('key').to_pylist()
+
+            # Bisect the sorted keys of the row group
+            first, last = bisect.bisect_left(keys, value), bisect.bisect_right(keys, value)
+            rows = table.slice(first, last - first)
+            positions += zip(rows.column('file').to_pylist(), rows.column('row_group').to_pylist(), rows.column('row').to_pylist())
+
+            row_group += 1
+
+        return positions
+
+
+#: Loaded key indexes by path, with the identity of the index they were loaded from.
+_loaded: dict[str, tuple[t.Optional[dict], KeyIndex]] = {}
+_lock = threading.Lock()
+
+
+def load(index_path: str) -> t.Optional[KeyIndex]:
+    """
+    Load a key index if it exists, reusing it until it changes
+    :param index_path: path of the key index
+    :type index_path: str
+    :return: key index or None
+    :rtype: KeyIndex
+    """
+    if index_path.startswith(REMOTE_PREFIXES) or not os.path.isfile(index_path):
+        return None
+
+    identity: t.Optional[dict] = _identity(index_path)
+
+    with _lock:
+        loaded = _loaded.get(index_path)
+        if loaded is not None and loaded[0] == identity:
+            return loaded[1]
+
+    index = KeyIndex(index_path)
+
+    # Ignore indexes of an unknown layout
+    if index.version != KEYS_VERSION:
+        return None
+
+    with _lock:
+        _loaded[index_path] = (identity, index)
+
+    return index
+
+
+def lookup(files: list[str], column_value_pairs: t.Optional[dict[str, str]], index_paths: list[str]) -> t.Optional[str]:
+    """
+    Build the source of the records of a key, if a key index of the files
+    covers one of the searched columns. The source selects the records by
+    their row number, so DuckDB reads only the row groups that hold them.
+    :param files: paths of parquet files
+    :type files: list[str]
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :param index_paths: paths of the key indexes to consult
+    :type index_paths: list[str]
+    :return: source of the records with the key, None if no key index can answer
+    :rtype: str
+    """
+    if not column_value_pairs or not files or partitioned(files):
+        return None
+
+    for index_path in index_paths:
+        index: t.Optional[KeyIndex] = load(index_path)
+
+        # Only answer from an index of the key that is up to date with all files
+        if index is None or not index.usable or index.column not in column_value_pairs or not index.covers(files):
+            continue
+
+        value = convert(column_value_pairs[index.column], index.type)
+        if value is None:
+            return None
+
+        # Group the row numbers by the file that holds them
+        rows: dict[int, list[int]] = {}
+        for file, _, row in index.find(value):
+            rows.setdefault(file, []).append(row)
+
+        # Keep the schema of the files if the key doesn't exist
+        if not rows:
+            return f"(SELECT * FROM read_parquet([{', '.join(quote_literal(file) for file in files)}], union_by_name=true) WHERE false)"
+
+        return '(' + ' UNION ALL BY NAME '.join(
+            f"SELECT * EXCLUDE (file_row_number) FROM read_parquet([{quote_literal(index.files[file])}], file_row_number=true) "
+            f"WHERE file_row_number IN ({', '.join(str(row) for row in numbers)})"
+            for file, numbers in sorted(rows.items())) + ')'
+
+    return None
@@ -0,0 +1,142 @@
+import contextlib
+import json
+import os
+import tempfile
+import time
+import typing as t
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+#: Version of the manifest layout.
+MANIFEST_VERSION = 1
+
+#: Name of the manifest file inside a dataset directory.
+MANIFEST = '_manifest.json'
+
+#: Name of the lock file that serializes the writers of a manifest.
+MANIFEST_LOCK = '_manifest.lock'
+
+
+def load(directory: str) -> t.Optional[dict]:
+    """
+    Load the manifest of a dataset directory
+    :param directory: path of the dataset directory
+    :type directory: str
+    :return: manifest, None if the dataset has none
+    :rtype: dict
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST)) as file:
+            manifest: dict = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    # Ignore manifests of an unknown layout
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+
+    return manifest
+
+
+def save(directory: str, files: list[str], obsolete: t.Optional[dict[str, float]] = None) -> None:
+    """
+    Replace the manifest of a dataset directory atomically, so readers see
+    either all or none of the listed files
+    :param directory: path of the dataset directory
+    :type directory: str
+    :param files: paths of the parquet files relative to the directory
+    :type files: list[str]
+    :param obsolete: files that were replaced, by the time they were replaced
+    :type obsolete: dict[str, float]
+    """
+    manifest: dict = {'version': MANIFEST_VERSION, 'files': sorted(set(files)), 'obsolete': obsolete or {}}
+
+    # Write to a temporary file first, so readers never see half a manifest
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='_', suffix='.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+
+
+@contextlib.contextmanager
+def lock(directory: str) -> t.Iterator[None]:
+    """
+    Hold the exclusive lock of a dataset directory, so that concurrent
+    writers don't lose each other's changes to the manifest
+    :param directory: path of the dataset directory
+    :type directory: str
+    """
+    with open(os.path.join(directory, MANIFEST_LOCK), 'a') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def update(directory: str, add: t.Iterable[str] = (), remove: t.Iterable[str] = (), files: t.Optional[t.Callable[[], list[str]]] = None) -> list[str]:
+    """
+    Add and remove files from the manifest of a dataset directory. Removed
+    files are kept on disk as obsolete until :func:`expire` deletes them,
+    so readers that resolved the previous manifest can still read them.
+    :param directory: path of the dataset directory
+    :type directory: str
+    :param add: paths of the files to add, relative to the directory
+    :type add: Iterable[str]
+    :param remove: paths of the files to remove, relative to the directory
+    :type remove: Iterable[str]
+    :param files: lists the files of a dataset without a manifest yet
+    :type files: Callable[[], list[str]]
+    :return: paths of the files of the new manifest
+    :rtype: list[str]
+    """
+    with lock(directory):
+        manifest: t.Optional[dict] = load(directory)
+
+        # Start from the files that were written before the first manifest
+        current: set[str] = set(manifest['files'] if manifest is not None else (files() if files else []))
+        obsolete: dict[str, float] = dict(manifest.get('obsolete', {})) if manifest is not None else {}
+
+        removed: set[str] = current & set(remove)
+        current = (current | set(add)) - removed
+        obsolete.update({file: time.time() for file in removed})
+
+        save(directory, list(current), obsolete)
+
+    return sorted(current)
+
+
+def expire(directory: str, grace: float = 60.0) -> list[str]:
+    """
+    Delete the obsolete files of a dataset directory that were replaced
+    more than grace seconds ago
+    :param directory: path of the dataset directory
+    :type directory: str
+    :param grace: seconds an obsolete file is kept for running readers
+    :type grace: float
+    :return: paths of the deleted files relative to the directory
+    :rtype: list[str]
+    """
+    with lock(directory):
+        manifest: t.Optional[dict] = load(directory)
+        if manifest is None or not manifest.get('obsolete'):
+            return []
+
+        now: float = time.time()
+        expired: list[str] = sorted(
+            file for file, replaced in manifest['obsolete'].items() if now - replaced >= grace)
+
+        # Forget the files before deleting them, so a crash leaves no dangling entries
+        save(directory, manifest['files'], {
+            file: replaced for file, replaced in manifest['obsolete'].items() if file not in expired})
+
+        for file in expired:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, file))
+
+    return expired
@@ -0,0 +1,427 @@
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+import typing as t
+
+from .helpers import quote_literal
+from .index import FLOAT_TYPES, INTEGER_TYPES, convert
+from .dataset import is_glob
+from .ingest import REMOTE_PREFIXES
+from .query import aggregate_name, parquet_source
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    import duckdb
+
+
+def identity(connection: "duckdb.DuckDBPyConnection", path: str) -> t.Any:
+    """
+    Get the identity of a file, which changes whenever the file does
+    :param connection: connection to storage
+    :type connection: duckdb.DuckDBPyConnection
+    :param path: path of the file
+    :type path: str
+    :return: size and modification time of the file
+    :rtype: Any
+    """
+    if not path.startswith(REMOTE_PREFIXES):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    # Only the metadata is fetched as long as the content isn't selected
+    return [list(row) for row in connection.execute(
+        f"SELECT size, epoch_ms(last_modified) FROM read_blob({quote_literal(path)})").fetchall()]
+
+
+def read(connection: "duckdb.DuckDBPyConnection", path: str) -> dict:
+    """
+    Read the schema, row counts and row group statistics from the footer
+    of a parquet file
+    :param connection: connection to storage
+    :type connection: duckdb.DuckDBPyConnection
+    :param path: path of the file
+    :type path: str
+    :return: metadata of the file
+    :rtype: dict
+    """
+    # Get the column types from the parquet schema
+    schema: dict[str, str] = {
+        column: type for column, type, *_ in connection.execute(
+            f"DESCRIBE SELECT * FROM {parquet_source([path])}").fetchall()}
+
+    # Read the row group statistics from the parquet footer
+    statistics = connection.execute(
+        "SELECT row_group_id, row_group_num_rows, path_in_schema, stats_min_value, stats_max_value, stats_null_count "
+        f"FROM parquet_metadata({quote_literal(path)}) ORDER BY row_group_id").fetchall()
+
+    row_groups: dict[int, dict] = {}
+    for row_group, num_rows, column, minimum, maximum, null_count in statistics:
+        row_groups.setdefault(row_group, {'num_rows': num_rows, 'columns': {}})
+        row_groups[row_group]['columns'][column] = {
+            'min': minimum, 'max': maximum, 'null_count': null_count}
+
+    return {
+        'schema': schema,
+        'num_rows': sum([row_group['num_rows'] for row_group in row_groups.values()]),
+        'row_groups': [row_groups[row_group] for row_group in sorted(row_groups)],
+    }
+
+
+def _bound(values: list[t.Optional[str]], type: str, pick: t.Callable) -> t.Any:
+    """
+    Pick the lowest or highest of the row group bounds of a column
+    :param values: string form of the bounds, None if a row group has none
+    :type values: list[str]
+    :param type: DuckDB type of the column
+    :type type: str
+    :param pick: ``min`` or ``max``
+    :type pick: Callable
+    :return: bound, None if unknown
+    :rtype: Any
+    """
+    # Unknown if any row group lacks statistics
+    if not values or None in values:
+        return None
+
+    # Compare numbers by value and everything else by its string form
+    if type in INTEGER_TYPES or type in FLOAT_TYPES or type.startswith('DECIMAL'):
+        return pick([convert(value, type) for value in values])
+
+    return pick(values)
+
+
+def summarize(path: str, entry: dict) -> dict:
+    """
+    Summarize the metadata of a file per column
+    :param path: path of the file
+    :type path: str
+    :param entry: metadata of the file
+    :type entry: dict
+    :return: row counts, types, bounds and null counts of the columns
+    :rtype: dict
+    """
+    columns: dict[str, dict] = {}
+
+    for column, type in entry['schema'].items():
+        ranges = [row_group['columns'].get(column, {}) for row_group in entry['row_groups']]
+        null_counts = [bound.get('null_count') for bound in ranges]
+
+        columns[column] = {
+            'type': type,
+            'min': _bound([bound.get('min') for bound in ranges], type, min),
+            'max': _bound([bound.get('max') for bound in ranges], type, max),
+            'null_count': sum(null_counts) if None not in null_counts else None,
+        }
+
+    return {
+        'path': path,
+        'num_rows': entry['num_rows'],
+        'row_groups': len(entry['row_groups']),
+        'columns': columns,
+    }
+
+
+def may_match(entry: dict, column_value_pairs: dict[str, str]) -> bool:
+    """
+    Check whether any row group of a file can hold records matching all
+    column value pairs according to its min/max statistics
+    :param entry: metadata of the file
+    :type entry: dict
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :return: False if the file can't hold a match
+    :rtype: bool
+    """
+    for row_group in entry['row_groups']:
+        for column, value in column_value_pairs.items():
+            type: str = entry['schema'].get(column, '')
+            bounds: dict = row_group['columns'].get(column, {})
+
+            # Keep the row group if the value can't be compared
+            value = convert(value, type)
+            minimum = convert(bounds.get('min'), type)
+            maximum = convert(bounds.get('max'), type)
+            if value is None:
+                continue
+
+            # Outside of the range of the row group
+            if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+                break
+        else:
+            return True
+
+    # Files without row groups hold no records
+    return False
+
+
+def aggregate(entries: list[dict], parsed: list[tuple[str, t.Optional[str]]]) -> t.Optional[dict]:
+    """
+    Answer counts and the min/max of integer and decimal columns from the
+    footers of files, without reading their data pages. Float bounds are
+    not used, since the statistics leave out NaN.
+    :param entries: metadata of all files
+    :type entries: list[dict]
+    :param parsed: function and column of every aggregate
+    :type parsed: list[tuple[str, Optional[str]]]
+    :return: the aggregated row, None if the footers can't answer it
+    :rtype: dict
+    """
+    row: dict = {}
+
+    for function, column in parsed:
+        # Count the records of all row groups
+        if column is None:
+            row[aggregate_name(function, column)] = sum(entry['num_rows'] for entry in entries)
+            continue
+
+        # Every file must describe the column
+        if function not in ('count', 'min', 'max') or any(column not in entry['schema'] for entry in entries):
+            return None
+
+        bounds: list[dict] = [
+            row_group['columns'].get(column, {}) for entry in entries for row_group in entry['row_groups']]
+
+        # Count the values that aren't null
+        if function == 'count':
+            null_counts = [bound.get('null_count') for bound in bounds]
+            if None in null_counts:
+                return None
+            row[aggregate_name(function, column)] = sum(entry['num_rows'] for entry in entries) - sum(null_counts)
+            continue
+
+        # Compare the bounds of numbers only, the string form of others doesn't sort like their values
+        types = {entry['schema'][column] for entry in entries}
+        if len(types) != 1 or not all(type in INTEGER_TYPES or type.startswith('DECIMAL') for type in types):
+            return None
+
+        # No row groups hold no values, a row group without bounds can't be answered
+        value = _bound([bound.get(function) for bound in bounds], types.pop(), min if function == 'min' else max)
+        if bounds and value is None:
+            return None
+
+        row[aggregate_name(function, column)] = value
+
+    return row
+
+
+class MetadataCache:
+    """
+    A thread-safe cache of the schema, row counts and row group statistics
+    of parquet files, so that planning a query doesn't read the footers
+    again.
+
+    Local entries are validated by the size and modification time of their
+    file on every use. Remote entries are trusted for ``ttl`` seconds and
+    validated by a metadata request afterwards. If a path is given, the
+    entries are persisted to a json file and survive the process.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0, path: t.Optional[str] = None):
+        """
+        Initialize the cache
+        :param max_entries: maximum number of cached files
+        :type max_entries: int
+        :param ttl: seconds a remote entry is used without validating it
+        :type ttl: float
+        :param path: json file to persist the entries in, memory only if empty
+        :type path: str
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+
+        # Metadata by path, the least recently used first
+        self._entries: collections.OrderedDict[str, dict] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        # Whether there are entries that weren't persisted yet
+        self._dirty: bool = False
+
+        # Load the entries persisted by earlier processes
+        if path is not None and os.path.exists(path):
+            with open(path) as file:
+                self._entries.update(json.load(file))
+
+    def _get(self, key: str) -> t.Optional[dict]:
+        with self._lock:
+            entry: t.Optional[dict] = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        return entry
+
+    def _put(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            self._dirty = True
+
+    def _valid(self, connection: "duckdb.DuckDBPyConnection", path: str, entry: dict) -> bool:
+        """
+        Check whether an entry still describes its file
+        :param connection: connection to storage
+        :type connection: duckdb.DuckDBPyConnection
+        :param path: path of the file
+        :type path: str
+        :param entry: cached entry
+        :type entry: dict
+        :return: True if the file didn't change
+        :rtype: bool
+        """
+        remote: bool = path.startswith(REMOTE_PREFIXES)
+
+        # Spare the request while a remote entry is fresh
+        if remote and time.time() - entry['checked'] < self.ttl:
+            return True
+
+        try:
+            if identity(connection, path) != entry['identity']:
+                return False
+        except FileNotFoundError:
+            return False
+
+        if remote:
+            entry['checked'] = time.time()
+
+        return True
+
+    def file(self, connection: "duckdb.DuckDBPyConnection", path: str) -> dict:
+        """
+        Get the metadata of a parquet file, reading its footer only if it
+        isn't cached or changed
+        :param connection: connection to storage
+        :type connection: duckdb.DuckDBPyConnection
+        :param path: path of the file
+        :type path: str
+        :return: schema, row counts and row group statistics
+        :rtype: dict
+        """
+        entry: dict = self._file(connection, path)
+        self.save()
+
+        return entry
+
+    def _file(self, connection: "duckdb.DuckDBPyConnection", path: str) -> dict:
+        key: str = path if path.startswith(REMOTE_PREFIXES) else os.path.abspath(path)
+
+        entry: t.Optional[dict] = self._get(key)
+        if entry is not None and self._valid(connection, path, entry):
+            return entry
+
+        entry = {'identity': identity(connection, path), 'checked': time.time(), **read(connection, path)}
+        self._put(key, entry)
+
+        return entry
+
+    def types(self, connection: "duckdb.DuckDBPyConnection", files: list[str], partitioned: bool = False) -> dict[str, str]:
+        """
+        Get the column types of the relation over some parquet files. The
+        schemas of several files are merged by column name, hive partition
+        columns are added from the paths. If the type of a column drifted
+        between files, the types are taken from DuckDB, which promotes them
+        like the union_by_name read does.
+        :param connection: connection to storage
+        :type connection: duckdb.DuckDBPyConnection
+        :param files: paths of parquet files or glob patterns
+        :type files: list[str]
+        :param partitioned: read partition columns from the paths
+        :type partitioned: bool
+        :return: types of the columns by name
+        :rtype: dict[str, str]
+        """
+        remote: bool = any(file.startswith(REMOTE_PREFIXES) or is_glob(file) for file in files)
+
+        # Merge the cached footers as long as the files agree on the types
+        if not partitioned and not remote:
+            schema: dict[str, str] = {}
+            drifted: bool = False
+            for file in files:
+                for column, type in self._file(connection, file)['schema'].items():
+                    drifted = drifted or schema.setdefault(column, type) != type
+            self.save()
+
+            # Types that drifted are promoted by DuckDB, which is asked below
+            if not drifted:
+                return schema
+
+        # The partition columns only depend on the paths, which are the key
+        key: str = json.dumps([os.path.abspath(file) if not file.startswith(REMOTE_PREFIXES) else file
+                               for file in files])
+
+        # Local files are validated one by one, remote ones by the first path
+        entry: t.Optional[dict] = self._get(key)
+        if entry is not None and (
+                self._valid(connection, files[0], entry) if remote
+                else entry['identity'] == [identity(connection, file) for file in files]):
+            return entry['schema']
+
+        entry = {
+            'schema': {
+                column: type for column, type, *_ in connection.execute(
+                    f"DESCRIBE SELECT * FROM {parquet_source(files, partitioned, len(files) > 1 or remote)}").fetchall()},
+            'identity': identity(connection, files[0]) if remote else [identity(connection, file) for file in files],
+            'checked': time.time(),
+        }
+        self._put(key, entry)
+        self.save()
+
+        return entry['schema']
+
+    def prune(self, connection: "duckdb.DuckDBPyConnection", files: list[str], column_value_pairs: t.Optional[dict[str, str]]) -> list[str]:
+        """
+        Drop the local files whose row group statistics prove that they
+        can't hold records matching the column value pairs. Remote files
+        and globs are left to DuckDB.
+        :param connection: connection to storage
+        :type connection: duckdb.DuckDBPyConnection
+        :param files: paths of parquet files
+        :type files: list[str]
+        :param column_value_pairs: column value pairs to search for
+        :type column_value_pairs: dict[str, str]
+        :return: paths of the files that may match
+        :rtype: list[str]
+        """
+        if not column_value_pairs or len(files) < 2:
+            return files
+
+        matches: list[str] = [
+            file for file in files
+            if file.startswith(REMOTE_PREFIXES) or is_glob(file)
+            or may_match(self._file(connection, file), column_value_pairs)]
+        self.save()
+
+        # Keep one file so the schema is known, the filters then reject all of its rows
+        return matches or files[:1]
+
+    def save(self) -> None:
+        """
+        Persist the entries if a path is configured and they changed
+        """
+        if self.path is None or not self._dirty:
+            return
+
+        with self._lock:
+            data: str = json.dumps(self._entries)
+            self._dirty = False
+
+        # Write to a temporary file first, so readers never see half the cache
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            file.write(data)
+        os.replace(temporary, self.path)
+
+    def clear(self) -> None:
+        """
+        Removes all cached entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+        self.save()
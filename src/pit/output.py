@@ -0,0 +1,109 @@
+import json
+import sys
+import typing as t
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    import pyarrow as pa
+
+
+def write_json(res: t.Any, stream: t.TextIO) -> None:
+    """
+    Writes a result as a single json document
+    :param res: result of a command
+    :type res: Any
+    :param stream: stream to write to
+    :type stream: TextIO
+    """
+    print(json.dumps(res), file=stream)
+
+
+def write_ndjson(reader: "pa.RecordBatchReader", stream: t.TextIO) -> None:
+    """
+    Writes json records as newline delimited json, one batch at a time, so
+    that only a single batch is held in memory
+    :param reader: reader of json records, see ``File.reader(as_json=True)``
+    :type reader: pa.RecordBatchReader
+    :param stream: stream to write to
+    :type stream: TextIO
+    """
+    for batch in reader:
+        # Write one line per record of the batch
+        stream.write(''.join(
+            record + '\n' for record in batch.column(0).to_pylist()))
+
+        # Hand the batch over before the next one is read
+        stream.flush()
+
+
+def write_arrow(reader: "pa.RecordBatchReader", stream: t.BinaryIO) -> None:
+    """
+    Writes the record batches of a reader as Arrow IPC stream
+    :param reader: reader of the records
+    :type reader: pa.RecordBatchReader
+    :param stream: binary stream to write to
+    :type stream: BinaryIO
+    """
+    import pyarrow as pa
+
+    with pa.ipc.new_stream(stream, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+def write_parquet(reader: "pa.RecordBatchReader", stream: t.BinaryIO) -> None:
+    """
+    Writes the record batches of a reader as parquet file
+    :param reader: reader of the records
+    :type reader: pa.RecordBatchReader
+    :param stream: binary stream to write to
+    :type stream: BinaryIO
+    """
+    import pyarrow.parquet as pq
+
+    with pq.ParquetWriter(stream, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+
+
+#: Writers by output format.
+writers: dict[str, t.Callable[[t.Any, t.IO], None]] = {
+    'json': write_json,
+    'ndjson': write_ndjson,
+    'arrow': write_arrow,
+    'parquet': write_parquet,
+}
+
+#: Output formats that are written as bytes instead of text.
+binary_formats = {'arrow', 'parquet'}
+
+
+def write(res: t.Any, format: str = 'json', stream: t.Optional[t.IO] = None, path: t.Optional[str] = None) -> None:
+    """
+    Writes the result of a command in the given output format
+    :param res: result of a command
+    :type res: Any
+    :param format: output format
+    :type format: str
+    :param stream: stream to write to, defaults to stdout
+    :type stream: IO
+    :param path: file to write to instead of the stream
+    :type path: str
+    """
+    binary: bool = format in binary_formats
+
+    # Write to the file if one is given
+    if path is not None:
+        with open(path, 'wb' if binary else 'w') as file:
+            writers[format](res, file)
+        return
+
+    stream = stream or sys.stdout
+
+    # Write bytes to the underlying buffer of text streams
+    if binary:
+        stream = getattr(stream, 'buffer', stream)
+
+    writers[format](res, stream)
+
+    # Make sure the bytes are written before the text buffer is used again
+    stream.flush()
@@ -0,0 +1,246 @@
+import contextlib
+import contextvars
+import threading
+import time
+import typing as t
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    import duckdb
+
+
+class Checkouts:
+    """
+    The cursors a command has checked out, so that another thread can
+    interrupt its queries, e.g. when the command is cancelled or times out.
+    """
+
+    def __init__(self):
+        self.cursors: set["duckdb.DuckDBPyConnection"] = set()
+        self.interrupted: bool = False
+        self._lock = threading.Lock()
+
+    def add(self, cursor: "duckdb.DuckDBPyConnection") -> None:
+        """
+        Track a checked out cursor
+        :param cursor: DuckDB cursor
+        :type cursor: duckdb.DuckDBPyConnection
+        """
+        with self._lock:
+            # Don't start new queries of an interrupted command
+            if self.interrupted:
+                raise InterruptedError("The command was interrupted")
+
+            self.cursors.add(cursor)
+
+    def discard(self, cursor: "duckdb.DuckDBPyConnection") -> None:
+        """
+        Stop tracking a cursor that was handed back
+        :param cursor: DuckDB cursor
+        :type cursor: duckdb.DuckDBPyConnection
+        """
+        with self._lock:
+            self.cursors.discard(cursor)
+
+    def interrupt(self) -> None:
+        """
+        Interrupt the running queries of the command and refuse new ones
+        """
+        with self._lock:
+            self.interrupted = True
+
+            for cursor in self.cursors:
+                cursor.interrupt()
+
+
+#: The cursors checked out by the command running in this context, None
+#: if they aren't tracked.
+checkouts: contextvars.ContextVar[t.Optional[Checkouts]] = contextvars.ContextVar('checkouts', default=None)
+
+
+@contextlib.contextmanager
+def track(cursor: "duckdb.DuckDBPyConnection") -> t.Iterator["duckdb.DuckDBPyConnection"]:
+    """
+    Track a cursor while it is used by the command running in this context
+    :param cursor: DuckDB cursor
+    :type cursor: duckdb.DuckDBPyConnection
+    :return: the cursor
+    :rtype: Iterator[duckdb.DuckDBPyConnection]
+    """
+    tracked: t.Optional[Checkouts] = checkouts.get()
+    if tracked is None:
+        yield cursor
+        return
+
+    tracked.add(cursor)
+    try:
+        yield cursor
+    finally:
+        tracked.discard(cursor)
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of ready-to-use DuckDB cursors.
+
+    Connections are keyed by the effective storage configuration, so the
+    httpfs extension and the S3 settings are only set up once per key. Each
+    checkout hands out a cursor of the keyed connection which shares its
+    settings and loaded extensions.
+    """
+
+    #: Configuration keys that decide how a connection is set up.
+    key_names = (
+        'AWS_ACCESS_KEY_ID',
+        'AWS_SECRET_ACCESS_KEY',
+        'AWS_SESSION_TOKEN',
+        'AWS_REGION',
+        'IS_OFFLINE',
+        'THREADS',
+        'MEMORY_LIMIT',
+        'TEMP_DIRECTORY',
+        'PRESERVE_ORDER',
+    )
+
+    def __init__(
+        self,
+        connect: t.Callable[[dict], "duckdb.DuckDBPyConnection"],
+        max_size: int = 8,
+        idle_timeout: float = 300.0,
+        timeout: float = 30.0,
+    ):
+        """
+        Initialize an empty pool
+        :param connect: factory that creates a configured connection
+        :type connect: Callable[[dict], duckdb.DuckDBPyConnection]
+        :param max_size: maximum number of cursors per key
+        :type max_size: int
+        :param idle_timeout: seconds after which idle cursors are closed
+        :type idle_timeout: float
+        :param timeout: seconds to wait for a free cursor
+        :type timeout: float
+        """
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        # Pooled connections with their idle cursors, keyed by config
+        self._entries: dict[tuple, dict] = {}
+        self._condition = threading.Condition()
+
+    def key(self, config: dict) -> tuple:
+        """
+        Build the pool key of a configuration
+        :param config: configuration
+        :type config: dict
+        :return: pool key
+        :rtype: tuple
+        """
+        return tuple(config.get(name) for name in self.key_names)
+
+    @contextlib.contextmanager
+    def cursor(self, config: dict = dict()) -> t.Iterator["duckdb.DuckDBPyConnection"]:
+        """
+        Check out a cursor for the given configuration and return it to the
+        pool when the block exits
+        :param config: configuration
+        :type config: dict
+        :return: DuckDB cursor
+        :rtype: Iterator[duckdb.DuckDBPyConnection]
+        """
+        key = self.key(config)
+        deadline = time.monotonic() + self.timeout
+        cursor: t.Optional["duckdb.DuckDBPyConnection"] = None
+
+        with self._condition:
+            # Close everything that has been idle for too long
+            self._evict()
+
+            while True:
+                # Reserve the first slot of the keyed connection on first use,
+                # the connection is opened below without holding the lock
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = {
+                        'connection': None,
+                        'idle': [],
+                        'in_use': 1,
+                        'last_used': time.monotonic(),
+                    }
+                    break
+
+                # Reuse the most recently returned cursor or open a new one,
+                # once the connection is open
+                if entry['connection'] is not None and (entry['idle'] or entry['in_use'] < self.max_size):
+                    cursor = entry['idle'].pop()[0] if entry['idle'] else entry['connection'].cursor()
+                    entry['in_use'] += 1
+                    break
+
+                # Wait until the connection is open and a cursor is free or a new one may be opened
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise TimeoutError(
+                        f"No connection available within {self.timeout} seconds")
+
+        # Connect without blocking the checkouts and returns of other keys
+        if cursor is None:
+            try:
+                connection = self.connect(config)
+            except BaseException:
+                # Give up the slot, so the next checkout connects again
+                with self._condition:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                    self._condition.notify_all()
+                raise
+
+            with self._condition:
+                entry['connection'] = connection
+                cursor = connection.cursor()
+                self._condition.notify_all()
+
+        try:
+            with track(cursor):
+                yield cursor
+        finally:
+            with self._condition:
+                # Hand the cursor back and wake up the waiting threads
+                entry['in_use'] -= 1
+                entry['last_used'] = time.monotonic()
+                entry['idle'].append((cursor, entry['last_used']))
+                self._condition.notify_all()
+
+    def _evict(self) -> None:
+        """
+        Close idle cursors and unused connections that exceeded the idle
+        timeout. Must be called while holding the pool lock.
+        """
+        now = time.monotonic()
+
+        for key, entry in list(self._entries.items()):
+            # Close the cursors that were not used for too long
+            expired = [cursor for cursor, last_used in entry['idle']
+                       if now - last_used > self.idle_timeout]
+            entry['idle'] = [(cursor, last_used) for cursor, last_used in entry['idle']
+                             if now - last_used <= self.idle_timeout]
+            for cursor in expired:
+                cursor.close()
+
+            # Drop the connection once nothing uses it anymore
+            if not entry['idle'] and not entry['in_use'] \
+                    and now - entry['last_used'] > self.idle_timeout:
+                entry['connection'].close()
+                del self._entries[key]
+
+    def close(self) -> None:
+        """
+        Closes all pooled cursors and connections
+        """
+        with self._condition:
+            for entry in self._entries.values():
+                for cursor, _ in entry['idle']:
+                    cursor.close()
+                if entry['connection'] is not None:
+                    entry['connection'].close()
+
+            self._entries.clear()
@@ -0,0 +1,327 @@
+import re
+import typing as t
+
+from .helpers import quote_identifier, quote_literal
+
+#: Comparison operators, ``<>`` is read as ``!=``.
+COMPARISONS = ('=', '!=', '<', '<=', '>', '>=')
+
+#: Tokens of a predicate: quoted strings, backtick quoted columns, operators
+#: and bare words such as columns, keywords, numbers and dates.
+TOKEN = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+    |(?P<column>`(?:[^`]|``)*`)
+    |(?P<operator><=|>=|!=|<>|=|<|>|\(|\)|,)
+    |(?P<word>[^\s()<>=!,'"`]+)
+)""", re.VERBOSE)
+
+#: Words that can't be bare values or columns.
+KEYWORDS = {'and', 'or', 'not', 'between', 'in', 'is', 'null', 'like', 'startswith'}
+
+
+def tokenize(text: str) -> list[tuple[str, str]]:
+    """
+    Split a predicate into tokens
+    :param text: predicate
+    :type text: str
+    :return: kind and text of every token, quotes removed from strings
+    :rtype: list[tuple[str, str]]
+    """
+    tokens: list[tuple[str, str]] = []
+    position: int = 0
+
+    while text[position:].strip():
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"Invalid predicate. Unexpected {text[position:].strip()[:20]!r}")
+
+        kind: str = match.lastgroup
+        value: str = match.group(kind)
+
+        # Unquote strings and columns, a doubled quote is a quote
+        if kind in ('string', 'column'):
+            value = value[1:-1].replace(value[0] * 2, value[0])
+        elif kind == 'word' and value.lower() in KEYWORDS:
+            kind, value = 'keyword', value.lower()
+
+        tokens.append((kind, value))
+        position = match.end()
+
+    return tokens
+
+
+class Parser:
+    """
+    Parses a predicate such as ``age >= 18 and (name startswith 'Jo' or
+    city in ('Graz', 'Wien')) and deleted is null`` into a tree of lists,
+    which serializes to json and compiles with :func:`condition`.
+
+    The nodes are ``['and', ...]``, ``['or', ...]``, ``['not', node]``,
+    ``[op, column, value]`` with op one of ``=``, ``!=``, ``<``, ``<=``,
+    ``>``, ``>=``, ``['between', column, low, high]``, ``['in', column,
+    [values]]``, ``['is_null', column]``, ``['like', column, pattern]`` and
+    ``['startswith', column, prefix]``. Values are kept as strings and cast
+    to the type of their column when compiled.
+    """
+
+    def __init__(self, text: str):
+        """
+        Initialize the parser
+        :param text: predicate
+        :type text: str
+        """
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def peek(self, *values: str) -> bool:
+        """
+        Check whether the next token is one of some keywords or operators
+        :param values: keywords or operators
+        :type values: str
+        :return: True if it is
+        :rtype: bool
+        """
+        if self.position >= len(self.tokens):
+            return False
+
+        kind, value = self.tokens[self.position]
+        return kind in ('keyword', 'operator') and value in values
+
+    def take(self, *values: str) -> str:
+        """
+        Consume the next token, which must be one of some keywords or operators
+        :param values: expected keywords or operators, any token if empty
+        :type values: str
+        :return: text of the token
+        :rtype: str
+        """
+        if self.position >= len(self.tokens) or (values and not self.peek(*values)):
+            found = 'the end' if self.position >= len(self.tokens) else repr(self.tokens[self.position][1])
+            raise ValueError(f"Invalid predicate. Expected {' or '.join(values) or 'a value'} but found {found}")
+
+        self.position += 1
+        return self.tokens[self.position - 1][1]
+
+    def value(self) -> str:
+        """
+        Consume a value, a quoted string or a bare word
+        :return: value
+        :rtype: str
+        """
+        if self.position < len(self.tokens) and self.tokens[self.position][0] in ('string', 'word'):
+            return self.take()
+
+        return self.take('a value')
+
+    def column(self) -> str:
+        """
+        Consume a column, a bare word or a backtick quoted name
+        :return: name of the column
+        :rtype: str
+        """
+        if self.position < len(self.tokens) and self.tokens[self.position][0] in ('column', 'word'):
+            return self.take()
+
+        return self.take('a column')
+
+    def parse(self) -> list:
+        """
+        Parse the whole predicate
+        :return: tree of the predicate
+        :rtype: list
+        """
+        tree: list = self.disjunction()
+
+        if self.position < len(self.tokens):
+            raise ValueError(f"Invalid predicate. Unexpected {self.tokens[self.position][1]!r}")
+
+        return tree
+
+    def disjunction(self) -> list:
+        """
+        Parse conjunctions joined by ``or``
+        :return: tree
+        :rtype: list
+        """
+        terms: list = [self.conjunction()]
+        while self.peek('or'):
+            self.take('or')
+            terms.append(self.conjunction())
+
+        return terms[0] if len(terms) == 1 else ['or', *terms]
+
+    def conjunction(self) -> list:
+        """
+        Parse negations joined by ``and``
+        :return: tree
+        :rtype: list
+        """
+        factors: list = [self.negation()]
+        while self.peek('and'):
+            self.take('and')
+            factors.append(self.negation())
+
+        return factors[0] if len(factors) == 1 else ['and', *factors]
+
+    def negation(self) -> list:
+        """
+        Parse a negated or parenthesized predicate or a comparison
+        :return: tree
+        :rtype: list
+        """
+        if self.peek('not'):
+            self.take('not')
+            return ['not', self.negation()]
+
+        # Group with parentheses
+        if self.peek('('):
+            self.take('(')
+            tree: list = self.disjunction()
+            self.take(')')
+            return tree
+
+        return self.comparison()
+
+    def comparison(self) -> list:
+        """
+        Parse the comparison of a column
+        :return: tree
+        :rtype: list
+        """
+        column: str = self.column()
+
+        if self.peek(*COMPARISONS, '<>'):
+            operator: str = self.take()
+            return ['!=' if operator == '<>' else operator, column, self.value()]
+
+        if self.peek('is'):
+            self.take('is')
+            negated: bool = self.peek('not')
+            if negated:
+                self.take('not')
+            self.take('null')
+            return ['not', ['is_null', column]] if negated else ['is_null', column]
+
+        # NOT BETWEEN, NOT IN and NOT LIKE negate the comparison
+        negated = self.peek('not')
+        if negated:
+            self.take('not')
+
+        if self.peek('between'):
+            self.take('between')
+            low: str = self.value()
+            self.take('and')
+            tree: list = ['between', column, low, self.value()]
+        elif self.peek('in'):
+            self.take('in')
+            self.take('(')
+            values: list[str] = [self.value()]
+            while self.peek(','):
+                self.take(',')
+                values.append(self.value())
+            self.take(')')
+            tree = ['in', column, values]
+        elif self.peek('like'):
+            self.take('like')
+            tree = ['like', column, self.value()]
+        elif self.peek('startswith') and not negated:
+            self.take('startswith')
+            tree = ['startswith', column, self.value()]
+        else:
+            self.take(*COMPARISONS, 'is', 'between', 'in', 'like', 'startswith')
+
+        return ['not', tree] if negated else tree
+
+
+def parse(predicate: t.Union[str, list, None]) -> t.Optional[list]:
+    """
+    Parse a predicate unless it is a tree already
+    :param predicate: predicate or its tree
+    :type predicate: str | list
+    :return: tree, None if there is no predicate
+    :rtype: list
+    """
+    if predicate is None or isinstance(predicate, list):
+        return predicate
+
+    return Parser(predicate).parse() if predicate.strip() else None
+
+
+def condition(tree: list, types: dict[str, str]) -> str:
+    """
+    Compile the tree of a predicate to a condition. The values are quoted
+    literals cast to the type of their column, like the column value pairs,
+    so DuckDB pushes comparisons and ranges into the parquet scan and skips
+    row groups by their min/max statistics.
+    :param tree: tree of the predicate, see :class:`Parser`
+    :type tree: list
+    :param types: types of the columns by name
+    :type types: dict[str, str]
+    :return: condition
+    :rtype: str
+    """
+    if not isinstance(tree, list) or not tree:
+        raise ValueError(f"Invalid predicate. {tree!r} is not a predicate")
+
+    operator, arguments = tree[0], tree[1:]
+
+    if operator in ('and', 'or') and arguments:
+        return '(' + f" {operator.upper()} ".join(condition(argument, types) for argument in arguments) + ')'
+    if operator == 'not' and len(arguments) == 1:
+        return f"(NOT {condition(arguments[0], types)})"
+
+    # Reject columns that don't exist instead of comparing to nothing
+    column: str = str(arguments[0]) if arguments else ''
+    if column not in types:
+        raise ValueError(f"Invalid column. Column {column} does not exist")
+
+    identifier: str = quote_identifier(column)
+
+    def literal(value: t.Any) -> str:
+        return f"CAST({quote_literal(value)} AS {types[column]})"
+
+    if operator in COMPARISONS and len(arguments) == 2:
+        return f"{identifier} {'<>' if operator == '!=' else operator} {literal(arguments[1])}"
+    if operator == 'between' and len(arguments) == 3:
+        return f"{identifier} BETWEEN {literal(arguments[1])} AND {literal(arguments[2])}"
+    if operator == 'in' and len(arguments) == 2 and isinstance(arguments[1], list):
+        return f"{identifier} IN ({', '.join(literal(value) for value in arguments[1])})" if arguments[1] else 'false'
+    if operator == 'is_null' and len(arguments) == 1:
+        return f"{identifier} IS NULL"
+
+    # Match patterns against the text of other types
+    text: str = identifier if types[column] == 'VARCHAR' else f"CAST({identifier} AS VARCHAR)"
+
+    if operator == 'like' and len(arguments) == 2:
+        return f"{text} LIKE {quote_literal(arguments[1])}"
+    if operator == 'startswith' and len(arguments) == 2:
+        prefix: str = str(arguments[1])
+        match: str = f"starts_with({text}, {quote_literal(prefix)})"
+
+        # Bound the range of strings with the prefix, so row groups are skipped
+        if types[column] == 'VARCHAR' and prefix and ord(prefix[-1]) < 0x10FFFF:
+            match = f"({identifier} >= {quote_literal(prefix)} AND " \
+                    f"{identifier} < {quote_literal(prefix[:-1] + chr(ord(prefix[-1]) + 1))} AND {match})"
+
+        return match
+
+    raise ValueError(f"Invalid predicate. {tree!r} is not a predicate")
+
+
+def equalities(tree: t.Optional[list]) -> dict[str, str]:
+    """
+    Get the equalities every match of a predicate fulfills, so partitions,
+    indexes and footers can rule out files like with column value pairs
+    :param tree: tree of the predicate
+    :type tree: list
+    :return: column value pairs
+    :rtype: dict[str, str]
+    """
+    if not tree:
+        return {}
+    if tree[0] == '=' and len(tree) == 3:
+        return {str(tree[1]): str(tree[2])}
+    if tree[0] == 'and':
+        return {column: value for argument in tree[1:] for column, value in equalities(argument).items()}
+
+    return {}
@@ -0,0 +1,279 @@
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import time
+import typing as t
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+if t.TYPE_CHECKING:  # pragma: no cover
+    import duckdb
+
+#: The profiler of the command running in this context, None if profiling is off.
+_current: contextvars.ContextVar[t.Optional["Profiler"]] = contextvars.ContextVar('profiler', default=None)
+
+
+def peak_rss() -> int:
+    """
+    Get the peak resident memory of the process
+    :return: bytes, 0 if unknown
+    :rtype: int
+    """
+    if resource is None:
+        return 0
+
+    # Linux reports kilobytes, macOS bytes
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def rss() -> int:
+    """
+    Get the current resident memory of the process
+    :return: bytes, the peak if the current memory is unknown
+    :rtype: int
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+class Profiler:
+    """
+    Collects the timing and memory of the phases of a command, counters
+    such as the number of files that were read, and the DuckDB profiles of
+    its queries. The report is handed to hooks once the command finished.
+    """
+
+    def __init__(self, command: str, hooks: t.Iterable[t.Callable[[dict], None]] = ()):
+        """
+        Initialize the profiler
+        :param command: name of the profiled command
+        :type command: str
+        :param hooks: functions called with the report
+        :type hooks: Iterable[Callable[[dict], None]]
+        """
+        self.command = command
+        self.hooks = list(hooks)
+        self.phases: list[dict] = []
+        self.counters: dict[str, t.Any] = {}
+        self.queries: list[dict] = []
+
+        # Depth of the running phase, nested phases are part of their parent
+        self._depth: int = 0
+        self._started: float = time.perf_counter()
+        self._cpu: float = time.process_time()
+        self._rss: int = rss()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> t.Iterator[None]:
+        """
+        Measure the wall time, CPU time and memory growth of a phase
+        :param name: name of the phase
+        :type name: str
+        """
+        entry: dict = {'name': name, 'depth': self._depth}
+        self.phases.append(entry)
+
+        self._depth += 1
+        started, cpu, memory = time.perf_counter(), time.process_time(), rss()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            entry.update({
+                'seconds': time.perf_counter() - started,
+                'cpu_seconds': time.process_time() - cpu,
+                'rss_delta': rss() - memory,
+            })
+
+    def count(self, name: str, value: t.Any) -> None:
+        """
+        Record a counter, e.g. the number of files left after pruning
+        :param name: name of the counter
+        :type name: str
+        :param value: value of the counter
+        :type value: Any
+        """
+        self.counters[name] = value
+
+    def query(self, connection: "duckdb.DuckDBPyConnection") -> None:
+        """
+        Record the DuckDB profile of the last query of a connection
+        :param connection: connection with profiling enabled
+        :type connection: duckdb.DuckDBPyConnection
+        """
+        tree: dict = json.loads(connection.get_profiling_information(format='json'))
+
+        # Sum up the scans, the files they read come from their extra info
+        scans: list[dict] = []
+        nodes: list[dict] = list(tree.get('children', []))
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get('children', []))
+            if node.get('operator_type') == 'TABLE_SCAN':
+                scans.append(node)
+
+        self.queries.append({
+            'sql': tree.get('query_name'),
+            'seconds': tree.get('latency'),
+            'rows_scanned': tree.get('cumulative_rows_scanned'),
+            'rows_returned': tree.get('rows_returned'),
+            'bytes_read': tree.get('total_bytes_read'),
+            'buffer_memory': tree.get('system_peak_buffer_memory'),
+            'files_read': sum(int(scan.get('extra_info', {}).get('Total Files Read', 0)) for scan in scans),
+            'filters': [scan['extra_info']['Filters'] for scan in scans if 'Filters' in scan.get('extra_info', {})],
+            'plan': connection.get_profiling_information(format='query_tree'),
+        })
+
+    def report(self) -> dict:
+        """
+        Build the report of the command
+        :return: phases, counters and queries with the totals
+        :rtype: dict
+        """
+        return {
+            'command': self.command,
+            'seconds': time.perf_counter() - self._started,
+            'cpu_seconds': time.process_time() - self._cpu,
+            'rss': rss(),
+            'rss_delta': rss() - self._rss,
+            'peak_rss': peak_rss(),
+            'phases': self.phases,
+            'counters': self.counters,
+            'queries': self.queries,
+        }
+
+
+def current() -> t.Optional[Profiler]:
+    """
+    Get the profiler of the command running in this context
+    :return: profiler, None if profiling is off
+    :rtype: Profiler
+    """
+    return _current.get()
+
+
+@contextlib.contextmanager
+def activate(profiler: Profiler) -> t.Iterator[Profiler]:
+    """
+    Profile everything that runs in this context until the block exits,
+    then hand the report to the hooks of the profiler
+    :param profiler: profiler of the command
+    :type profiler: Profiler
+    :return: the profiler
+    :rtype: Iterator[Profiler]
+    """
+    token = _current.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _current.reset(token)
+
+        report: dict = profiler.report()
+        for hook in profiler.hooks:
+            hook(report)
+
+
+def phase(name: str) -> t.ContextManager[None]:
+    """
+    Measure a phase of the running command, if it is profiled
+    :param name: name of the phase
+    :type name: str
+    :return: context manager of the phase
+    :rtype: ContextManager[None]
+    """
+    profiler: t.Optional[Profiler] = _current.get()
+    return profiler.phase(name) if profiler is not None else contextlib.nullcontext()
+
+
+def count(name: str, value: t.Any) -> None:
+    """
+    Record a counter of the running command, if it is profiled
+    :param name: name of the counter
+    :type name: str
+    :param value: value of the counter
+    :type value: Any
+    """
+    profiler: t.Optional[Profiler] = _current.get()
+    if profiler is not None:
+        profiler.count(name, value)
+
+
+@contextlib.contextmanager
+def explain(connection: "duckdb.DuckDBPyConnection") -> t.Iterator[None]:
+    """
+    Record the ``EXPLAIN ANALYZE`` profile of the last query run on a
+    connection in the block, if the running command is profiled. The
+    profile comes from the query itself, so nothing runs twice.
+    :param connection: connection the query runs on
+    :type connection: duckdb.DuckDBPyConnection
+    """
+    profiler: t.Optional[Profiler] = _current.get()
+    if profiler is None:
+        yield
+        return
+
+    # Collect the profile without printing it
+    connection.execute("SET enable_profiling = 'no_output'")
+    try:
+        yield
+        profiler.query(connection)
+    finally:
+        connection.execute("RESET enable_profiling")
+
+
+def format(report: dict) -> str:
+    """
+    Format a report for humans
+    :param report: report of a profiled command
+    :type report: dict
+    :return: phases, counters and query plans as text
+    :rtype: str
+    """
+    mib = 1024 * 1024
+    lines: list[str] = [
+        f"profile {report['command']}: {report['seconds']:.4f}s wall, {report['cpu_seconds']:.4f}s cpu, "
+        f"rss {report['rss'] / mib:.1f} MiB ({report['rss_delta'] / mib:+.1f}), "
+        f"peak {report['peak_rss'] / mib:.1f} MiB"]
+
+    for entry in report['phases']:
+        lines.append(
+            f"  {'  ' * entry['depth']}{entry['name']:<{24 - 2 * entry['depth']}} "
+            f"{entry.get('seconds', 0):9.4f}s  cpu {entry.get('cpu_seconds', 0):9.4f}s  "
+            f"rss {entry.get('rss_delta', 0) / mib:+8.1f} MiB")
+
+    for name, value in report['counters'].items():
+        lines.append(f"  {name}: {value}")
+
+    for query in report['queries']:
+        lines.append(
+            f"query {query['seconds'] or 0:.4f}s: {query['rows_scanned']} rows scanned, "
+            f"{query['rows_returned']} returned, {query['files_read']} files and "
+            f"{query['bytes_read']} bytes read, buffers {(query['buffer_memory'] or 0) / mib:.1f} MiB")
+        lines.append(query['plan'])
+
+    return '\n'.join(lines)
+
+
+def write(report: dict, target: t.Union[str, bool]) -> None:
+    """
+    Write a report to stderr as text, or to a file as json
+    :param report: report of a profiled command
+    :type report: dict
+    :param target: path of the file, ``-`` or True for stderr
+    :type target: str | bool
+    """
+    if not isinstance(target, str) or target == '-':
+        print(format(report), file=sys.stderr)
+        return
+
+    with open(target, 'w') as file:
+        json.dump(report, file, indent=2)
@@ -0,0 +1,535 @@
+import base64
+import contextlib
+import json
+import re
+import typing as t
+
+import duckdb
+import pyarrow as pa
+
+from . import profile
+from .helpers import arrow_table, quote_identifier, quote_literal, record_batch_reader
+
+#: Prefix of the hidden columns that return the tiebreaker of a page.
+TIEBREAKER = '__pit_tie_'
+
+#: Aggregate functions the aggregate command can compute.
+AGGREGATE_FUNCTIONS = ('count', 'sum', 'min', 'max', 'avg', 'approx_count_distinct')
+
+
+def parquet_source(paths: list[str], hive_partitioning: bool = False, union_by_name: bool = False, filename: bool = False, file_row_number: bool = False) -> str:
+    """
+    Build the table expression that reads one or more parquet files as a
+    single relation
+    :param paths: paths of parquet files or glob patterns
+    :type paths: list[str]
+    :param hive_partitioning: read partition columns from the paths
+    :type hive_partitioning: bool
+    :param union_by_name: merge the schemas of the files by column name,
+                          so files with added or reordered columns can be
+                          read together
+    :type union_by_name: bool
+    :param filename: add a ``filename`` column with the file of every record
+    :type filename: bool
+    :param file_row_number: add a ``file_row_number`` column with the
+                            position of every record in its file
+    :type file_row_number: bool
+    :return: table expression
+    :rtype: str
+    """
+    options: str = ''.join([
+        ', hive_partitioning=true' if hive_partitioning else '',
+        ', union_by_name=true' if union_by_name else '',
+        ', filename=true' if filename else '',
+        ', file_row_number=true' if file_row_number else '',
+    ])
+
+    return f"read_parquet([{', '.join([quote_literal(path) for path in paths])}]{options})"
+
+
+def parquet_files(paths: list[str]) -> str:
+    """
+    Build the table expression that reads the records stored in parquet
+    files, without the partition columns DuckDB would detect in their paths.
+    The schemas of several files are merged by column name.
+    :param paths: paths of parquet files
+    :type paths: list[str]
+    :return: table expression
+    :rtype: str
+    """
+    options: str = ', union_by_name=true' if len(paths) > 1 else ''
+
+    return f"read_parquet([{', '.join([quote_literal(path) for path in paths])}], hive_partitioning=false{options})"
+
+
+#: Parquet compression codecs DuckDB can write.
+COMPRESSIONS = ('uncompressed', 'snappy', 'gzip', 'zstd', 'lz4', 'lz4_raw', 'brotli')
+
+
+def copy_options(write_options: t.Optional[dict] = None) -> str:
+    """
+    Build the options of a ``COPY ... TO`` statement that writes parquet
+    :param write_options: ``compression``, ``compression_level``,
+                          ``row_group_size`` and ``dictionary``, DuckDB's
+                          defaults for the ones that are missing
+    :type write_options: dict
+    :return: options
+    :rtype: str
+    """
+    write_options = write_options or {}
+    options: list[str] = ['FORMAT PARQUET']
+
+    compression: t.Optional[str] = write_options.get('compression')
+
+    # Only zstd has compression levels
+    if compression is None and write_options.get('compression_level') is not None:
+        compression = 'zstd'
+
+    if compression is not None:
+        if compression.lower() not in COMPRESSIONS:
+            raise ValueError(
+                f"Invalid compression. Compression must be one of {', '.join(COMPRESSIONS)}")
+        options.append(f"COMPRESSION {compression.lower()}")
+
+    if write_options.get('compression_level') is not None:
+        options.append(f"COMPRESSION_LEVEL {int(write_options['compression_level'])}")
+
+    if write_options.get('row_group_size') is not None:
+        options.append(f"ROW_GROUP_SIZE {int(write_options['row_group_size'])}")
+
+    # Write plain pages instead of dictionary pages
+    if write_options.get('dictionary') is False:
+        options.append("DICTIONARY_SIZE_LIMIT 0")
+
+    return ', '.join(options)
+
+
+def order_by(columns: t.Optional[list[str]] = None) -> str:
+    """
+    Build the order by clause that sorts records before they are written,
+    so that row groups cover narrow ranges and prune well
+    :param columns: names of the columns to sort by, unsorted if empty
+    :type columns: list[str]
+    :return: order by clause
+    :rtype: str
+    """
+    if not columns:
+        return ''
+
+    return f" ORDER BY {projection(columns)}"
+
+
+def ordering(order_by: list[str], tiebreaker: list[str]) -> str:
+    """
+    Build the order by clause of a page. NULLs sort last and the
+    tiebreaker columns order the records with equal values, so every
+    record has a fixed position a next page can start after.
+    :param order_by: columns to order the records by
+    :type order_by: list[str]
+    :param tiebreaker: columns that are unique together, e.g. the file and
+                       row number of a record
+    :type tiebreaker: list[str]
+    :return: order by clause
+    :rtype: str
+    """
+    return " ORDER BY " + ', '.join([
+        *[f"{quote_identifier(column)} ASC NULLS LAST" for column in order_by],
+        *[quote_identifier(column) for column in tiebreaker]])
+
+
+def tiebreak(tiebreaker: list[str]) -> str:
+    """
+    Build the select list that returns the tiebreaker columns of a page
+    under hidden names, see :data:`TIEBREAKER`
+    :param tiebreaker: columns that are unique together
+    :type tiebreaker: list[str]
+    :return: select list
+    :rtype: str
+    """
+    return ', '.join([
+        f"{quote_identifier(column)} AS {quote_identifier(TIEBREAKER + str(i))}"
+        for i, column in enumerate(tiebreaker)])
+
+
+def visible(rel: duckdb.DuckDBPyRelation) -> duckdb.DuckDBPyRelation:
+    """
+    Drop the hidden tiebreaker columns of a page from a relation, for the
+    outputs that don't return a continuation token
+    :param rel: relation of the records
+    :type rel: duckdb.DuckDBPyRelation
+    :return: relation of the records without the tiebreaker
+    :rtype: duckdb.DuckDBPyRelation
+    """
+    columns: list[str] = [column for column in rel.columns if not column.startswith(TIEBREAKER)]
+    if len(columns) == len(rel.columns):
+        return rel
+
+    return rel.project(projection(columns))
+
+
+def projection(columns: t.Optional[list[str]] = None) -> str:
+    """
+    Build the select list of the requested columns
+    :param columns: names of the columns, all columns if empty
+    :type columns: list[str]
+    :return: select list
+    :rtype: str
+    """
+    if not columns:
+        return '*'
+
+    return ', '.join([quote_identifier(column) for column in columns])
+
+
+def where(column_value_pairs: dict[str, str], types: dict[str, str]) -> str:
+    """
+    Build a condition that matches all column value pairs.
+    The values are quoted literals cast to the type of their column, so
+    DuckDB can push the filters into the parquet scan and skip row groups
+    by their min/max statistics. Binding python parameters instead makes
+    DuckDB import pandas, which the queries otherwise never load since the
+    records are serialized by :func:`json_records` and :func:`stream`.
+    :param column_value_pairs: column value pairs to search for
+    :type column_value_pairs: dict[str, str]
+    :param types: types of the columns by name
+    :type types: dict[str, str]
+    :return: condition
+    :rtype: str
+    """
+    conditions: list[str] = []
+
+    for column, value in column_value_pairs.items():
+        # Reject columns that don't exist instead of comparing to nothing
+        if column not in types:
+            raise ValueError(f"Invalid column. Column {column} does not exist")
+
+        conditions.append(
+            f"{quote_identifier(column)} = CAST({quote_literal(value)} AS {types[column]})")
+
+    # Match everything if there is nothing to search for
+    return ' AND '.join(conditions) or 'true'
+
+
+def paging(limit: t.Optional[int] = None, offset: t.Optional[int] = None, order_by: t.Optional[list[str]] = None, after: t.Optional[list[t.Any]] = None, page_token: t.Optional[str] = None) -> t.Optional[dict]:
+    """
+    Collect the page of records to return from the paging options and a
+    continuation token, the options take precedence over the token
+    :param limit: maximum number of records
+    :type limit: int
+    :param offset: number of records to skip
+    :type offset: int
+    :param order_by: columns to order the records by
+    :type order_by: list[str]
+    :param after: values of the order by columns the page starts after
+    :type after: list[Any]
+    :param page_token: continuation token of the previous page
+    :type page_token: str
+    :return: ``limit``, ``offset``, ``order_by``, ``after`` and the ``tie``
+             of the last record of the previous page, None if all records
+             are returned
+    :rtype: dict
+    """
+    page: dict = {'limit': None, 'offset': 0, 'order_by': None, 'after': None, 'tie': None}
+
+    # Continue where the previous page ended
+    if page_token:
+        try:
+            page.update(json.loads(base64.urlsafe_b64decode(page_token + '=' * (-len(page_token) % 4))))
+        except ValueError:
+            raise ValueError("Invalid page token. Token must be the next token of a previous page")
+
+    # Start after all records with the given values, the tie of a token
+    # only tells apart the records of its own order
+    if after is not None or order_by is not None and order_by != page['order_by']:
+        page['tie'] = None
+
+    page.update({key: value for key, value in [
+        ('limit', limit), ('offset', offset), ('order_by', order_by), ('after', after)] if value is not None})
+
+    # Return everything if no paging is requested
+    if page['limit'] is None and not page['offset'] and page['after'] is None:
+        return None
+
+    # Throw an error if the options don't describe a page
+    if page['limit'] is not None and page['limit'] < 0 or page['offset'] < 0:
+        raise ValueError("Invalid page. Limit and offset can't be negative")
+    if page['after'] is not None and len(page['after']) != len(page['order_by'] or []):
+        raise ValueError("Invalid after. After needs one value per order by column")
+
+    return page
+
+
+def keyset(order_by: list[str], after: list[t.Any], types: dict[str, str]) -> str:
+    """
+    Build the condition that matches the records ordered after some values,
+    so a page starts where the previous one ended without skipping over
+    the records before. NULLs are ordered last, see :func:`ordering`.
+    The first column is also compared on its own, so DuckDB pushes it into
+    the scan and skips the row groups before.
+    :param order_by: columns the records are ordered by, followed by the
+                     tiebreaker columns to start after a single record
+    :type order_by: list[str]
+    :param after: values of the columns the page starts after
+    :type after: list[Any]
+    :param types: types of the columns by name
+    :type types: dict[str, str]
+    :return: condition
+    :rtype: str
+    """
+    columns: list[str] = [quote_identifier(column) for column in order_by]
+    values: list[t.Optional[str]] = [
+        None if value is None else f"CAST({quote_literal(value)} AS {types[column]})"
+        for column, value in zip(order_by, after)]
+
+    # Ordered after a value are the greater values and NULL, nothing is after NULL
+    def greater(column: str, value: t.Optional[str]) -> str:
+        return 'false' if value is None else f"({column} > {value} OR {column} IS NULL)"
+
+    def equal(column: str, value: t.Optional[str]) -> str:
+        return f"{column} IS NULL" if value is None else f"{column} = {value}"
+
+    # Greater in the first column that differs
+    alternatives: list[str] = [
+        '(' + ' AND '.join([
+            *[equal(column, value) for column, value in zip(columns[:i], values[:i])],
+            greater(columns[i], values[i])]) + ')'
+        for i in range(len(order_by))]
+
+    first: str = f"{columns[0]} IS NULL" if values[0] is None else f"({columns[0]} >= {values[0]} OR {columns[0]} IS NULL)"
+
+    return f"{first} AND ({' OR '.join(alternatives)})"
+
+
+def limit_offset(limit: t.Optional[int] = None, offset: t.Optional[int] = None) -> str:
+    """
+    Build the clause that returns a slice of the records
+    :param limit: maximum number of records, all if empty
+    :type limit: int
+    :param offset: number of records to skip
+    :type offset: int
+    :return: limit clause
+    :rtype: str
+    """
+    return (f" LIMIT {int(limit)}" if limit is not None else '') + (f" OFFSET {int(offset)}" if offset else '')
+
+
+def next_token(page: dict, last: t.Optional[dict], count: int, tie: t.Optional[list[t.Any]] = None) -> t.Optional[str]:
+    """
+    Build the continuation token of the page after a page
+    :param page: the returned page, see :func:`paging`
+    :type page: dict
+    :param last: values of the order by columns of the last record, None
+                 if there are no more records
+    :type last: dict
+    :param count: number of records of the page
+    :type count: int
+    :param tie: values of the tiebreaker columns of the last record
+    :type tie: list[Any]
+    :return: token, None if there is no next page
+    :rtype: str
+    """
+    if last is None:
+        return None
+
+    # Continue after the last values, or after the records seen so far
+    if page['order_by']:
+        state: dict = {'limit': page['limit'], 'order_by': page['order_by'],
+                       'after': [last[column] for column in page['order_by']], 'tie': tie}
+    else:
+        state = {'limit': page['limit'], 'offset': page['offset'] + count}
+
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip('=')
+
+
+def aggregates(specs: list[str]) -> list[tuple[str, t.Optional[str]]]:
+    """
+    Parse aggregates such as ``count``, ``count(*)``, ``sum(amount)`` or
+    ``approx_count_distinct(user)``
+    :param specs: aggregates, a function and optionally its column
+    :type specs: list[str]
+    :return: function and column of every aggregate, None counts records
+    :rtype: list[tuple[str, Optional[str]]]
+    """
+    parsed: list[tuple[str, t.Optional[str]]] = []
+
+    for spec in specs:
+        match = re.fullmatch(r'\s*(\w+)\s*(?:\(\s*(.*?)\s*\))?\s*', spec)
+
+        # Throw an error if the function isn't one of the supported ones
+        if match is None or match.group(1).lower() not in AGGREGATE_FUNCTIONS:
+            raise ValueError(
+                f"Invalid aggregate. Aggregate {spec} must be one of {', '.join(AGGREGATE_FUNCTIONS)} of a column")
+
+        function: str = match.group(1).lower()
+        column: t.Optional[str] = None if match.group(2) in (None, '', '*') else match.group(2)
+
+        # Only records can be counted without a column
+        if column is None and function != 'count':
+            raise ValueError(f"Invalid aggregate. Aggregate {spec} needs a column")
+
+        parsed.append((function, column))
+
+    return parsed
+
+
+def aggregate_name(function: str, column: t.Optional[str]) -> str:
+    """
+    Get the name of the result column of an aggregate
+    :param function: aggregate function
+    :type function: str
+    :param column: aggregated column, None for the count of records
+    :type column: str
+    :return: ``count`` or the function applied to the column, e.g. ``sum(amount)``
+    :rtype: str
+    """
+    return function if column is None else f"{function}({column})"
+
+
+def aggregation(parsed: list[tuple[str, t.Optional[str]]], group_by: t.Optional[list[str]], types: dict[str, str]) -> str:
+    """
+    Build the select list of the group by columns and the aggregates
+    :param parsed: function and column of every aggregate, see :func:`aggregates`
+    :type parsed: list[tuple[str, Optional[str]]]
+    :param group_by: columns to group by, one group if empty
+    :type group_by: list[str]
+    :param types: types of the columns by name
+    :type types: dict[str, str]
+    :return: select list
+    :rtype: str
+    """
+    # Reject columns that don't exist instead of aggregating nothing
+    for column in [*(group_by or []), *[column for _, column in parsed if column is not None]]:
+        if column not in types:
+            raise ValueError(f"Invalid column. Column {column} does not exist")
+
+    return ', '.join([
+        *[quote_identifier(column) for column in group_by or []],
+        *[f"{function}({'*' if column is None else quote_identifier(column)}) AS {quote_identifier(aggregate_name(function, column))}"
+          for function, column in parsed]])
+
+
+def tagged(source: str, queries: list[tuple[t.Any, dict[str, str]]], types: dict[str, str], columns: t.Optional[list[str]] = None) -> str:
+    """
+    Build the query that answers several searches with a single scan. The
+    column value pairs of the searches become a table that is joined to the
+    records, so every record is returned once for each search it matches,
+    tagged with the id of the search. DuckDB pushes the bounds of the join
+    into the parquet scan like the filters of a single search. Searches on
+    different columns are joined separately and combined.
+    :param source: table expression of the records
+    :type source: str
+    :param queries: ids and column value pairs of the searches
+    :type queries: list[tuple[Any, dict[str, str]]]
+    :param types: types of the columns by name
+    :type types: dict[str, str]
+    :param columns: columns to return, all columns if empty
+    :type columns: list[str]
+    :return: query with an ``id`` column and a ``record`` struct column
+    :rtype: str
+    """
+    # The whole row or a struct of the requested columns
+    record: str = 'records' if not columns else \
+        '{' + ', '.join([f"{quote_literal(column)}: records.{quote_identifier(column)}" for column in columns]) + '}'
+
+    # Group the searches by the columns they compare
+    groups: dict[tuple[str, ...], list[tuple[t.Any, dict[str, str]]]] = {}
+    for id, column_value_pairs in queries:
+        groups.setdefault(tuple(sorted(column_value_pairs)), []).append((id, column_value_pairs))
+
+    selects: list[str] = []
+    for keys, group in groups.items():
+        # Reject columns that don't exist instead of comparing to nothing
+        for key in keys:
+            if key not in types:
+                raise ValueError(f"Invalid column. Column {key} does not exist")
+
+        # One row of typed values per search, the ids are kept as json
+        rows: str = ', '.join([
+            '(' + ', '.join([
+                quote_literal(json.dumps(id)),
+                *[f"CAST({quote_literal(column_value_pairs[key])} AS {types[key]})" for key in keys]]) + ')'
+            for id, column_value_pairs in group])
+        names: str = ', '.join(['__query', *[quote_identifier(key) for key in keys]])
+        condition: str = ' AND '.join([
+            f"records.{quote_identifier(key)} = tags.{quote_identifier(key)}" for key in keys]) or 'true'
+
+        selects.append(
+            f"SELECT json(tags.__query) AS id, {record} AS record "
+            f"FROM {source} AS records JOIN (VALUES {rows}) AS tags({names}) ON {condition}")
+
+    return ' UNION ALL '.join(selects)
+
+
+
+def json_records(rel: duckdb.DuckDBPyRelation) -> pa.Table:
+    """
+    Serialize the records of a relation to json inside DuckDB and fetch
+    them as Arrow, like :func:`stream` with as_json, so every column type
+    is serialized by DuckDB the same way as in the streamed formats.
+    :param rel: relation of the records
+    :type rel: duckdb.DuckDBPyRelation
+    :return: table of the records serialized to json in a ``record`` column
+    :rtype: pa.Table
+    """
+    return arrow_table(rel.query('records', 'SELECT to_json(records) AS record FROM records'))
+
+
+def stream(
+    context: t.ContextManager[duckdb.DuckDBPyConnection],
+    build: t.Callable[[duckdb.DuckDBPyConnection], duckdb.DuckDBPyRelation],
+    batch_size: int = 10000,
+    as_json: bool = False,
+) -> pa.RecordBatchReader:
+    """
+    Stream a relation as Arrow record batches. Only one batch is held in
+    memory at a time. The connection stays open until the reader is
+    exhausted, closed or discarded.
+    If as_json is set, every batch holds a single ``record`` column with
+    the records serialized to json by DuckDB.
+    :param context: context manager that provides the connection
+    :type context: ContextManager[duckdb.DuckDBPyConnection]
+    :param build: builds the relation on the connection
+    :type build: Callable[[duckdb.DuckDBPyConnection], duckdb.DuckDBPyRelation]
+    :param batch_size: maximum number of rows per batch
+    :type batch_size: int
+    :param as_json: serialize the records to json
+    :type as_json: bool
+    :return: reader of the records
+    :rtype: pa.RecordBatchReader
+    """
+
+    # Keep the connection open for as long as the batches are consumed
+    stack = contextlib.ExitStack()
+    connection = stack.enter_context(context)
+
+    try:
+        # Record the profile of the query once the batches are consumed
+        stack.enter_context(profile.explain(connection))
+
+        with profile.phase('plan'):
+            rel = build(connection)
+
+        # Let DuckDB serialize the records
+        if as_json:
+            rel = rel.query(
+                'records', 'SELECT to_json(records) AS record FROM records')
+
+        # Start streaming the relation in batches
+        batches = record_batch_reader(rel, batch_size)
+    except BaseException:
+        stack.close()
+        raise
+
+    def generate() -> t.Iterator[pa.RecordBatch]:
+        with stack:
+            # Suspend inside the block so that the connection is also
+            # released when the reader is discarded without being read
+            yield
+            yield from batches
+
+    # Prime the generator so that it holds the connection
+    generator = generate()
+    next(generator)
+
+    # Return the reader
+    return pa.RecordBatchReader.from_batches(batches.schema, generator)
@@ -0,0 +1,125 @@
+import math
+import os
+import tempfile
+import typing as t
+
+#: Share of the memory limit of the container DuckDB may use in auto mode,
+#: the rest is left for python and the json conversion.
+AUTO_MEMORY_SHARE = 0.75
+
+#: Limits above this are no limits, cgroup v1 reports unlimited as a huge number.
+UNLIMITED = 1 << 60
+
+
+def _read(path: str) -> t.Optional[str]:
+    """
+    Read a file of the cgroup filesystem
+    :param path: path of the file
+    :type path: str
+    :return: content without surrounding whitespace, None if unreadable
+    :rtype: str
+    """
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpus(root: str = '/sys/fs/cgroup') -> t.Optional[float]:
+    """
+    Get the CPU quota of the container
+    :param root: mount point of the cgroup filesystem
+    :type root: str
+    :return: number of CPUs, None if unlimited
+    :rtype: float
+    """
+    # cgroup v2 holds the quota and the period in one file
+    quota: t.Optional[str] = _read(os.path.join(root, 'cpu.max'))
+    if quota is not None:
+        limit, _, period = quota.partition(' ')
+        return None if limit == 'max' else int(limit) / int(period or 100000)
+
+    # cgroup v1 has -1 as quota if unlimited
+    limit = _read(os.path.join(root, 'cpu', 'cpu.cfs_quota_us'))
+    period = _read(os.path.join(root, 'cpu', 'cpu.cfs_period_us'))
+    if limit is None or period is None or int(limit) <= 0:
+        return None
+
+    return int(limit) / int(period)
+
+
+def cgroup_memory(root: str = '/sys/fs/cgroup') -> t.Optional[int]:
+    """
+    Get the memory limit of the container
+    :param root: mount point of the cgroup filesystem
+    :type root: str
+    :return: bytes, None if unlimited
+    :rtype: int
+    """
+    limit: t.Optional[str] = _read(os.path.join(root, 'memory.max'))
+    if limit is None:
+        limit = _read(os.path.join(root, 'memory', 'memory.limit_in_bytes'))
+
+    if limit is None or limit == 'max' or int(limit) >= UNLIMITED:
+        return None
+
+    return int(limit)
+
+
+def available_cpus() -> int:
+    """
+    Get the number of CPUs the process may run on
+    :return: number of CPUs
+    :rtype: int
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def settings(config: dict) -> dict[str, t.Any]:
+    """
+    Build the DuckDB settings of a connection from the ``THREADS``,
+    ``MEMORY_LIMIT``, ``TEMP_DIRECTORY`` and ``PRESERVE_ORDER`` config.
+    ``auto`` sizes the threads and the memory limit from the cgroup limits
+    of the container and spills to a directory in the temp directory, so
+    queries that exceed the limit are written to disk instead of being
+    killed. Keys that are not set keep the DuckDB defaults.
+    :param config: configuration
+    :type config: dict
+    :return: settings to connect with
+    :rtype: dict[str, Any]
+    """
+    res: dict[str, t.Any] = {}
+    threads = config.get('THREADS')
+    memory_limit = config.get('MEMORY_LIMIT')
+    temp_directory = config.get('TEMP_DIRECTORY')
+
+    # Use no more threads than CPUs of the quota and the affinity
+    if threads == 'auto':
+        cpus: t.Optional[float] = cgroup_cpus()
+        threads = max(1, min(available_cpus(), math.ceil(cpus) if cpus else available_cpus()))
+    if threads:
+        res['threads'] = int(threads)
+
+    # Leave room for the python side of the process
+    if memory_limit == 'auto':
+        memory: t.Optional[int] = cgroup_memory()
+        memory_limit = f"{int(memory * AUTO_MEMORY_SHARE)}B" if memory else None
+        temp_directory = temp_directory or 'auto'
+    if memory_limit:
+        res['memory_limit'] = str(memory_limit)
+
+    # In-memory databases only spill if they have a directory to spill to
+    if temp_directory == 'auto':
+        temp_directory = os.path.join(tempfile.gettempdir(), 'pit-spill')
+    if temp_directory:
+        res['temp_directory'] = temp_directory
+
+    # Not keeping the order lets DuckDB stream large results in parallel
+    if config.get('PRESERVE_ORDER') is not None:
+        res['preserve_insertion_order'] = bool(config['PRESERVE_ORDER'])
+
+    return res
@@ -1,11 +1,11 @@
 import os
 import typing as t
 
+from .cache import ResultCache
 from .cli import cli
 from .config import Config
-from .database import Database
-from .file import File
-from .helpers import get_root_path
+from .helpers import ImportAttribute, get_root_path
+from .pool import ConnectionPool
 
 
 class Scaffold:
@@ -37,8 +37,15 @@ class Scaffold:
     #:
     #: .. versionadded:: 0.11
     config_class = Config
-    file_class = File
-    database_class = Database
+
+    #: The classes that run the commands. They are imported on first access,
+    #: so DuckDB and Arrow are only loaded once a command needs them.
+    file_class = ImportAttribute(f"{__package__}.file:File")
+    database_class = ImportAttribute(f"{__package__}.database:Database")
+    metadata_class = ImportAttribute(f"{__package__}.metadata:MetadataCache")
+    async_file_class = ImportAttribute(f"{__package__}.aio:AsyncFile")
+    pool_class = ConnectionPool
+    cache_class = ResultCache
 
     cli = cli
 
@@ -0,0 +1,112 @@
+import http.server
+import io
+import json
+import os
+import socketserver
+import typing as t
+from urllib.parse import urlsplit
+
+from . import output
+
+#: Address the server binds to if none is configured.
+DEFAULT_ADDRESS = "http://127.0.0.1:8700"
+
+
+class CommandHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Runs the commands posted to ``/commands`` on the warm application of the
+    server and streams back the output the CLI would print.
+    """
+
+    def do_POST(self) -> None:
+        if self.path != '/commands':
+            self.send_error(404)
+            return
+
+        # Read the command and its arguments
+        request: dict = json.loads(
+            self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        kwargs: dict = request.get('kwargs', {})
+
+        # The client writes the output files itself
+        kwargs.pop('output', None)
+        format: str = kwargs.get('format') or 'json'
+
+        try:
+            res = self.server.app.commands(cmd=request['cmd'], **kwargs)
+        except Exception as error:
+            self.reply_error(error)
+            return
+
+        self.send_response(200)
+        self.send_header(
+            'Content-Type', 'application/octet-stream' if format in output.binary_formats else 'application/json')
+        self.end_headers()
+
+        # Stream the output the same way the CLI writes it to stdout
+        stream = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+        try:
+            output.write(res, format, stream)
+        finally:
+            stream.detach()
+
+    def reply_error(self, error: Exception) -> None:
+        """
+        Reply with the error of a failed command
+        :param error: error raised by the command
+        :type error: Exception
+        """
+        body: bytes = json.dumps(
+            {'error': f"{type(error).__name__}: {error}"}).encode()
+
+        self.send_response(400 if isinstance(error, (ValueError, KeyError)) else 500)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Unix domain sockets don't have a client address
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        if self.server.app.config.get("DEBUG"):
+            super().log_message(format, *args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves HTTP over a unix domain socket, one thread per request.
+    """
+    daemon_threads = True
+
+
+def make_server(app: t.Any, address: t.Optional[str] = None) -> socketserver.BaseServer:
+    """
+    Create a server that handles concurrent requests on its own threads,
+    each one with its own pooled connection
+    :param app: application that runs the commands
+    :type app: Pit
+    :param address: ``http://host:port`` or ``unix:///path/to/socket``
+    :type address: str
+    :return: server
+    :rtype: socketserver.BaseServer
+    """
+    url = urlsplit(address or DEFAULT_ADDRESS)
+
+    if url.scheme == 'unix':
+        # Replace the socket of a server that didn't shut down cleanly
+        if os.path.exists(url.path):
+            os.remove(url.path)
+
+        server = ThreadingUnixHTTPServer(url.path, CommandHandler)
+    elif url.scheme == 'http':
+        server = http.server.ThreadingHTTPServer(
+            (url.hostname or '127.0.0.1', url.port or 8700), CommandHandler)
+    else:
+        raise ValueError(
+            "Invalid server address. Address must start with http:// or unix://")
+
+    server.app = app
+
+    return server